@@ -1,6 +1,7 @@
 from app import create_app
 
-app = create_app()
-
 if __name__ == '__main__':
+    app = create_app(debug=True)
     app.run(debug=True)
+else:
+    app = create_app()
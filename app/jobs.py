@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import uuid
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+from config import PIPELINE_WORKERS
+from app.pipeline import expand_stages, run_pipeline, failed_stages
+
+
+# Les tâches d'un job sont les étapes du pipeline (ou leurs groupes, ex. "clean_data") :
+# elles sont exécutées par le DAG de app/pipeline.py, en parallèle quand c'est possible.
+
+# Préfixe des tâches d'entraînement : le nom du modèle suit ("train_lstm" → "lstm")
+TRAINING_TASK_PREFIX = "train_"
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Verrous partagés par les processus qui servent l'application (reloader, workers gunicorn)
+STARTUP_LOCK = "startup.lock"    # Tenu à vie par le processus qui lance le job de démarrage
+PIPELINE_LOCK = "pipeline.lock"  # Un seul job exécute le pipeline à la fois, tous processus confondus
+
+
+class JobError(Exception):
+    """Job refusé : tâche inconnue, file pleine ou tâche déjà en cours."""
+
+
+class FileLock:
+    """Verrou exclusif entre processus (flock) sur un fichier ; sans fcntl, toujours accordé."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        self._file = open(self.path, "a")
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()  # Fermer le fichier libère le verrou
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _ThreadRoutedStdout:
+    """
+    Remplace sys.stdout : ce qu'écrit un thread qui exécute un job est copié dans
+    le journal de ce job, en plus de la sortie d'origine.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def set_log(self, log_file):
+        self._local.log = log_file
+
+    def get_log(self):
+        return getattr(self._local, "log", None)
+
+    def write(self, text):
+        log = getattr(self._local, "log", None)
+        if log is not None:
+            log.write(text)
+            log.flush()
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class JobRunner:
+    """
+    Exécute les tâches longues (nettoyage, augmentation, entraînement) dans un pool
+    de threads borné, hors du démarrage de l'application.
+
+    L'état de chaque job est persisté en JSON dans `jobs_dir` (avec son journal),
+    de sorte qu'il reste consultable après un redémarrage ; les jobs interrompus par
+    un arrêt du serveur (processus propriétaire terminé) sont marqués "interrupted".
+    Plusieurs processus peuvent partager `jobs_dir` : leurs jobs exécutent le
+    pipeline l'un après l'autre (verrou PIPELINE_LOCK).
+    """
+
+    def __init__(self, jobs_dir, max_workers=1, max_pending=10):
+        self.jobs_dir = jobs_dir
+        self.max_pending = max_pending
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._startup_lock = None
+        self._jobs = self._load_jobs()
+
+        if not isinstance(sys.stdout, _ThreadRoutedStdout):
+            sys.stdout = _ThreadRoutedStdout(sys.stdout)
+        self._stdout = sys.stdout
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def log_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.log")
+
+    def _load_jobs(self):
+        jobs = {}
+        for file_name in sorted(os.listdir(self.jobs_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, file_name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            # Un job actif d'un autre processus encore vivant (worker, reloader) n'est pas interrompu
+            if job.get("status") in ACTIVE_STATUSES and not _pid_alive(job.get("pid")):
+                job["status"] = "interrupted"
+                job["finished_at"] = job.get("finished_at") or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                self._save(job)
+            jobs[job["id"]] = job
+        return jobs
+
+    def _save(self, job):
+        path = self._job_path(job["id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _update(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+            self._save(job)
+
+    def claim_startup(self):
+        """
+        Vrai pour un seul des processus qui partagent `jobs_dir` : celui-là lance le job
+        de démarrage. Le verrou est gardé jusqu'à la fin du processus.
+        """
+        lock = FileLock(os.path.join(self.jobs_dir, STARTUP_LOCK))
+        if not lock.acquire(blocking=False):
+            return False
+        self._startup_lock = lock
+        return True
+
+    def add_listener(self, callback):
+        """Enregistre `callback(job)`, appelé à la fin de chaque job réussi."""
+        self._listeners.append(callback)
+
+    def submit(self, tasks, force=False):
+        """
+        Met en file un job qui exécute les étapes `tasks` du pipeline dans l'ordre du DAG.
+        Les étapes à jour sont ignorées, sauf si `force` est vrai.
+
+        Raises:
+            JobError: Tâche inconnue, file d'attente pleine ou tâche déjà en cours.
+        """
+        if not tasks:
+            raise JobError("Aucune tâche demandée.")
+        try:
+            tasks = expand_stages(tasks)
+        except KeyError as e:
+            raise JobError(f"Tâches inconnues : {e.args[0]}")
+
+        with self._lock:
+            active = [job for job in self._jobs.values() if job["status"] in ACTIVE_STATUSES]
+            if len(active) >= self.max_pending:
+                raise JobError(f"File d'attente pleine ({self.max_pending} jobs en attente ou en cours).")
+            busy = sorted({task for job in active for task in job["tasks"]} & set(tasks))
+            if busy:
+                raise JobError(f"Tâches déjà en attente ou en cours : {busy}")
+
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "tasks": list(tasks),
+                "force": bool(force),
+                "status": "queued",
+                "pid": os.getpid(),
+                "running_tasks": [],
+                "completed_tasks": [],
+                "stages": [],
+                "progress": 0.0,
+                "error": None,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "started_at": None,
+                "finished_at": None,
+                "duration_seconds": None,
+            }
+            self._jobs[job["id"]] = job
+            self._save(job)
+
+        self._executor.submit(self._run, job)
+        return dict(job)
+
+    def _run(self, job):
+        with FileLock(os.path.join(self.jobs_dir, PIPELINE_LOCK)):
+            self._run_locked(job)
+
+    def _run_locked(self, job):
+        start = time.perf_counter()
+        self._update(job, status="running", running_tasks=list(job["tasks"]),
+                     started_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+
+        def stage_ended(row):
+            with self._lock:
+                job["stages"] = job["stages"] + [row]
+                job["running_tasks"] = [task for task in job["running_tasks"] if task != row["stage"]]
+                if row["status"] in ("succeeded", "cached"):
+                    job["completed_tasks"] = job["completed_tasks"] + [row["stage"]]
+                job["progress"] = round(len(job["stages"]) / len(job["tasks"]), 4)
+                self._save(job)
+
+        with open(self.log_path(job["id"]), "a", encoding="utf-8") as log:
+            self._stdout.set_log(log)
+            try:
+                print(f"▶️ [{job['id']}] {', '.join(job['tasks'])}")
+                rows = run_pipeline(job["tasks"], force=job.get("force", False), workers=PIPELINE_WORKERS,
+                                    on_stage_end=stage_ended)
+                failed = failed_stages(rows)
+                status, error = ("failed", f"Étapes en échec : {', '.join(failed)}") if failed else ("succeeded", None)
+            except BaseException as e:
+                traceback.print_exc(file=log)
+                status, error = "failed", f"{type(e).__name__}: {e}"
+            if error:
+                print(f"❌ [{job['id']}] {error}")
+            self._stdout.set_log(None)
+
+        self._update(job, status=status, error=error, running_tasks=[],
+                     finished_at=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                     duration_seconds=round(time.perf_counter() - start, 3))
+
+        if status == "succeeded":
+            for callback in self._listeners:
+                try:
+                    callback(dict(job))
+                except Exception as e:
+                    print(f"⚠️ Erreur après le job {job['id']} : {e}")
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def read_log(self, job_id, offset=0):
+        """Retourne (texte, nouvel offset) du journal à partir de `offset` octets."""
+        try:
+            with open(self.log_path(job_id), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return "", offset
+        return data.decode("utf-8", errors="replace"), offset + len(data)
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait)
+
+
+def trained_models(job):
+    """
+    Noms des modèles réellement réentraînés par un job ("train_lstm" → "lstm") :
+    une étape d'entraînement ignorée car à jour ne compte pas.
+    """
+    return [row["stage"][len(TRAINING_TASK_PREFIX):] for row in job.get("stages", [])
+            if row["stage"].startswith(TRAINING_TASK_PREFIX) and row["status"] == "succeeded"]
@@ -1,10 +1,11 @@
 import os
-import pickle
 import sys
 import numpy as np
 import warnings
 import json
 import random
+from app.models.bundle import load_bundle, BundleError
+from app.models.text_normalizer import normalizer_for
 
 # Ignorer les avertissements pour garder la console propre
 warnings.filterwarnings("ignore")
@@ -40,6 +41,7 @@ class Chatbot:
         self.model = None
         self.vectorizer = None
         self.label_encoder = None
+        self.normalize = None
         self.training_data = None
 
         self._load_resources()
@@ -47,32 +49,33 @@ class Chatbot:
     def _load_resources(self):
         """Charge le modèle, le vectorizer, le LabelEncoder et le dataset."""
         print("🤖 Initialisation du Chatbot...")
-        # Le nom du modèle à charger est maintenant "logistic_regression"
         model_path_dir = os.path.join(MODEL_DIR, self.model_name)
 
         if not os.path.exists(model_path_dir):
             raise FileNotFoundError(f"Dossier du modèle introuvable : {model_path_dir}")
 
         try:
-            # Chargement du LabelEncoder
-            with open(os.path.join(model_path_dir, "label_encoder.pkl"), "rb") as f:
-                self.label_encoder = pickle.load(f)
-
-            # Chargement du TF-IDF vectorizer
-            with open(os.path.join(model_path_dir, "tfidf_vectorizer.pkl"), "rb") as f:
-                self.vectorizer = pickle.load(f)
-
-            # Chargement du modèle
-            model_file = f"{self.model_name}.pkl"
-            with open(os.path.join(model_path_dir, model_file), "rb") as f:
-                self.model = pickle.load(f)
-
-            # Chargement du dataset de formation
+            # Chargement du bundle du modèle : chaque composant est vérifié puis
+            # désérialisé à la demande, ses tableaux mappés en mémoire.
+            bundle = load_bundle(self.model_name, model_dir=MODEL_DIR)
+            self.label_encoder = bundle.get("label_encoder")
+            # Les messages sont normalisés comme les textes d'entraînement du modèle
+            self.normalize = normalizer_for(bundle.metadata)
+
+            if self.model_name == "lstm":
+                # Le LSTM embarque son propre tokenizer et un graphe TFLite quantifié
+                from app.models.lstm_runtime import LstmClassifier
+                self.model = LstmClassifier.from_bundle(bundle)
+            else:
+                self.vectorizer = bundle.get("vectorizer")
+                self.model = bundle.get("model")
+
+            # Chargement du dataset de formation, sans les doublons marqués par la déduplication
             with open(TRAINING_DATA_PATH, 'r', encoding='utf-8') as f:
-                self.training_data = json.load(f)
+                self.training_data = [conv for conv in json.load(f) if not conv.get('duplicate_of')]
 
             print("✅ Ressources chargées avec succès.")
-        except FileNotFoundError as e:
+        except (FileNotFoundError, BundleError) as e:
             print(f"❌ Erreur lors du chargement des ressources : {e}")
             sys.exit(1)
         except Exception as e:
@@ -89,25 +92,33 @@ class Chatbot:
         Returns:
             str: Le statut (l'intention) prédit.
         """
+        if self.normalize is not None:
+            user_message = self.normalize(user_message)
         if self.model and self.vectorizer:
             user_message_vectorized = self.vectorizer.transform([user_message])
             pred_label_index = self.model.predict(user_message_vectorized)
             return self.label_encoder.inverse_transform(pred_label_index)[0]
+        elif self.model and self.model_name == "lstm":
+            pred_label_index = self.model.predict([user_message])
+            return self.label_encoder.inverse_transform(pred_label_index)[0]
         else:
             return "unknown"
 
-    def get_response(self, user_message):
+    def get_response(self, user_message, context=None):
         """
         Génère une réponse basée sur l'intention du message utilisateur.
 
         Args:
             user_message (str): Le message du client.
+            context (list, optional): Messages précédents du client. Les modèles sont
+                entraînés sur des conversations entières : l'intention est classée
+                sur ces messages suivis du message courant.
 
         Returns:
             str: Une réponse générée ou un message d'erreur.
         """
         # 1. Classifier l'intention du client
-        intent = self.classify_intent(user_message)
+        intent = self.classify_intent(" ".join(list(context or []) + [user_message]))
         print(f"Prédiction de l'intention du client : '{intent}'")
 
         if intent == "unknown":
@@ -134,8 +145,9 @@ class Chatbot:
 
 
 if __name__ == "__main__":
+    # Usage (depuis la racine du projet) : python -m app.models.ChatBot.chatbot '<message_du_client>'
     if len(sys.argv) < 2:
-        print("Usage: python chatbot.py '<message_du_client>'")
+        print("Usage: python -m app.models.ChatBot.chatbot '<message_du_client>'")
         sys.exit(1)
 
     client_message = sys.argv[1]
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import platform
+import numpy as np
+
+# Dossier par défaut des modèles, indépendant du répertoire d'exécution
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "saved")
+
+# Version du format de bundle, incrémentée à chaque changement incompatible du manifeste
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+BUNDLES_DIR = "bundles"
+
+# Nombre de versions conservées par modèle (les plus anciennes sont supprimées)
+KEEP_VERSIONS = 3
+
+# Fichiers des anciens modèles « pickles séparés », lus en repli s'il n'y a pas de bundle
+LEGACY_COMPONENTS = {
+    "label_encoder": "label_encoder.pkl",
+    "vectorizer": "tfidf_vectorizer.pkl",
+}
+
+
+class BundleError(Exception):
+    """Bundle absent, incomplet ou corrompu."""
+
+
+def file_sha256(path):
+    """Empreinte SHA-256 du contenu d'un fichier (None s'il n'existe pas)."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_file(path, data):
+    """Écrit et synchronise un fichier sur disque, retourne (taille, sha256)."""
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def _atomic_write_text(path, text):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_metrics(path, metrics):
+    """Écrit le fichier de métriques d'un entraînement atomiquement, comme le manifeste du bundle."""
+    _atomic_write_text(path, json.dumps(metrics, indent=4))
+
+
+def _runtime_info():
+    info = {"python": platform.python_version(), "numpy": np.__version__}
+    try:
+        import sklearn
+        info["scikit-learn"] = sklearn.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def save_bundle(model_name, objects, files=None, metadata=None, metrics=None, model_dir=DEFAULT_MODEL_DIR,
+                keep=KEEP_VERSIONS):
+    """
+    Sauvegarde un modèle entraîné sous forme de bundle versionné.
+
+    Chaque objet est picklé (protocole 5) avec ses tableaux numpy extraits hors-bande
+    dans des fichiers bruts, qui pourront être mappés en mémoire au chargement. Le
+    bundle est écrit dans un dossier temporaire puis renommé, et le pointeur CURRENT
+    n'est mis à jour qu'une fois le bundle complet : un lecteur ne voit jamais un
+    modèle à moitié écrit.
+
+    Args:
+        model_name (str): Nom du modèle ("logistic_regression", ...).
+        objects (dict): Composants à pickler (ex. {"model": ..., "vectorizer": ...}).
+        files (dict, optional): Fichiers bruts à embarquer, nom → bytes.
+        metadata (dict, optional): Métadonnées d'entraînement.
+        metrics (dict, optional): Métriques d'évaluation.
+
+    Returns:
+        str: Chemin du dossier du bundle.
+    """
+    bundles_root = os.path.join(model_dir, model_name, BUNDLES_DIR)
+    os.makedirs(bundles_root, exist_ok=True)
+
+    now = time.time_ns()
+    version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now // 10**9)) + f".{now % 10**9 // 1000:06d}Z"
+    tmp_dir = os.path.join(bundles_root, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model_name": model_name,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "runtime": _runtime_info(),
+        "metadata": metadata or {},
+        "metrics": metrics or {},
+        "components": {},
+        "files": {},
+    }
+
+    try:
+        for name, obj in objects.items():
+            buffers = []
+            data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+            size, sha = _write_file(os.path.join(tmp_dir, f"{name}.pkl"), data)
+            entry = {"file": f"{name}.pkl", "size": size, "sha256": sha, "buffers": []}
+            for i, buffer in enumerate(buffers):
+                raw = buffer.raw()
+                file_name = f"{name}.{i}.buf"
+                size, sha = _write_file(os.path.join(tmp_dir, file_name), raw)
+                entry["buffers"].append({"file": file_name, "size": size, "sha256": sha})
+            manifest["components"][name] = entry
+
+        for file_name, data in (files or {}).items():
+            size, sha = _write_file(os.path.join(tmp_dir, file_name), data)
+            manifest["files"][file_name] = {"size": size, "sha256": sha}
+
+        _atomic_write_text(os.path.join(tmp_dir, MANIFEST_FILE),
+                           json.dumps(manifest, indent=4, ensure_ascii=False, default=str))
+
+        bundle_dir = os.path.join(bundles_root, version)
+        os.rename(tmp_dir, bundle_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _atomic_write_text(os.path.join(model_dir, model_name, CURRENT_FILE), version)
+    _prune_versions(bundles_root, keep)
+    return bundle_dir
+
+
+def _prune_versions(bundles_root, keep):
+    versions = sorted(v for v in os.listdir(bundles_root) if not v.startswith("."))
+    for version in versions[:-keep] if keep else []:
+        shutil.rmtree(os.path.join(bundles_root, version), ignore_errors=True)
+
+
+class ModelBundle:
+    """
+    Bundle chargé paresseusement : le manifeste est lu à l'ouverture, chaque
+    composant n'est désérialisé qu'au premier accès et ses tableaux sont mappés
+    en mémoire depuis le disque plutôt que copiés.
+    """
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        self.verify = verify
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise BundleError(f"Manifeste illisible : {manifest_path} ({e})")
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise BundleError(f"Version de format non supportée : {self.manifest.get('format_version')}")
+        self._cache = {}
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    @property
+    def metadata(self):
+        return self.manifest.get("metadata", {})
+
+    @property
+    def metrics(self):
+        return self.manifest.get("metrics", {})
+
+    def __contains__(self, name):
+        return name in self.manifest["components"]
+
+    def _check(self, file_name, entry):
+        if self.verify and file_sha256(os.path.join(self.path, file_name)) != entry["sha256"]:
+            raise BundleError(f"Somme de contrôle invalide pour {file_name} ({self.path})")
+
+    def get(self, name):
+        """Retourne le composant `name`, désérialisé au premier appel."""
+        if name in self._cache:
+            return self._cache[name]
+        entry = self.manifest["components"].get(name)
+        if entry is None:
+            raise BundleError(f"Composant '{name}' absent du bundle {self.path}")
+
+        self._check(entry["file"], entry)
+        buffers = []
+        for buffer_entry in entry["buffers"]:
+            self._check(buffer_entry["file"], buffer_entry)
+            buffer_path = os.path.join(self.path, buffer_entry["file"])
+            # np.memmap refuse les fichiers vides
+            buffers.append(np.memmap(buffer_path, dtype=np.uint8, mode="r") if buffer_entry["size"] else b"")
+        with open(os.path.join(self.path, entry["file"]), "rb") as f:
+            obj = pickle.loads(f.read(), buffers=buffers)
+        self._cache[name] = obj
+        return obj
+
+    def file_path(self, file_name):
+        """Chemin d'un fichier brut embarqué dans le bundle (vérifié si demandé)."""
+        entry = self.manifest["files"].get(file_name)
+        if entry is None:
+            raise BundleError(f"Fichier '{file_name}' absent du bundle {self.path}")
+        self._check(file_name, entry)
+        return os.path.join(self.path, file_name)
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path))
+
+
+class LegacyBundle:
+    """Expose les anciens pickles séparés d'un modèle avec la même interface que ModelBundle."""
+
+    version = "legacy"
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self.metadata = {}
+        self.components = dict(LEGACY_COMPONENTS, model=f"{model_name}.pkl")
+        metrics_path = os.path.join(path, f"metrics_{model_name}.json")
+        try:
+            with open(metrics_path, "r", encoding="utf-8") as f:
+                self.metrics = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.metrics = {}
+        self._cache = {}
+
+    def __contains__(self, name):
+        file_name = self.components.get(name)
+        return file_name is not None and os.path.exists(os.path.join(self.path, file_name))
+
+    def get(self, name):
+        if name not in self._cache:
+            if name not in self:
+                raise BundleError(f"Composant '{name}' absent de {self.path}")
+            with open(os.path.join(self.path, self.components[name]), "rb") as f:
+                self._cache[name] = pickle.load(f)
+        return self._cache[name]
+
+    def file_path(self, file_name):
+        path = os.path.join(self.path, file_name)
+        if not os.path.exists(path):
+            raise BundleError(f"Fichier '{file_name}' absent de {self.path}")
+        return path
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path)
+                   if os.path.isfile(os.path.join(self.path, f)))
+
+
+def current_version(model_name, model_dir=DEFAULT_MODEL_DIR):
+    """Version pointée par CURRENT, ou None si le modèle n'a pas de bundle."""
+    try:
+        with open(os.path.join(model_dir, model_name, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_bundle(model_name, model_dir=DEFAULT_MODEL_DIR, verify=True):
+    """
+    Ouvre le bundle courant d'un modèle.
+
+    Si le modèle n'a encore jamais été sauvegardé au format bundle, les anciens
+    pickles séparés sont lus à la place.
+
+    Raises:
+        FileNotFoundError: Aucun modèle trouvé sous ce nom.
+        BundleError: Bundle présent mais illisible.
+    """
+    model_path_dir = os.path.join(model_dir, model_name)
+    if not os.path.exists(model_path_dir):
+        raise FileNotFoundError(f"Dossier du modèle introuvable : {model_path_dir}")
+
+    version = current_version(model_name, model_dir)
+    if version is None:
+        return LegacyBundle(model_path_dir, model_name)
+    return ModelBundle(os.path.join(model_path_dir, BUNDLES_DIR, version), verify=verify)
+
+
+def migrate_legacy(model_name, model_dir=DEFAULT_MODEL_DIR):
+    """Convertit les anciens pickles séparés d'un modèle en bundle versionné."""
+    legacy = LegacyBundle(os.path.join(model_dir, model_name), model_name)
+    objects = {name: legacy.get(name) for name in legacy.components if name in legacy}
+    return save_bundle(model_name, objects, metadata={"migrated_from": "legacy_pickles"},
+                       metrics=legacy.metrics, model_dir=model_dir)
+
+
+if __name__ == "__main__":
+    # Usage : python -m app.models.bundle migrate <model_name> [...]
+    if len(sys.argv) < 3 or sys.argv[1] != "migrate":
+        print("Usage: python -m app.models.bundle migrate <model_name> [<model_name> ...]")
+        sys.exit(1)
+    for name in sys.argv[2:]:
+        print(f"📦 Bundle créé : {migrate_legacy(name)}")
@@ -1,41 +1,204 @@
 import os
+import gc
+import json
+import time
+import argparse
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
+from app.models.profiling import current_rss_mb, peak_rss_mb
 
 MODEL_DIR = os.path.join("app", "models", "saved")
+LEADERBOARD_PATH = os.path.join(MODEL_DIR, "leaderboard.json")
 
+MODEL_NAMES = ["random_forest", "naive_bayes", "logistic_regression", "lstm"]
+
+
+def available_models(model_dir=MODEL_DIR):
+    """Modèles présents dans le dossier des modèles sauvegardés."""
+    if not os.path.isdir(model_dir):
+        return []
+    return [name for name in MODEL_NAMES if os.path.isdir(os.path.join(model_dir, name))]
+
+
+def load_holdout():
+    """
+    Rejoue l'ensemble de test utilisé à l'entraînement (même découpage 80/20,
+    random_state=42), pour que tous les modèles soient évalués sur les mêmes messages.
+
+    Returns:
+        tuple: (textes, labels, empreinte des données) ; le découpage ne redonne le
+        même ensemble de test qu'aux modèles entraînés avec la même empreinte.
+    """
+    from app.models.utils import load_labels, split_mask, iter_texts, data_fingerprint
+
+    labels = load_labels()
+    if not labels:
+        return None, None, None
+    test_mask = split_mask(len(labels), test_size=0.2, random_state=42)
+    texts = list(iter_texts(test_mask))
+    y_true = [label for label, is_test in zip(labels, test_mask) if is_test]
+    return texts, y_true, data_fingerprint()
+
+
+def holdout_status(model_name, fingerprint, model_dir=MODEL_DIR):
+    """
+    "ok" si le modèle a été entraîné sur les données actuelles (ensemble de test jamais vu),
+    "stale" s'il l'a été sur d'autres données (ses lignes d'entraînement peuvent être dans
+    l'ensemble de test), "unknown" pour un ancien modèle sans empreinte enregistrée.
+    """
+    from app.models.bundle import load_bundle
+
+    trained_on = load_bundle(model_name, model_dir=model_dir, verify=False).metadata.get("data_sha256")
+    if trained_on is None:
+        return "unknown"
+    return "ok" if trained_on == fingerprint else "stale"
+
+
+def benchmark_model(model_name, texts, y_true, model_dir=MODEL_DIR, latency_samples=200, batch_repeats=5):
+    """
+    Mesure un modèle : qualité, latence unitaire, débit par lot, chargement et mémoire.
+
+    Exécutée dans un processus dédié pour que les mesures de mémoire d'un modèle
+    ne soient pas faussées par ceux chargés avant lui.
+    """
+    from sklearn.metrics import accuracy_score, f1_score
+    from app.models.predict import load_predictor
+
+    gc.collect()
+    rss_before = current_rss_mb()
+
+    start = time.perf_counter()
+    predictor = load_predictor(model_name, model_dir=model_dir)
+    # Forcer une première prédiction : certains composants se chargent à la demande
+    predictor.predict(texts[:1])
+    load_time = time.perf_counter() - start
+    rss_loaded = current_rss_mb()
+
+    # Qualité sur l'ensemble de test
+    y_pred = predictor.predict(texts)
+    accuracy = accuracy_score(y_true, y_pred)
+    f1 = f1_score(y_true, y_pred, average="weighted", zero_division=0)
+
+    # Latence d'un message isolé (cas du chatbot)
+    latencies = []
+    for text in texts[:latency_samples]:
+        start = time.perf_counter()
+        predictor.predict([text])
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.asarray(latencies) * 1000
+
+    # Débit en traitement par lot
+    start = time.perf_counter()
+    for _ in range(batch_repeats):
+        predictor.predict(texts)
+    batch_time = time.perf_counter() - start
+
+    return {
+        "model": model_name,
+        "version": predictor.bundle.version,
+        "accuracy": round(float(accuracy), 4),
+        "f1_weighted": round(float(f1), 4),
+        "latency_p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "throughput_msgs_per_s": round(len(texts) * batch_repeats / batch_time, 1),
+        "load_time_s": round(load_time, 4),
+        "artifact_size_mb": round(predictor.bundle.size_bytes() / (1024 * 1024), 3),
+        "rss_model_mb": round(rss_loaded - rss_before, 1) if rss_before is not None else None,
+        "rss_peak_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_benchmark(texts, y_true, model_names=None, model_dir=MODEL_DIR, latency_samples=200, batch_repeats=5,
+                  fingerprint=None, include_stale=False):
+    """
+    Mesure chaque modèle dans un processus isolé et retourne la liste des résultats.
+
+    Les modèles entraînés sur d'autres données que l'ensemble de test actuel (voir
+    holdout_status) sont écartés, sauf avec `include_stale` : ils sont alors mesurés
+    et marqués dans le champ "holdout" de leur résultat.
+    """
+    from app.models.bundle import BundleError
 
-def read_report(file_path):
-    """Lit un rapport .txt et retourne les métriques sous forme de dict"""
-    metrics = {}
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("Accuracy"):
-                    metrics["Accuracy"] = float(line.split(":")[1].strip())
-                elif line.startswith("Precision"):
-                    metrics["Precision"] = float(line.split(":")[1].strip())
-                elif line.startswith("Recall"):
-                    metrics["Recall"] = float(line.split(":")[1].strip())
-                elif line.startswith("F1-score"):
-                    metrics["F1-score"] = float(line.split(":")[1].strip())
-    except FileNotFoundError:
-        return None
-    return metrics
-
-
-def main():
-    model_names = ["random_forest", "naive_bayes", "logistic_regression", "lstm"]
     results = []
+    context = multiprocessing.get_context("spawn")
+    for model_name in model_names or available_models(model_dir):
+        # Un modèle illisible (CURRENT absent, métadonnées corrompues) est écarté comme un benchmark en échec
+        try:
+            status = holdout_status(model_name, fingerprint, model_dir) if fingerprint else "unknown"
+        except (BundleError, OSError) as e:
+            print(f"⚠️ {model_name} écarté (bundle illisible) : {e}")
+            continue
+        if status != "ok":
+            reason = "entraîné sur d'autres données" if status == "stale" else "données d'entraînement inconnues"
+            if not include_stale:
+                print(f"⚠️ {model_name} écarté ({reason}) : réentraînez-le ou utilisez --include-stale.")
+                continue
+            print(f"⚠️ {model_name} : {reason}, ses scores peuvent être surestimés.")
+        print(f"⏱️ Benchmark de {model_name}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            future = executor.submit(benchmark_model, model_name, texts, y_true, model_dir,
+                                     latency_samples, batch_repeats)
+            try:
+                results.append({**future.result(), "holdout": status})
+            except Exception as e:
+                print(f"⚠️ Benchmark impossible pour {model_name} : {e}")
+    return results
+
+
+def write_leaderboard(results, n_holdout, output_path=LEADERBOARD_PATH, fingerprint=None):
+    """
+    Écrit le classement (trié par F1 puis latence) dans un JSON stable,
+    pensé pour être comparé avec `git diff` entre deux versions.
+    """
+    ranked = sorted(results, key=lambda r: (-r["f1_weighted"], r["latency_p50_ms"]))
+    for rank, result in enumerate(ranked, start=1):
+        result["rank"] = rank
+    leaderboard = {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "cpu_count": os.cpu_count()},
+        "holdout_size": n_holdout,
+        "data_sha256": fingerprint,
+        "models": ranked,
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(leaderboard, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return ranked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark et classement des modèles sauvegardés.")
+    parser.add_argument("--models", nargs="*", help="Modèles à mesurer (par défaut : tous ceux présents).")
+    parser.add_argument("--latency-samples", type=int, default=200,
+                        help="Nombre de messages pour la latence unitaire.")
+    parser.add_argument("--batch-repeats", type=int, default=5, help="Répétitions de la mesure de débit.")
+    parser.add_argument("--output", default=LEADERBOARD_PATH, help="Fichier de classement à écrire.")
+    parser.add_argument("--include-stale", action="store_true",
+                        help="Mesure aussi les modèles entraînés sur d'autres données (scores marqués).")
+    args = parser.parse_args(argv)
+
+    texts, y_true, fingerprint = load_holdout()
+    if not texts:
+        print("❌ Ensemble de test indisponible, benchmark abandonné.")
+        return
+
+    results = run_benchmark(texts, y_true, args.models, latency_samples=args.latency_samples,
+                            batch_repeats=args.batch_repeats, fingerprint=fingerprint,
+                            include_stale=args.include_stale)
+    if not results:
+        print("⚠️ Aucun modèle n'a pu être mesuré.")
+        return
+
+    ranked = write_leaderboard(results, len(texts), args.output, fingerprint)
 
-    for model in model_names:
-        report_path = os.path.join(MODEL_DIR, f"{model}_report.txt")
-        metrics = read_report(report_path)
-        if metrics:
-            metrics["Model"] = model
-            results.append(metrics)
-        else:
-            print(f"⚠️ Rapport introuvable pour {model}")
+    df = pd.DataFrame(ranked).set_index("rank")
+    print(df.to_string())
+    print(f"🏆 Classement sauvegardé dans {args.output}")
 
-    if results:
-        df = pd.DataFrame(results)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import time
+import numpy as np
+from joblib import Memory, Parallel, delayed
+from sklearn.base import clone
+from sklearn.preprocessing import LabelEncoder
+from sklearn.model_selection import StratifiedKFold
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from app.models.bundle import file_sha256
+from app.models.utils import load_labels, iter_texts, DATA_PATH, MODEL_DIR
+from app.models.text_normalizer import normalizer_metadata
+from config import TRAINING_CV_CACHE_MAX_MB
+
+# Cache disque des vectorisations par fold, partagé entre les modèles
+CV_CACHE_DIR = os.path.join(MODEL_DIR, ".cache", "cross_validation")
+
+DEFAULT_VECTORIZER_PARAMS = {"max_features": 5000, "ngram_range": (1, 2)}
+
+
+def vectorize_fold(data_sha256, n_splits, random_state, fold, vectorizer_params, normalization=None,
+                   data_path=DATA_PATH):
+    """
+    Ajuste le TF-IDF sur la partie entraînement d'un fold et transforme les deux parties.
+
+    Le résultat est mis en cache par joblib.Memory : la clé porte sur l'empreinte des
+    données, le découpage, la normalisation des textes (métadonnées de text_normalizer,
+    None pour les textes bruts) et les paramètres du vectoriseur, donc tous les modèles
+    évalués avec les mêmes folds réutilisent les mêmes matrices.
+
+    Returns:
+        tuple: (X_train, X_test, train_idx, test_idx)
+    """
+    labels = load_labels(data_path)
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    train_idx, test_idx = list(skf.split(np.zeros(len(labels)), labels))[fold]
+
+    train_mask = np.zeros(len(labels), dtype=bool)
+    train_mask[train_idx] = True
+
+    # iter_texts suit l'ordre du fichier : les indices sont donc triés
+    vectorizer = TfidfVectorizer(**vectorizer_params)
+    normalize = normalization is not None
+    X_train = vectorizer.fit_transform(iter_texts(train_mask, path=data_path, normalize=normalize))
+    X_test = vectorizer.transform(iter_texts(~train_mask, path=data_path, normalize=normalize))
+    return X_train, X_test, np.sort(train_idx), np.sort(test_idx)
+
+
+def prune_cache(cache_dir=CV_CACHE_DIR, max_mb=TRAINING_CV_CACHE_MAX_MB):
+    """
+    Limite la taille du cache des folds : chaque changement du dataset ajoute de nouvelles
+    entrées, les moins récemment utilisées (anciennes versions des données) sont supprimées.
+    """
+    memory = Memory(cache_dir, verbose=0)
+    try:
+        memory.reduce_size(bytes_limit=max_mb * 1024 * 1024)
+    except TypeError:
+        # joblib < 1.4 : la limite se passe au constructeur
+        Memory(cache_dir, verbose=0, bytes_limit=max_mb * 1024 * 1024).reduce_size()
+
+
+def _run_fold(estimator, y, fold, data_sha256, n_splits, random_state, vectorizer_params, normalization, cache_dir):
+    """Évalue un fold dans un worker : vectorisation (en cache si possible), entraînement, métriques."""
+    start = time.perf_counter()
+    cached_vectorize = Memory(cache_dir, verbose=0).cache(vectorize_fold)
+    X_train, X_test, train_idx, test_idx = cached_vectorize(
+        data_sha256, n_splits, random_state, fold, vectorizer_params, normalization
+    )
+    vectorize_time = time.perf_counter() - start
+
+    model = clone(estimator)
+    start = time.perf_counter()
+    model.fit(X_train, y[train_idx])
+    fit_time = time.perf_counter() - start
+
+    y_pred = model.predict(X_test)
+    y_test = y[test_idx]
+    return {
+        "fold": fold,
+        "accuracy": accuracy_score(y_test, y_pred),
+        "precision": precision_score(y_test, y_pred, average="weighted", zero_division=0),
+        "recall": recall_score(y_test, y_pred, average="weighted", zero_division=0),
+        "f1_score": f1_score(y_test, y_pred, average="weighted", zero_division=0),
+        "vectorize_time_s": vectorize_time,
+        "fit_time_s": fit_time,
+    }
+
+
+def cross_validate_model(estimator, n_splits=5, n_jobs=-1, random_state=42, vectorizer_params=None,
+                         normalize=False, cache_dir=CV_CACHE_DIR):
+    """
+    Validation croisée stratifiée en k folds, les folds étant entraînés en parallèle.
+
+    Args:
+        estimator: Modèle scikit-learn non entraîné (cloné pour chaque fold).
+        n_splits (int): Nombre de folds.
+        n_jobs (int): Nombre de processus (-1 : tous les cœurs).
+        normalize (bool): Normalise les textes comme à l'entraînement du modèle.
+
+    Returns:
+        dict: Moyenne et écart-type de chaque métrique, détail par fold et temps.
+    """
+    labels = load_labels()
+    if not labels:
+        return None
+    y = LabelEncoder().fit_transform(labels)
+    vectorizer_params = vectorizer_params or DEFAULT_VECTORIZER_PARAMS
+
+    # Les folds tournent déjà en parallèle : éviter la sur-souscription des modèles multi-cœurs
+    if estimator.get_params().get("n_jobs") not in (None, 1):
+        estimator = clone(estimator).set_params(n_jobs=1)
+
+    # Empreinte du dataset, utilisée comme clé du cache des folds
+    data_sha256 = file_sha256(DATA_PATH)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    folds = Parallel(n_jobs=n_jobs)(
+        delayed(_run_fold)(estimator, y, fold, data_sha256, n_splits, random_state, vectorizer_params,
+                           normalizer_metadata(normalize), cache_dir)
+        for fold in range(n_splits)
+    )
+    wall_time = time.perf_counter() - start
+    prune_cache(cache_dir)
+
+    summary = {"n_splits": n_splits}
+    for metric in ("accuracy", "precision", "recall", "f1_score"):
+        values = np.array([fold[metric] for fold in folds])
+        summary[metric] = {"mean": float(values.mean()), "std": float(values.std())}
+
+    serial_time = sum(fold["vectorize_time_s"] + fold["fit_time_s"] for fold in folds)
+    summary["timing"] = {
+        "wall_time_s": round(wall_time, 4),
+        "serial_time_s": round(serial_time, 4),
+        "parallel_speedup": round(serial_time / wall_time, 2) if wall_time > 0 else None,
+    }
+    summary["folds"] = folds
+
+    print(f"🔁 Validation croisée {n_splits} folds : "
+          f"F1 {summary['f1_score']['mean']:.4f} ± {summary['f1_score']['std']:.4f}, "
+          f"accuracy {summary['accuracy']['mean']:.4f} ± {summary['accuracy']['std']:.4f} "
+          f"({wall_time:.2f}s)")
+    return summary
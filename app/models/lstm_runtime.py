@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+
+# Identifiants réservés du vocabulaire
+PAD_ID = 0
+OOV_ID = 1
+
+# Longueur maximale (en tokens) d'un message, identique à l'entraînement et à l'inférence
+MAX_SEQUENCE_LENGTH = 128
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+TOKENIZER_FILE = "tokenizer.json"
+TFLITE_FILE = "lstm.tflite"
+
+
+class SequenceTokenizer:
+    """
+    Tokenizer mot → identifiant pour le modèle LSTM.
+
+    Le vocabulaire est sauvegardé en JSON avec la signature des données qui l'ont
+    produit : un réentraînement sur les mêmes données le réutilise sans recompter.
+    La correspondance token → identifiant est mémoïsée pour l'inférence.
+    """
+
+    def __init__(self, vocabulary, signature=None):
+        self.vocabulary = vocabulary
+        self.signature = signature
+        self._token_id = lru_cache(maxsize=100000)(self._lookup)
+
+    def _lookup(self, token):
+        return self.vocabulary.get(token, OOV_ID)
+
+    @property
+    def vocab_size(self):
+        return len(self.vocabulary) + 2
+
+    @staticmethod
+    def tokenize(text):
+        return TOKEN_PATTERN.findall(text.lower())
+
+    @classmethod
+    def fit(cls, texts, max_vocab=20000, min_count=2, signature=None):
+        """Construit le vocabulaire à partir d'un itérable de textes (parcouru une seule fois)."""
+        counts = Counter()
+        for text in texts:
+            counts.update(cls.tokenize(text))
+        tokens = [t for t, c in counts.most_common(max_vocab) if c >= min_count]
+        vocabulary = {token: i + 2 for i, token in enumerate(tokens)}
+        return cls(vocabulary, signature=signature)
+
+    def encode(self, text, max_length=MAX_SEQUENCE_LENGTH):
+        """Retourne les identifiants des tokens du texte (tronqués à `max_length`)."""
+        ids = [self._token_id(t) for t in self.tokenize(text)[:max_length]]
+        return np.asarray(ids, dtype=np.int32)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "vocabulary": self.vocabulary}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["vocabulary"], signature=data.get("signature"))
+
+
+def data_signature(path, **params):
+    """Signature d'un fichier de données (taille, date de modification) et des paramètres du tokenizer."""
+    stat = os.stat(path)
+    key = json.dumps({"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime, **params},
+                     sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def pad_sequences(sequences, length):
+    """Complète les séquences avec des zéros en tête (pré-padding) jusqu'à `length`."""
+    batch = np.full((len(sequences), length), PAD_ID, dtype=np.int32)
+    for i, seq in enumerate(sequences):
+        if len(seq):
+            batch[i, -len(seq):] = seq[-length:]
+    return batch
+
+
+def _load_interpreter(model_path=None, model_content=None):
+    """Charge l'interpréteur TFLite, via tflite_runtime si disponible (plus léger que TensorFlow)."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter(model_path=model_path, model_content=model_content)
+
+
+class LstmClassifier:
+    """Inférence du modèle LSTM quantifié exporté au format TFLite."""
+
+    def __init__(self, tokenizer, model_path=None, model_content=None):
+        self.tokenizer = tokenizer
+        self.interpreter = _load_interpreter(model_path=model_path, model_content=model_content)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.max_length = int(self._input["shape"][1])
+
+    @classmethod
+    def from_bundle(cls, bundle):
+        """Construit le classifieur depuis les fichiers embarqués dans un bundle de modèle."""
+        tokenizer = SequenceTokenizer.load(bundle.file_path(TOKENIZER_FILE))
+        return cls(tokenizer, model_path=bundle.file_path(TFLITE_FILE))
+
+    def predict_proba(self, texts):
+        probas = []
+        for text in texts:
+            tokens = pad_sequences([self.tokenizer.encode(text, self.max_length)], self.max_length)
+            self.interpreter.set_tensor(self._input["index"], tokens)
+            self.interpreter.invoke()
+            probas.append(self.interpreter.get_tensor(self._output["index"])[0].copy())
+        return np.vstack(probas)
+
+    def predict(self, texts):
+        """Retourne les indices de classes prédits (compatibles avec le LabelEncoder)."""
+        return np.argmax(self.predict_proba(texts), axis=1)
@@ -1,8 +1,9 @@
 import os
-import pickle
 import sys
 import numpy as np
 import warnings
+from app.models.bundle import load_bundle, BundleError
+from app.models.text_normalizer import normalizer_for
 
 # Ignorer les avertissements
 warnings.filterwarnings("ignore")
@@ -13,48 +14,74 @@ warnings.filterwarnings("ignore")
 MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "saved")
 
 
-def predict(model_name, new_text):
-    """
-    Fait une prédiction en utilisant un modèle spécifié.
+TFIDF_MODELS = ["random_forest", "naive_bayes", "logistic_regression"]
 
-    Args:
-        model_name (str): Le nom du modèle à utiliser ("random_forest", "naive_bayes", "logistic_regression").
-        new_text (str): Le texte d'entrée pour la prédiction.
 
-    Returns:
-        str: Le label prédit.
+class Predictor:
+    """
+    Interface commune de prédiction pour tous les modèles sauvegardés.
+
+    Les modèles TF-IDF (Random Forest, Naive Bayes, Régression Logistique) et le
+    LSTM exposent ainsi la même méthode `predict(texts)`.
     """
-    # Définir le chemin d'accès au dossier spécifique du modèle
-    model_path_dir = os.path.join(MODEL_DIR, model_name)
 
-    if not os.path.exists(model_path_dir):
-        raise FileNotFoundError(f"Dossier du modèle introuvable : {model_path_dir}")
+    def __init__(self, model_name, bundle):
+        self.model_name = model_name
+        self.bundle = bundle
+        self.label_encoder = bundle.get("label_encoder")
+        # Même normalisation des textes qu'à l'entraînement (aucune pour les anciens modèles)
+        self.normalize = normalizer_for(bundle.metadata)
 
-    # Charger le LabelEncoder depuis le dossier spécifique au modèle
-    with open(os.path.join(model_path_dir, "label_encoder.pkl"), "rb") as f:
-        label_encoder = pickle.load(f)
+        if model_name in TFIDF_MODELS:
+            self.vectorizer = bundle.get("vectorizer")
+            self.model = bundle.get("model")
+        elif model_name == "lstm":
+            # Graphe TFLite quantifié + tokenizer embarqués dans le bundle par train_lstm
+            from app.models.lstm_runtime import LstmClassifier
 
-    if model_name in ["random_forest", "naive_bayes", "logistic_regression"]:
-        # Charger TF-IDF vectorizer depuis le dossier spécifique au modèle
-        with open(os.path.join(model_path_dir, "tfidf_vectorizer.pkl"), "rb") as f:
-            vectorizer = pickle.load(f)
-        X_vec = vectorizer.transform([new_text])
+            self.vectorizer = None
+            self.model = LstmClassifier.from_bundle(bundle)
+        else:
+            raise ValueError("Nom de modèle invalide.")
 
-        # Charger le modèle en utilisant le nom par défaut
-        model_file = f"{model_name}.pkl"
+    def predict_indices(self, texts):
+        """Retourne les indices de classes (espace du LabelEncoder) prédits pour une liste de textes."""
+        if self.normalize is not None:
+            texts = [self.normalize(text) for text in texts]
+        if self.vectorizer is not None:
+            return self.model.predict(self.vectorizer.transform(texts))
+        return self.model.predict(texts)
 
-        with open(os.path.join(model_path_dir, model_file), "rb") as f:
-            model = pickle.load(f)
+    def predict(self, texts):
+        """Retourne les labels prédits pour une liste de textes."""
+        return self.label_encoder.inverse_transform(self.predict_indices(texts))
 
-        pred = model.predict(X_vec)
-        return label_encoder.inverse_transform(pred)[0]
-    else:
+
+def load_predictor(model_name, model_dir=MODEL_DIR):
+    """Charge le bundle courant d'un modèle (ou ses anciens pickles) et retourne son Predictor."""
+    if model_name not in TFIDF_MODELS + ["lstm"]:
         raise ValueError("Nom de modèle invalide.")
+    return Predictor(model_name, load_bundle(model_name, model_dir=model_dir))
+
+
+def predict(model_name, new_text):
+    """
+    Fait une prédiction en utilisant un modèle spécifié.
+
+    Args:
+        model_name (str): Le nom du modèle à utiliser ("random_forest", "naive_bayes", "logistic_regression", "lstm").
+        new_text (str): Le texte d'entrée pour la prédiction.
+
+    Returns:
+        str: Le label prédit.
+    """
+    return load_predictor(model_name).predict([new_text])[0]
 
 
 if __name__ == "__main__":
+    # Usage (depuis la racine du projet) : python -m app.models.predict <model_name> '<text>'
     if len(sys.argv) < 3:
-        print("Usage: python predict.py <model_name> '<text>'")
+        print("Usage: python -m app.models.predict <model_name> '<text>'")
         sys.exit(1)
 
     model = sys.argv[1]
@@ -65,6 +92,6 @@ if __name__ == "__main__":
     except FileNotFoundError as e:
         print(f"Erreur: {e}")
         sys.exit(1)
-    except ValueError as e:
+    except (ValueError, BundleError) as e:
         print(f"Erreur: {e}")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Période d'échantillonnage de la mémoire résidente pendant une étape
+RSS_SAMPLING_INTERVAL = 0.01
+
+
+def current_rss_mb():
+    """Mémoire résidente actuelle du processus (Linux), ou None si indisponible."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus depuis son démarrage."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets ailleurs
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class _RssSampler(threading.Thread):
+    """Relève la mémoire résidente à intervalle régulier et garde le maximum observé."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(RSS_SAMPLING_INTERVAL):
+            rss = current_rss_mb()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        rss = current_rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return self.peak
+
+
+class StageProfiler:
+    """
+    Mesure chaque étape d'un entraînement : temps réel, temps CPU et pic de
+    mémoire résidente. Avec `profile=True`, chaque étape est aussi profilée par
+    cProfile et seul le profil de l'étape la plus lente est conservé.
+
+    Le temps CPU et la mémoire sont ceux de tout le processus : les mesures ne sont
+    valables que si rien d'autre n'y tourne en même temps (le pipeline exécute les
+    entraînements un à un, voir Stage.exclusive dans app/pipeline.py).
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = {}
+        self._profiles = {}
+
+    @contextmanager
+    def stage(self, name):
+        rss_start = current_rss_mb()
+        sampler = _RssSampler() if rss_start is not None else None
+        if sampler:
+            sampler.start()
+        profiler = cProfile.Profile() if self.profile else None
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                self._profiles[name] = profiler
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            peak = sampler.stop() if sampler else None
+
+            self.stages[name] = {
+                "wall_time_s": round(wall, 4),
+                "cpu_time_s": round(cpu, 4),
+                "peak_rss_mb": round(peak, 1) if peak is not None else None,
+                "rss_increase_mb": round(peak - rss_start, 1) if peak is not None else None,
+            }
+
+    def slowest_stage(self):
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda name: self.stages[name]["wall_time_s"])
+
+    def report(self):
+        """Rapport à insérer dans le JSON des métriques."""
+        return {
+            "stages": self.stages,
+            "total_wall_time_s": round(sum(s["wall_time_s"] for s in self.stages.values()), 4),
+            "total_cpu_time_s": round(sum(s["cpu_time_s"] for s in self.stages.values()), 4),
+            "process_peak_rss_mb": round(peak_rss_mb(), 1),
+            "slowest_stage": self.slowest_stage(),
+        }
+
+    def dump_slowest_profile(self, output_dir, prefix):
+        """
+        Sauvegarde le profil cProfile de l'étape la plus lente (lisible avec pstats
+        ou snakeviz) et affiche ses fonctions les plus coûteuses.
+
+        Returns:
+            str: Chemin du fichier .prof, ou None si le profilage n'était pas actif.
+        """
+        name = self.slowest_stage()
+        if not self.profile or name not in self._profiles:
+            return None
+        path = os.path.join(output_dir, f"profile_{prefix}_{name}.prof")
+        self._profiles[name].dump_stats(path)
+        print(f"🔬 Étape la plus lente : '{name}', profil sauvegardé dans {path}")
+        pstats.Stats(self._profiles[name]).sort_stats("cumulative").print_stats(15)
+        return path
+
+    def print_summary(self):
+        for name, stage in self.stages.items():
+            print(f"⏱️ {name:<10} {stage['wall_time_s']:>8.3f}s réel  {stage['cpu_time_s']:>8.3f}s CPU  "
+                  f"pic {stage['peak_rss_mb']} Mo")
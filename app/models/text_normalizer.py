@@ -0,0 +1,129 @@
+import re
+import sys
+import time
+from functools import lru_cache
+
+# Version des règles de normalisation, enregistrée dans les métadonnées des modèles :
+# un modèle est servi avec la normalisation utilisée à son entraînement
+NORMALIZER_VERSION = 1
+
+# Nombre de tokens distincts gardés en cache (les tokens fréquents ne sont normalisés qu'une fois)
+TOKEN_CACHE_SIZE = 200_000
+
+# Caractères remplacés sur tout le texte en une passe (str.translate) : accents
+# français, variantes de lettres arabes, diacritiques et tatweel arabes supprimés
+_CHAR_TABLE = str.maketrans({
+    **{accent: letter for letters, letter in [
+        ('àâä', 'a'), ('éèêë', 'e'), ('îï', 'i'), ('ôö', 'o'), ('ùûü', 'u'), ('ç', 'c'), ('ÿ', 'y'),
+    ] for accent in letters},
+    'œ': 'oe', 'æ': 'ae',
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    'ـ': None,
+    **{chr(code): None for code in range(0x064B, 0x0653)},
+})
+
+# Chiffres utilisés comme lettres en arabizi tunisien (2 = ء, 3 = ع, 5 = خ, 7 = ح, 8 = غ, 9 = ق)
+_ARABIZI_DIGITS = str.maketrans({'2': 'a', '3': 'a', '5': 'kh', '7': 'h', '8': 'gh', '9': 'q'})
+
+_TOKEN = re.compile(r'\w+')
+# Lettre répétée : "sbeeeh", "yayy", "hhhh". Les doubles légitimes du français ("belle")
+# sont aussi réduits, de la même façon à l'entraînement et en production.
+_REPEATS = re.compile(r'([^\W\d])\1+')
+# Tokens numériques à garder tels quels : nombres, heures, ordinaux, montants ("10h", "2eme", "18000dt")
+_NUMERIC = re.compile(r'\d{2,}\w*|\d+(?:h|min|dt|tnd|k|er|ere|eme|e)')
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def normalize_token(token):
+    """Translittère les chiffres arabizi d'un token ("9a3ed" → "qaaed") et réduit les lettres répétées."""
+    if not token.isdigit() and not _NUMERIC.fullmatch(token) and any(char.isdigit() for char in token):
+        token = token.translate(_ARABIZI_DIGITS)
+    return _REPEATS.sub(r'\1', token)
+
+
+def _normalize_match(match):
+    return normalize_token(match.group())
+
+
+def normalize_text(text):
+    """
+    Normalise un message (français, arabe ou arabizi tunisien) avant la vectorisation :
+    minuscules, accents et variantes de lettres arabes unifiés, chiffres arabizi
+    translittérés, lettres répétées réduites.
+    """
+    if not isinstance(text, str):
+        return text
+    return _TOKEN.sub(_normalize_match, text.lower().translate(_CHAR_TABLE))
+
+
+def normalizer_metadata(enabled=True):
+    """Métadonnées de normalisation à enregistrer dans le bundle d'un modèle (None si désactivée)."""
+    return {"version": NORMALIZER_VERSION} if enabled else None
+
+
+def normalizer_for(metadata):
+    """
+    Fonction de normalisation à appliquer aux textes servis à un modèle, d'après les
+    métadonnées de son bundle, ou None (modèle entraîné sur les textes bruts).
+    """
+    settings = (metadata or {}).get("text_normalization")
+    if not settings:
+        return None
+    if settings.get("version") != NORMALIZER_VERSION:
+        print(f"⚠️ Modèle entraîné avec la normalisation v{settings.get('version')}, "
+              f"v{NORMALIZER_VERSION} appliquée : réentraîner le modèle.")
+    return normalize_text
+
+
+# --- Mesures ---------------------------------------------------------------------
+
+def benchmark(repeats=3):
+    """
+    Mesure la normalisation sur le dataset de formation : débit, taille du
+    vocabulaire et durée de la vectorisation TF-IDF avec et sans normalisation.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from app.models.utils import iter_texts
+
+    texts = list(iter_texts())
+    if not texts:
+        print("❌ Dataset de formation vide.")
+        return
+    n_chars = sum(len(text) for text in texts)
+
+    normalize_token.cache_clear()
+    start = time.perf_counter()
+    normalized = [normalize_text(text) for text in texts]
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            normalize_text(text)
+    warm = (time.perf_counter() - start) / repeats
+    cache = normalize_token.cache_info()
+    print(f"⏱️ Normalisation de {len(texts)} textes ({n_chars / 1e6:.2f} M caractères) : "
+          f"{n_chars / cold / 1e6:.1f} M car/s à froid, {n_chars / warm / 1e6:.1f} M car/s cache chaud "
+          f"({cache.currsize} tokens en cache)")
+
+    analyzer = TfidfVectorizer(ngram_range=(1, 2)).build_analyzer()
+    for label, corpus in [('brut', texts), ('normalisé', normalized)]:
+        ngrams = {ngram for text in corpus for ngram in analyzer(text)}
+        words = sum(1 for ngram in ngrams if ' ' not in ngram)
+        print(f"📚 Vocabulaire {label:<10} : {words} mots, {len(ngrams)} n-grammes (limite TF-IDF : 5000)")
+
+    for label, corpus, prepare in [('brut', texts, None), ('normalisé', texts, normalize_text)]:
+        vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
+        vectorizer.fit([prepare(text) for text in corpus] if prepare else corpus)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            vectorizer.transform([prepare(text) for text in corpus] if prepare else corpus)
+        seconds = (time.perf_counter() - start) / repeats
+        print(f"🔢 TF-IDF {label:<10} : transform {seconds * 1000:.0f} ms (normalisation comprise)")
+
+
+if __name__ == "__main__":
+    # Usage : python -m app.models.text_normalizer ["texte à normaliser"]
+    if len(sys.argv) > 1:
+        print(normalize_text(sys.argv[1]))
+    else:
+        benchmark()
@@ -1,86 +1,276 @@
 import os
+import sys
 import pickle
-import json
+import argparse
 import warnings
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import classification_report, accuracy_score, precision_score, recall_score, f1_score
-from app.models.utils import load_data, MODEL_DIR
+from app.models.utils import load_labels, split_mask, data_fingerprint, iter_texts, DATA_PATH, MODEL_DIR
+from app.models.bundle import save_bundle, save_metrics, load_bundle, BundleError
+from app.models.profiling import StageProfiler
+from app.models.cross_validation import cross_validate_model
+from app.models.text_normalizer import normalizer_metadata
+from config import LOGISTIC_REGRESSION_MAX_NEW_TERMS
 
 # Ignorer les avertissements UndefinedMetricWarning
 warnings.filterwarnings("ignore", category=UserWarning)
 
+LOGISTIC_REGRESSION_DIR = os.path.join(MODEL_DIR, "logistic_regression")
 
-def main():
+
+def load_previous_artifacts(normalize=True):
+    """
+    Charge le vectoriseur, l'encodeur et le modèle du précédent entraînement.
+
+    Returns:
+        tuple: (vectorizer, label_encoder, model) ou None si le modèle précédent est illisible
+        ou a été entraîné avec une autre normalisation des textes (vocabulaire incompatible).
+    """
+    try:
+        bundle = load_bundle("logistic_regression", model_dir=MODEL_DIR)
+        if bundle.metadata.get("text_normalization") != normalizer_metadata(normalize):
+            print("⚠️ Warm start impossible, le modèle précédent n'a pas la même normalisation des textes.")
+            return None
+        return tuple(bundle.get(name) for name in ("vectorizer", "label_encoder", "model"))
+    except (FileNotFoundError, BundleError, pickle.UnpicklingError, AttributeError, EOFError) as e:
+        print(f"⚠️ Warm start impossible, modèle précédent illisible : {e}")
+        return None
+
+
+def warm_start_coefficients(previous_model, previous_classes, classes):
+    """
+    Construit les coefficients initiaux pour le nouvel ensemble de classes.
+
+    Les lignes des classes déjà connues sont recopiées depuis le modèle précédent,
+    les nouvelles classes démarrent à zéro.
+
+    Returns:
+        tuple: (coef, intercept) ou None si les formes sont incompatibles.
+    """
+    previous_coef = previous_model.coef_
+    # Le cas binaire ne stocke qu'une seule ligne de coefficients : on ne peut
+    # le réutiliser que si l'ensemble des classes est strictement identique.
+    if previous_coef.shape[0] != len(previous_classes) or len(classes) <= 2:
+        if list(previous_classes) == list(classes):
+            return previous_coef.copy(), previous_model.intercept_.copy()
+        return None
+
+    coef = np.zeros((len(classes), previous_coef.shape[1]), dtype=previous_coef.dtype)
+    intercept = np.zeros(len(classes), dtype=previous_model.intercept_.dtype)
+    previous_index = {label: i for i, label in enumerate(previous_classes)}
+    for i, label in enumerate(classes):
+        if label in previous_index:
+            coef[i] = previous_coef[previous_index[label]]
+            intercept[i] = previous_model.intercept_[previous_index[label]]
+    return coef, intercept
+
+
+def new_terms_ratio(previous_vectorizer, texts):
+    """
+    Part du vocabulaire qu'un entraînement à froid choisirait sur `texts` et qui
+    est absente du vocabulaire précédent (termes apparus depuis le dernier fit à froid).
+
+    Returns:
+        tuple: (ratio, vectoriseur à froid ajusté sur `texts`)
+    """
+    cold_vectorizer = TfidfVectorizer(max_features=5000, ngram_range=previous_vectorizer.ngram_range)
+    cold_vectorizer.fit(texts)
+    vocabulary = cold_vectorizer.vocabulary_
+    new_terms = sum(1 for term in vocabulary if term not in previous_vectorizer.vocabulary_)
+    return (new_terms / len(vocabulary) if vocabulary else 0.0), cold_vectorizer
+
+
+def main(warm_start=False, compare_cold=False, profile=False, cv_folds=0, normalize=True,
+         max_new_terms=LOGISTIC_REGRESSION_MAX_NEW_TERMS):
+    """
+    Entraîne la Régression Logistique.
+
+    Args:
+        warm_start (bool): Réutilise le vocabulaire TF-IDF et les coefficients du
+            précédent modèle sauvegardé au lieu de repartir de zéro. Le vocabulaire
+            reste celui du dernier entraînement à froid : les termes apparus depuis
+            n'y entrent pas tant qu'un entraînement à froid n'a pas lieu.
+        compare_cold (bool): En mode warm start, entraîne aussi un modèle à froid sur
+            les mêmes données pour reporter le gain de temps dans les métriques
+            (coûte plus cher qu'un simple entraînement à froid).
+        max_new_terms (float): Part maximale de termes hors du vocabulaire précédent
+            (voir new_terms_ratio) au-delà de laquelle le warm start est abandonné
+            pour un entraînement à froid qui reconstruit le vocabulaire.
+        profile (bool): Sauvegarde le profil cProfile de l'étape la plus lente.
+        cv_folds (int): Si non nul, ajoute une validation croisée stratifiée en k folds.
+        normalize (bool): Normalise les textes (arabizi, accents, lettres répétées) avant
+            la vectorisation ; le réglage est enregistré dans le bundle pour la production.
+    """
     print("🔹 Entraînement Logistic Regression...")
-    df = load_data()
-    if df is None or df.empty:
-        print("Abandon de l'entraînement car les données n'ont pas pu être chargées.")
-        return
+    profiler = StageProfiler(profile=profile)
+
+    # Seuls les labels sont chargés en mémoire, les textes sont relus en flux
+    with profiler.stage("load"):
+        labels = load_labels()
+        data_sha256 = data_fingerprint() if labels else None
+        previous = load_previous_artifacts(normalize) if warm_start and labels else None
+    if not labels:
+        raise RuntimeError("Abandon de l'entraînement car les données n'ont pas pu être chargées.")
 
     # Créer un dossier indépendant pour ce modèle
-    LOGISTIC_REGRESSION_DIR = os.path.join(MODEL_DIR, "logistic_regression")
     os.makedirs(LOGISTIC_REGRESSION_DIR, exist_ok=True)
 
-    # Encoder les labels et sauvegarder l'encodeur
-    label_encoder = LabelEncoder()
-    df["label_enc"] = label_encoder.fit_transform(df["label"])
-    pickle.dump(label_encoder, open(os.path.join(LOGISTIC_REGRESSION_DIR, "label_encoder.pkl"), "wb"))
-
-    # Train/Test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        df["text"], df["label_enc"], test_size=0.2, random_state=42
-    )
-
-    # Vectorisation TF-IDF et sauvegarde du vectoriseur
-    vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
-    X_train_vec = vectorizer.fit_transform(X_train)
-    X_test_vec = vectorizer.transform(X_test)
-    pickle.dump(vectorizer, open(os.path.join(LOGISTIC_REGRESSION_DIR, "tfidf_vectorizer.pkl"), "wb"))
-
-    # Entraînement du modèle
-    model = LogisticRegression(max_iter=1000)
-    model.fit(X_train_vec, y_train)
-
-    y_pred = model.predict(X_test_vec)
-
-    # Calcul des métriques
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred, average="weighted", zero_division=0)
-    recall = recall_score(y_test, y_pred, average="weighted", zero_division=0)
-    f1 = f1_score(y_test, y_pred, average="weighted", zero_division=0)
-
-    print(f"Accuracy: {accuracy:.4f}")
-    print(f"Precision: {precision:.4f}")
-    print(f"Recall: {recall:.4f}")
-    print(f"F1-score: {f1:.4f}")
-
-    unique_labels = np.unique(y_test)
-    target_names_filtered = label_encoder.inverse_transform(unique_labels)
-    print(classification_report(y_test, y_pred, labels=unique_labels, target_names=target_names_filtered,
-                                zero_division=0))
-
-    # Sauvegarder le modèle dans son propre dossier
-    model_path = os.path.join(LOGISTIC_REGRESSION_DIR, "logistic_regression.pkl")
-    with open(model_path, "wb") as f:
-        pickle.dump(model, f)
+    if warm_start and previous is None:
+        print("⚠️ Aucun modèle précédent exploitable, entraînement à froid.")
+
+    # Encoder les labels
+    with profiler.stage("encode"):
+        label_encoder = LabelEncoder()
+        y = label_encoder.fit_transform(labels)
+
+    # Train/Test split (même découpage que train_test_split, appliqué en flux)
+    with profiler.stage("split"):
+        test_mask = split_mask(len(y), test_size=0.2, random_state=42)
+        y_train, y_test = y[~test_mask], y[test_mask]
+
+    # Vectorisation TF-IDF en flux : en warm start, le vocabulaire précédent est conservé
+    # pour que les colonnes correspondent aux coefficients déjà appris, sauf si trop de
+    # termes nouveaux sont apparus depuis le dernier entraînement à froid.
+    new_terms = None
+    fitted = False
+    with profiler.stage("vectorize"):
+        if previous is not None:
+            previous_vectorizer = previous[0]
+            new_terms, cold_vectorizer = new_terms_ratio(previous_vectorizer,
+                                                         iter_texts(~test_mask, normalize=normalize))
+            print(f"🔤 Termes hors du vocabulaire précédent : {new_terms:.1%}")
+            if new_terms > max_new_terms:
+                print(f"⚠️ Plus de {max_new_terms:.0%} de termes nouveaux, entraînement à froid "
+                      f"pour reconstruire le vocabulaire.")
+                previous = None
+                vectorizer, fitted = cold_vectorizer, True
+            else:
+                vectorizer = TfidfVectorizer(
+                    max_features=5000, ngram_range=previous_vectorizer.ngram_range,
+                    vocabulary=previous_vectorizer.vocabulary_
+                )
+        else:
+            vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
+        if fitted:
+            X_train_vec = vectorizer.transform(iter_texts(~test_mask, normalize=normalize))
+        else:
+            X_train_vec = vectorizer.fit_transform(iter_texts(~test_mask, normalize=normalize))
+        X_test_vec = vectorizer.transform(iter_texts(test_mask, normalize=normalize))
+
+    # Initialisation depuis les coefficients précédents si possible
+    model = LogisticRegression(max_iter=1000, tol=1e-4, warm_start=previous is not None)
+    mode = "cold"
+    if previous is not None:
+        _, previous_encoder, previous_model = previous
+        init = warm_start_coefficients(previous_model, previous_encoder.classes_, label_encoder.classes_)
+        if init is not None and init[0].shape[1] == X_train_vec.shape[1]:
+            model.coef_, model.intercept_ = init
+            mode = "warm"
+        else:
+            print("⚠️ Coefficients précédents incompatibles, entraînement à froid.")
+
+    # Entraînement du modèle (lbfgs s'arrête dès que la tolérance est atteinte)
+    with profiler.stage("fit"):
+        model.fit(X_train_vec, y_train)
+    fit_time = profiler.stages["fit"]["wall_time_s"]
+    print(f"⏱️ Entraînement {mode} en {fit_time:.3f}s ({int(model.n_iter_.max())} itérations)")
+
+    training_info = {
+        "mode": mode,
+        "fit_time_seconds": fit_time,
+        "n_iter": int(model.n_iter_.max()),
+        "n_features": int(X_train_vec.shape[1]),
+    }
+    if new_terms is not None:
+        training_info["new_terms_ratio"] = new_terms
+    if mode == "warm" and compare_cold:
+        with profiler.stage("cold_fit"):
+            cold_model = LogisticRegression(max_iter=1000, tol=1e-4)
+            cold_model.fit(X_train_vec, y_train)
+        cold_fit_time = profiler.stages["cold_fit"]["wall_time_s"]
+        training_info["cold_fit_time_seconds"] = cold_fit_time
+        training_info["cold_n_iter"] = int(cold_model.n_iter_.max())
+        training_info["speedup_vs_cold"] = cold_fit_time / fit_time if fit_time > 0 else None
+        print(f"⏱️ Référence à froid : {cold_fit_time:.3f}s ({training_info['cold_n_iter']} itérations)")
+
+    with profiler.stage("evaluate"):
+        y_pred = model.predict(X_test_vec)
+
+        # Calcul des métriques
+        accuracy = accuracy_score(y_test, y_pred)
+        precision = precision_score(y_test, y_pred, average="weighted", zero_division=0)
+        recall = recall_score(y_test, y_pred, average="weighted", zero_division=0)
+        f1 = f1_score(y_test, y_pred, average="weighted", zero_division=0)
+
+        print(f"Accuracy: {accuracy:.4f}")
+        print(f"Precision: {precision:.4f}")
+        print(f"Recall: {recall:.4f}")
+        print(f"F1-score: {f1:.4f}")
+
+        unique_labels = np.unique(y_test)
+        target_names_filtered = label_encoder.inverse_transform(unique_labels)
+        print(classification_report(y_test, y_pred, labels=unique_labels, target_names=target_names_filtered,
+                                    zero_division=0))
+
+    metrics = {
+        "accuracy": accuracy,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1,
+        "training": training_info
+    }
+
+    # Validation croisée stratifiée, folds entraînés en parallèle
+    if cv_folds:
+        with profiler.stage("cross_validate"):
+            metrics["cross_validation"] = cross_validate_model(model, n_splits=cv_folds, normalize=normalize)
+
+    # Sauvegarder le modèle, le vectoriseur et l'encodeur dans un bundle versionné
+    with profiler.stage("save"):
+        bundle_path = save_bundle(
+            "logistic_regression",
+            {"label_encoder": label_encoder, "vectorizer": vectorizer, "model": model},
+            metadata={
+                "data_path": DATA_PATH,
+                # Identifie l'ensemble de test (split_mask, test_size=0.2, random_state=42) pour compare_models
+                "data_sha256": data_sha256,
+                "n_samples": len(y),
+                "classes": list(label_encoder.classes_),
+                "vectorizer_params": {k: v for k, v in vectorizer.get_params().items() if k != "vocabulary"},
+                "model_params": model.get_params(),
+                "text_normalization": normalizer_metadata(normalize),
+            },
+            metrics=metrics,
+            model_dir=MODEL_DIR,
+        )
+
+    profiler.print_summary()
+    metrics["profiling"] = profiler.report()
+    profiler.dump_slowest_profile(LOGISTIC_REGRESSION_DIR, "logistic_regression")
 
     # Sauvegarder les métriques dans le même dossier
     metrics_path = os.path.join(LOGISTIC_REGRESSION_DIR, "metrics_logistic_regression.json")
-    with open(metrics_path, "w") as f:
-        json.dump({
-            "accuracy": accuracy,
-            "precision": precision,
-            "recall": recall,
-            "f1_score": f1
-        }, f, indent=4)
-
-    print("✅ Logistic Regression entraîné et sauvegardé.")
+    save_metrics(metrics_path, metrics)
+
+    print(f"✅ Logistic Regression entraîné et sauvegardé dans {bundle_path}.")
     print(f"📊 Métriques sauvegardées dans {metrics_path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Entraînement de la Régression Logistique.")
+    parser.add_argument("--warm-start", action="store_true",
+                        help="Repart du vocabulaire et des coefficients du modèle sauvegardé.")
+    parser.add_argument("--cold-baseline", action="store_true",
+                        help="En warm start, mesure aussi le temps d'un entraînement à froid (plus coûteux).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Sauvegarde un profil cProfile de l'étape la plus lente.")
+    parser.add_argument("--cv", type=int, default=0, metavar="K",
+                        help="Validation croisée stratifiée en K folds, en parallèle.")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="Vectorise les textes bruts, sans normalisation.")
+    args = parser.parse_args(sys.argv[1:])
+    main(warm_start=args.warm_start, compare_cold=args.cold_baseline, profile=args.profile,
+         cv_folds=args.cv, normalize=not args.no_normalize)
@@ -0,0 +1,293 @@
+import os
+import sys
+import time
+import argparse
+import random
+import itertools
+import warnings
+import numpy as np
+from sklearn.preprocessing import LabelEncoder
+from sklearn.metrics import classification_report, accuracy_score, precision_score, recall_score, f1_score
+from app.models.utils import load_labels, split_mask, data_fingerprint, iter_texts, DATA_PATH, MODEL_DIR
+from app.models.bundle import save_bundle, save_metrics
+from app.models.profiling import StageProfiler
+from app.models.text_normalizer import normalizer_metadata
+from app.models.lstm_runtime import (
+    SequenceTokenizer, LstmClassifier, data_signature, pad_sequences,
+    MAX_SEQUENCE_LENGTH, TOKENIZER_FILE, TFLITE_FILE
+)
+
+# Ignorer les avertissements UndefinedMetricWarning dans classification_report
+warnings.filterwarnings("ignore", category=UserWarning)
+
+# Hyperparamètres volontairement petits : le modèle doit s'entraîner et répondre sur CPU
+MAX_VOCAB = 20000
+EMBEDDING_DIM = 64
+LSTM_UNITS = 64
+BATCH_SIZE = 32
+EPOCHS = 15
+# Part des lignes d'entraînement réservée à l'arrêt anticipé (le jeu de test ne sert qu'à l'évaluation finale)
+VALIDATION_SIZE = 0.1
+BUCKET_BOUNDARIES = [16, 32, 64, MAX_SEQUENCE_LENGTH]
+
+
+def load_or_fit_tokenizer(train_mask, model_dir, normalize=True):
+    """
+    Réutilise le tokenizer en cache s'il a été construit sur les mêmes données,
+    sinon reconstruit le vocabulaire en flux sur l'ensemble d'entraînement.
+    """
+    signature = data_signature(DATA_PATH, max_vocab=MAX_VOCAB, n_train=int(train_mask.sum()),
+                               normalization=normalizer_metadata(normalize))
+    cache_path = os.path.join(model_dir, TOKENIZER_FILE)
+    if os.path.exists(cache_path):
+        tokenizer = SequenceTokenizer.load(cache_path)
+        if tokenizer.signature == signature:
+            print("♻️ Tokenizer réutilisé depuis le cache.")
+            return tokenizer
+
+    tokenizer = SequenceTokenizer.fit(iter_texts(train_mask, normalize=normalize), max_vocab=MAX_VOCAB,
+                                      signature=signature)
+    tokenizer.save(cache_path)
+    return tokenizer
+
+
+def bucketed_batches(sequences, labels, shuffle=True, seed=42):
+    """
+    Génère des lots de séquences de longueurs voisines.
+
+    Chaque séquence est rangée dans le plus petit bucket qui la contient, les lots
+    sont formés à l'intérieur d'un bucket puis complétés à la longueur de la plus
+    longue séquence du lot : le padding (et donc le calcul inutile) reste minimal.
+    """
+    buckets = {}
+    for i, seq in enumerate(sequences):
+        boundary = next(b for b in BUCKET_BOUNDARIES if len(seq) <= b)
+        buckets.setdefault(boundary, []).append(i)
+
+    batches = []
+    for indices in buckets.values():
+        if shuffle:
+            random.Random(seed).shuffle(indices)
+        for start in range(0, len(indices), BATCH_SIZE):
+            batches.append(indices[start:start + BATCH_SIZE])
+    if shuffle:
+        random.Random(seed).shuffle(batches)
+
+    for batch in batches:
+        length = max(1, max(len(sequences[i]) for i in batch))
+        yield pad_sequences([sequences[i] for i in batch], length), labels[batch]
+
+
+def padding_ratio(sequences):
+    """Part des positions de padding avec le batching par buckets."""
+    total = padded = 0
+    for x, _ in bucketed_batches(sequences, np.zeros(len(sequences), dtype=np.int32), shuffle=False):
+        total += x.size
+        padded += int((x == 0).sum())
+    return padded / total if total else 0.0
+
+
+def build_model(vocab_size, n_classes):
+    import tensorflow as tf
+
+    model = tf.keras.Sequential([
+        tf.keras.layers.Embedding(vocab_size, EMBEDDING_DIM, mask_zero=True),
+        tf.keras.layers.LSTM(LSTM_UNITS),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(n_classes, activation="softmax"),
+    ])
+    model.compile(optimizer="adam", loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+    return model
+
+
+def export_tflite(model):
+    """
+    Exporte le graphe d'inférence en TFLite avec quantification post-entraînement
+    (poids en int8, dynamic range), pour une entrée de forme [1, MAX_SEQUENCE_LENGTH].
+    """
+    import tensorflow as tf
+
+    # Enveloppe à entrée fixe convertie depuis Keras : les poids sont figés en constantes
+    # (depuis une tf.function, le LSTM garde des variables que l'interpréteur ne sait pas lire)
+    inputs = tf.keras.Input(shape=(MAX_SEQUENCE_LENGTH,), batch_size=1, dtype="int32")
+    serving_model = tf.keras.Model(inputs, model(inputs, training=False))
+    converter = tf.lite.TFLiteConverter.from_keras_model(serving_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    # Opérations natives uniquement : un graphe avec des opérations TensorFlow (SELECT_TF_OPS)
+    # ne se charge pas avec tflite_runtime, donc pas dans le chatbot. Mieux vaut échouer ici.
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    try:
+        return converter.convert()
+    except Exception as e:
+        raise RuntimeError(f"Conversion TFLite en opérations natives impossible : {e}") from e
+
+
+def main(profile=False, normalize=True):
+    """
+    Entraîne le LSTM, l'exporte en TFLite quantifié et mesure chaque étape.
+
+    Args:
+        profile (bool): Sauvegarde le profil cProfile de l'étape la plus lente.
+        normalize (bool): Normalise les textes avant la tokenisation (réglage enregistré
+            dans le bundle pour la production).
+    """
+    print("🔹 Entraînement LSTM...")
+    import tensorflow as tf
+
+    # Forcer l'exécution CPU : le modèle est dimensionné pour s'en passer
+    tf.config.set_visible_devices([], "GPU")
+    tf.random.set_seed(42)
+    profiler = StageProfiler(profile=profile)
+
+    with profiler.stage("load"):
+        labels = load_labels()
+        data_sha256 = data_fingerprint() if labels else None
+    if not labels:
+        raise RuntimeError("Abandon de l'entraînement car les données n'ont pas pu être chargées.")
+
+    # Créer un dossier indépendant pour ce modèle
+    LSTM_DIR = os.path.join(MODEL_DIR, "lstm")
+    os.makedirs(LSTM_DIR, exist_ok=True)
+
+    # Encoder les labels
+    with profiler.stage("encode"):
+        label_encoder = LabelEncoder()
+        y = label_encoder.fit_transform(labels).astype(np.int32)
+
+    # Même découpage que les autres modèles pour des métriques comparables. L'arrêt anticipé
+    # choisit l'époque sur une validation prise dans les lignes d'entraînement : le jeu de test
+    # n'intervient que dans l'évaluation finale, sinon ses métriques seraient optimistes.
+    with profiler.stage("split"):
+        test_mask = split_mask(len(y), test_size=0.2, random_state=42)
+        train_rows = np.flatnonzero(~test_mask)
+        val_mask = np.zeros(len(y), dtype=bool)
+        val_mask[train_rows[split_mask(len(train_rows), test_size=VALIDATION_SIZE, random_state=42)]] = True
+        fit_mask = ~test_mask & ~val_mask
+        y_fit, y_val, y_test = y[fit_mask], y[val_mask], y[test_mask]
+
+    # Tokenisation (équivalent de la vectorisation TF-IDF des autres modèles)
+    with profiler.stage("vectorize"):
+        tokenizer = load_or_fit_tokenizer(fit_mask, LSTM_DIR, normalize)
+        fit_sequences = [tokenizer.encode(text) for text in iter_texts(fit_mask, normalize=normalize)]
+        val_sequences = [tokenizer.encode(text) for text in iter_texts(val_mask, normalize=normalize)]
+        test_texts = list(iter_texts(test_mask, normalize=normalize))
+    print(f"Vocabulaire : {tokenizer.vocab_size} tokens, padding moyen : {padding_ratio(fit_sequences):.1%}")
+    print(f"Lignes : {len(y_fit)} entraînement, {len(y_val)} validation, {len(y_test)} test")
+
+    # Graine différente à chaque époque pour varier l'ordre des lots
+    epochs = itertools.count()
+
+    def dataset(sequences, targets, shuffle):
+        return tf.data.Dataset.from_generator(
+            lambda: bucketed_batches(sequences, targets, shuffle=shuffle, seed=next(epochs)),
+            output_signature=(
+                tf.TensorSpec(shape=(None, None), dtype=tf.int32),
+                tf.TensorSpec(shape=(None,), dtype=tf.int32),
+            ),
+        ).prefetch(tf.data.AUTOTUNE)
+
+    with profiler.stage("fit"):
+        model = build_model(tokenizer.vocab_size, len(label_encoder.classes_))
+        early_stopping = tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=2,
+                                                          restore_best_weights=True)
+        history = model.fit(
+            dataset(fit_sequences, y_fit, shuffle=True),
+            validation_data=dataset(val_sequences, y_val, shuffle=False),
+            epochs=EPOCHS,
+            callbacks=[early_stopping],
+            verbose=2,
+        )
+    training_time = profiler.stages["fit"]["wall_time_s"]
+
+    # Export du graphe d'inférence quantifié
+    with profiler.stage("export"):
+        tflite_model = export_tflite(model)
+        tflite_size = len(tflite_model)
+
+    # Évaluation et latence mesurées sur le modèle exporté, tel qu'il sera servi
+    with profiler.stage("evaluate"):
+        classifier = LstmClassifier(tokenizer, model_content=tflite_model)
+        latencies = []
+        y_pred = []
+        for text in test_texts:
+            start = time.perf_counter()
+            y_pred.append(int(classifier.predict([text])[0]))
+            latencies.append(time.perf_counter() - start)
+        y_pred = np.asarray(y_pred)
+
+        # Calcul des métriques
+        accuracy = accuracy_score(y_test, y_pred)
+        precision = precision_score(y_test, y_pred, average="weighted", zero_division=0)
+        recall = recall_score(y_test, y_pred, average="weighted", zero_division=0)
+        f1 = f1_score(y_test, y_pred, average="weighted", zero_division=0)
+
+        print(f"Accuracy: {accuracy:.4f}")
+        print(f"Precision: {precision:.4f}")
+        print(f"Recall: {recall:.4f}")
+        print(f"F1-score: {f1:.4f}")
+
+        unique_labels = np.unique(y_test)
+        target_names_filtered = label_encoder.inverse_transform(unique_labels)
+        print(classification_report(y_test, y_pred, labels=unique_labels, target_names=target_names_filtered,
+                                    zero_division=0))
+
+    latencies_ms = np.asarray(latencies) * 1000
+    metrics = {
+        "accuracy": accuracy,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1,
+        "training_time_seconds": training_time,
+        "epochs": len(history.history["loss"]),
+        "best_epoch": int(early_stopping.best_epoch) + 1,
+        "inference_latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+        },
+        "tflite_size_bytes": tflite_size
+    }
+
+    # Sauvegarder le bundle du modèle (encodeur, tokenizer et graphe TFLite)
+    with profiler.stage("save"):
+        with open(os.path.join(LSTM_DIR, TOKENIZER_FILE), "rb") as f:
+            tokenizer_bytes = f.read()
+        bundle_path = save_bundle(
+            "lstm",
+            {"label_encoder": label_encoder},
+            files={TOKENIZER_FILE: tokenizer_bytes, TFLITE_FILE: tflite_model},
+            metadata={
+                "data_path": DATA_PATH,
+                # Identifie l'ensemble de test (split_mask, test_size=0.2, random_state=42) pour compare_models
+                "data_sha256": data_sha256,
+                "n_samples": len(y),
+                "classes": list(label_encoder.classes_),
+                "params": {"max_vocab": MAX_VOCAB, "embedding_dim": EMBEDDING_DIM, "lstm_units": LSTM_UNITS,
+                           "max_sequence_length": MAX_SEQUENCE_LENGTH, "quantization": "dynamic_range",
+                           "validation_size": VALIDATION_SIZE},
+                "text_normalization": normalizer_metadata(normalize),
+            },
+            metrics=metrics,
+            model_dir=MODEL_DIR,
+        )
+
+    profiler.print_summary()
+    metrics["profiling"] = profiler.report()
+    profiler.dump_slowest_profile(LSTM_DIR, "lstm")
+
+    # Sauvegarder les métriques dans le même dossier
+    metrics_path = os.path.join(LSTM_DIR, "metrics_lstm.json")
+    save_metrics(metrics_path, metrics)
+
+    print(f"✅ LSTM entraîné, quantifié et sauvegardé dans {bundle_path} ({tflite_size / 1024:.0f} Ko).")
+    print(f"📊 Métriques sauvegardées dans {metrics_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement du LSTM.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Sauvegarde un profil cProfile de l'étape la plus lente.")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="Tokenise les textes bruts, sans normalisation.")
+    args = parser.parse_args(sys.argv[1:])
+    main(profile=args.profile, normalize=not args.no_normalize)
@@ -1,87 +1,138 @@
 import os
-import pickle
-import json
+import sys
+import argparse
 import numpy as np
 import warnings
-from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.metrics import classification_report, accuracy_score, precision_score, recall_score, f1_score
-from app.models.utils import load_data, MODEL_DIR
+from app.models.utils import load_labels, split_mask, data_fingerprint, iter_texts, DATA_PATH, MODEL_DIR
+from app.models.bundle import save_bundle, save_metrics
+from app.models.profiling import StageProfiler
+from app.models.cross_validation import cross_validate_model
+from app.models.text_normalizer import normalizer_metadata
 
 # Ignorer les avertissements UndefinedMetricWarning dans classification_report
 warnings.filterwarnings("ignore", category=UserWarning)
 
 
-def main():
+def main(profile=False, cv_folds=0, normalize=True):
+    """
+    Entraîne le Naive Bayes et enregistre, pour chaque étape, temps réel, temps CPU
+    et pic mémoire dans le JSON des métriques.
+
+    Args:
+        profile (bool): Sauvegarde le profil cProfile de l'étape la plus lente.
+        cv_folds (int): Si non nul, ajoute une validation croisée stratifiée en k folds.
+        normalize (bool): Normalise les textes (arabizi, accents, lettres répétées) avant
+            la vectorisation ; le réglage est enregistré dans le bundle pour la production.
+    """
     print("🔹 Entraînement Naive Bayes...")
-    df = load_data()
+    profiler = StageProfiler(profile=profile)
+
+    # Seuls les labels sont chargés en mémoire, les textes sont relus en flux
+    with profiler.stage("load"):
+        labels = load_labels()
+        data_sha256 = data_fingerprint() if labels else None
 
-    if df is None or df.empty:
-        print("Abandon de l'entraînement car les données n'ont pas pu être chargées.")
-        return
+    if not labels:
+        raise RuntimeError("Abandon de l'entraînement car les données n'ont pas pu être chargées.")
 
     # Créer un dossier indépendant pour ce modèle
     NAIVE_BAYES_DIR = os.path.join(MODEL_DIR, "naive_bayes")
     os.makedirs(NAIVE_BAYES_DIR, exist_ok=True)
 
-    # Encoder les labels et sauvegarder l'encodeur
-    label_encoder = LabelEncoder()
-    df["label_enc"] = label_encoder.fit_transform(df["label"])
-    pickle.dump(label_encoder, open(os.path.join(NAIVE_BAYES_DIR, "label_encoder.pkl"), "wb"))
+    # Encoder les labels
+    with profiler.stage("encode"):
+        label_encoder = LabelEncoder()
+        y = label_encoder.fit_transform(labels)
 
-    # Train/Test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        df["text"], df["label_enc"], test_size=0.2, random_state=42
-    )
+    # Train/Test split (même découpage que train_test_split, appliqué en flux)
+    with profiler.stage("split"):
+        test_mask = split_mask(len(y), test_size=0.2, random_state=42)
+        y_train, y_test = y[~test_mask], y[test_mask]
 
-    # Vectorisation TF-IDF et sauvegarde du vectoriseur
-    vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
-    X_train_vec = vectorizer.fit_transform(X_train)
-    X_test_vec = vectorizer.transform(X_test)
-    pickle.dump(vectorizer, open(os.path.join(NAIVE_BAYES_DIR, "tfidf_vectorizer.pkl"), "wb"))
+    # Vectorisation TF-IDF en flux
+    with profiler.stage("vectorize"):
+        vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2))
+        X_train_vec = vectorizer.fit_transform(iter_texts(~test_mask, normalize=normalize))
+        X_test_vec = vectorizer.transform(iter_texts(test_mask, normalize=normalize))
 
     # Entraînement du modèle
-    model = MultinomialNB()
-    model.fit(X_train_vec, y_train)
-
-    y_pred = model.predict(X_test_vec)
-
-    # Calcul des métriques
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred, average="weighted", zero_division=0)
-    recall = recall_score(y_test, y_pred, average="weighted", zero_division=0)
-    f1 = f1_score(y_test, y_pred, average="weighted", zero_division=0)
-
-    print(f"Accuracy: {accuracy:.4f}")
-    print(f"Precision: {precision:.4f}")
-    print(f"Recall: {recall:.4f}")
-    print(f"F1-score: {f1:.4f}")
-
-    unique_labels = np.unique(y_test)
-    target_names_filtered = label_encoder.inverse_transform(unique_labels)
-    print(classification_report(y_test, y_pred, labels=unique_labels, target_names=target_names_filtered,
-                                zero_division=0))
-
-    # Sauvegarder le modèle dans son propre dossier
-    model_path = os.path.join(NAIVE_BAYES_DIR, "naive_bayes.pkl")
-    with open(model_path, "wb") as f:
-        pickle.dump(model, f)
+    with profiler.stage("fit"):
+        model = MultinomialNB()
+        model.fit(X_train_vec, y_train)
+
+    with profiler.stage("evaluate"):
+        y_pred = model.predict(X_test_vec)
+
+        # Calcul des métriques
+        accuracy = accuracy_score(y_test, y_pred)
+        precision = precision_score(y_test, y_pred, average="weighted", zero_division=0)
+        recall = recall_score(y_test, y_pred, average="weighted", zero_division=0)
+        f1 = f1_score(y_test, y_pred, average="weighted", zero_division=0)
+
+        print(f"Accuracy: {accuracy:.4f}")
+        print(f"Precision: {precision:.4f}")
+        print(f"Recall: {recall:.4f}")
+        print(f"F1-score: {f1:.4f}")
+
+        unique_labels = np.unique(y_test)
+        target_names_filtered = label_encoder.inverse_transform(unique_labels)
+        print(classification_report(y_test, y_pred, labels=unique_labels, target_names=target_names_filtered,
+                                    zero_division=0))
+
+    metrics = {
+        "accuracy": accuracy,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1
+    }
+
+    # Validation croisée stratifiée, folds entraînés en parallèle
+    if cv_folds:
+        with profiler.stage("cross_validate"):
+            metrics["cross_validation"] = cross_validate_model(model, n_splits=cv_folds, normalize=normalize)
+
+    # Sauvegarder le modèle, le vectoriseur et l'encodeur dans un bundle versionné
+    with profiler.stage("save"):
+        bundle_path = save_bundle(
+            "naive_bayes",
+            {"label_encoder": label_encoder, "vectorizer": vectorizer, "model": model},
+            metadata={
+                "data_path": DATA_PATH,
+                # Identifie l'ensemble de test (split_mask, test_size=0.2, random_state=42) pour compare_models
+                "data_sha256": data_sha256,
+                "n_samples": len(y),
+                "classes": list(label_encoder.classes_),
+                "vectorizer_params": {k: v for k, v in vectorizer.get_params().items() if k != "vocabulary"},
+                "model_params": model.get_params(),
+                "text_normalization": normalizer_metadata(normalize),
+            },
+            metrics=metrics,
+            model_dir=MODEL_DIR,
+        )
+
+    profiler.print_summary()
+    metrics["profiling"] = profiler.report()
+    profiler.dump_slowest_profile(NAIVE_BAYES_DIR, "naive_bayes")
 
     # Sauvegarder les métriques dans le même dossier
     metrics_path = os.path.join(NAIVE_BAYES_DIR, "metrics_naive_bayes.json")
-    with open(metrics_path, "w") as f:
-        json.dump({
-            "accuracy": accuracy,
-            "precision": precision,
-            "recall": recall,
-            "f1_score": f1
-        }, f, indent=4)
-
-    print(f"✅ Naive Bayes entraîné et sauvegardé.")
+    save_metrics(metrics_path, metrics)
+
+    print(f"✅ Naive Bayes entraîné et sauvegardé dans {bundle_path}.")
     print(f"📊 Métriques sauvegardées dans {metrics_path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Entraînement du Naive Bayes.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Sauvegarde un profil cProfile de l'étape la plus lente.")
+    parser.add_argument("--cv", type=int, default=0, metavar="K",
+                        help="Validation croisée stratifiée en K folds, en parallèle.")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="Vectorise les textes bruts, sans normalisation.")
+    args = parser.parse_args(sys.argv[1:])
+    main(profile=args.profile, cv_folds=args.cv, normalize=not args.no_normalize)
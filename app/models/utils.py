@@ -1,18 +1,177 @@
 import os
 import json
+import hashlib
+import numpy as np
 import pandas as pd
+from app.models.text_normalizer import normalize_text
 
 DATA_PATH = os.path.join("app", "data", "training", "synthetic_conversations.json")
 MODEL_DIR = os.path.join("app", "models", "saved")
 
+# Taille des blocs lus sur disque par le parseur JSON incrémental
+READ_BUFFER_SIZE = 1 << 16
+
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 
-def load_data():
+def iter_json_array(f, buffer_size=READ_BUFFER_SIZE):
+    """
+    Itère les éléments d'un tableau JSON sans charger tout le fichier.
+
+    Le fichier est lu par blocs de `buffer_size` caractères et chaque élément est
+    décodé dès qu'il est complet ; seul l'élément en cours reste en mémoire.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    read_size = buffer_size
+    eof = False
+
+    while True:
+        # Avancer après les espaces et séparateurs
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                if not started:
+                    return
+                raise json.JSONDecodeError("Tableau JSON non terminé", buffer, pos)
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        if not started:
+            if buffer[pos] != "[":
+                raise json.JSONDecodeError("Un tableau JSON est attendu", buffer, pos)
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Élément incomplet : lire davantage (en doublant pour les gros éléments)
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            read_size *= 2
+            continue
+
+        read_size = buffer_size
+        yield obj
+        pos = end
+        if pos > buffer_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_conversations(path=DATA_PATH):
+    """
+    Itère les conversations d'un fichier JSON (tableau) ou JSONL (une par ligne).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+def conversation_text(conv):
+    """Concatène tous les messages d'une conversation pour en faire un seul document texte."""
+    return " ".join([m["text"] for m in conv["messages"]])
+
+
+def iter_samples(path=DATA_PATH, normalize=False):
+    """
+    Itère les paires (texte, label) du dataset sans le matérialiser.
+
+    Les conversations marquées comme doublons par la déduplication sont ignorées.
+    Avec `normalize`, les textes passent par normalize_text, comme en production.
+    """
+    for conv in iter_conversations(path):
+        if conv.get("duplicate_of"):
+            continue
+        text = conversation_text(conv)
+        yield (normalize_text(text) if normalize else text), conv["status"]
+
+
+def iter_texts(mask=None, path=DATA_PATH, normalize=False):
+    """
+    Itère les textes du dataset dans l'ordre du fichier.
+
+    Args:
+        mask (np.ndarray, optional): Booléens indiquant les lignes à conserver.
+        normalize (bool): Normalise les textes (voir text_normalizer).
+    """
+    for i, (text, _) in enumerate(iter_samples(path)):
+        if mask is None or mask[i]:
+            yield normalize_text(text) if normalize else text
+
+
+def data_fingerprint(path=DATA_PATH):
+    """
+    Empreinte des paires (texte, label) du dataset, enregistrée dans le bundle de chaque
+    modèle : avec la même empreinte, split_mask redonne exactement le même ensemble de test.
+    Insensible à la mise en forme du fichier (indentation, champs autres que les messages).
+    """
+    digest = hashlib.sha256()
+    for text, label in iter_samples(path):
+        digest.update(json.dumps([text, label], ensure_ascii=False).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def load_labels(path=DATA_PATH):
+    """
+    Charge uniquement les labels du dataset (les textes ne sont pas conservés).
+
+    Returns:
+        list: Les labels dans l'ordre du fichier, ou None si le fichier est illisible.
+    """
+    try:
+        return [label for _, label in iter_samples(path)]
+    except FileNotFoundError:
+        print(f"❌ Erreur : Le fichier de données '{path}' n'a pas été trouvé.")
+        return None
+    except json.JSONDecodeError:
+        print(f"❌ Erreur : Le fichier '{path}' n'est pas un JSON valide.")
+        return None
+
+
+def split_mask(n_samples, test_size=0.2, random_state=42):
+    """
+    Reproduit le découpage de `train_test_split` sous forme de masque booléen.
+
+    Le masque permet de parcourir le fichier en flux et de router chaque ligne vers
+    l'ensemble d'entraînement ou de test sans garder les textes en mémoire.
+
+    Returns:
+        np.ndarray: True pour les lignes de test.
+    """
+    from sklearn.model_selection import train_test_split
+
+    _, test_idx = train_test_split(np.arange(n_samples), test_size=test_size, random_state=random_state)
+    mask = np.zeros(n_samples, dtype=bool)
+    mask[test_idx] = True
+    return mask
+
+
+def load_data(normalize=False):
     """Charge les données du fichier JSON et les retourne sous forme de DataFrame."""
     try:
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        df = pd.DataFrame.from_records(iter_samples(DATA_PATH, normalize=normalize), columns=["text", "label"])
     except FileNotFoundError:
         print(f"❌ Erreur : Le fichier de données '{DATA_PATH}' n'a pas été trouvé.")
         return None
@@ -20,11 +179,4 @@ def load_data():
         print(f"❌ Erreur : Le fichier '{DATA_PATH}' n'est pas un JSON valide.")
         return None
 
-    rows = []
-    for conv in data:
-        # Concaténer tous les messages d'une conversation pour en faire un seul document texte
-        text = " ".join([m["text"] for m in conv["messages"]])
-        rows.append({"text": text, "label": conv["status"]})
-
-    df = pd.DataFrame(rows)
-    return df
\ No newline at end of file
+    return df
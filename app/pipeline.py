@@ -0,0 +1,407 @@
+import os
+import sys
+import json
+import time
+import argparse
+import hashlib
+import importlib
+import importlib.util
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import config
+from config import (
+    CONTACTS_CSV, CONVERSATIONS_CSV, MESSAGES_CSV, DATA_PROCESSED, DATA_TRAINING, PIPELINE_DIR, PIPELINE_WORKERS
+)
+from app.services.storage import find_existing, table_files
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'saved')
+
+STATE_PATH = os.path.join(PIPELINE_DIR, 'state.json')
+REPORT_PATH = os.path.join(PIPELINE_DIR, 'last_run.json')
+
+
+# --- Étapes du pipeline -----------------------------------------------------------
+# Chaque étape appelle le point d'entrée de son module, qui lève une exception en cas
+# d'échec ; une sortie absente après l'exécution est aussi considérée comme un échec.
+
+class Stage:
+    """
+    Étape du DAG.
+
+    Args:
+        entry: Point d'entrée exécuté, "module:fonction" ; le module entre dans l'empreinte.
+        kwargs: Arguments du point d'entrée lus dans config.py au lancement, sous la
+            forme {argument: réglage} ; ces réglages entrent aussi dans l'empreinte.
+        inputs / outputs: Chemins de fichiers, ou couples (stem, kind) résolus avec
+            storage.find_existing (la sortie peut être en Parquet, JSONL ou JSON).
+        after: Étapes qui doivent être terminées avant celle-ci (si elles font partie
+            de l'exécution).
+        modules: Modules dont le code source entre dans l'empreinte de l'étape :
+            modifier le code relance l'étape.
+        params: Noms des réglages de config.py qui entrent aussi dans l'empreinte.
+        default: Étape exécutée quand aucune étape n'est demandée explicitement.
+        exclusive: L'étape tourne seule : elle attend qu'aucune autre étape ne tourne, et
+            aucune autre ne démarre avant sa fin (entraînements, qui occupent tous les
+            cœurs et dont les mesures de StageProfiler portent sur tout le processus).
+    """
+
+    def __init__(self, name, entry, inputs=(), outputs=(), after=(), modules=(), params=(), kwargs=None,
+                 default=True, exclusive=False):
+        self.name = name
+        self.entry = entry
+        self.kwargs = dict(kwargs or {})
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.modules = list(dict.fromkeys([entry.split(':')[0], *modules]))
+        self.params = list(dict.fromkeys([*params, *self.kwargs.values()]))
+        self.default = default
+        self.exclusive = exclusive
+
+    def run(self):
+        module_name, func_name = self.entry.split(':')
+        func = getattr(importlib.import_module(module_name), func_name)
+        func(**{arg: getattr(config, param) for arg, param in self.kwargs.items()})
+
+
+def _processed(stem):
+    return os.path.join(DATA_PROCESSED, stem)
+
+
+SYNTHETIC_DATA = os.path.join(DATA_TRAINING, 'synthetic_conversations.json')
+CLEANED_TRAINING_DATA = os.path.join(DATA_TRAINING, 'cleaned_training_data.json')
+TRAINING_DATASET = (os.path.join(DATA_TRAINING, 'training_dataset'), 'records')
+STORAGE_PARAMS = ['TABULAR_STORAGE_FORMAT', 'NESTED_STORAGE_FORMAT', 'INCREMENTAL_PIPELINE', 'SQLITE_STORE']
+# Le modèle LLM entre dans l'empreinte des étapes qui l'appellent (pas le code du client, qui n'est que le transport)
+LLM_PARAMS = ['LLM_MODEL']
+# La graine fixe les exemples tirés dans les prompts de génération
+LLM_SAMPLING_PARAMS = [*LLM_PARAMS, 'LLM_SAMPLE_SEED']
+TRAINING_STAGES = ['train_random_forest', 'train_naive_bayes', 'train_logistic_regression', 'train_lstm']
+
+
+def _training_stage(name, kwargs=None, params=()):
+    model_name = name[len('train_'):]
+    return Stage(name, f'app.models.{name}:main', inputs=[SYNTHETIC_DATA],
+                 outputs=[os.path.join(MODEL_DIR, model_name, 'CURRENT')],
+                 after=['deduplicate_training_data'],
+                 modules=['app.models.utils', 'app.models.bundle', 'app.models.text_normalizer'],
+                 kwargs={'normalize': 'TEXT_NORMALIZATION', **(kwargs or {})}, params=params, exclusive=True)
+
+
+TRAINING_KWARGS = {'cv_folds': 'TRAINING_CV_FOLDS'}
+
+
+# Le DAG : clean → merge → prepare → nettoyage LLM → augmentation → déduplication → entraînement
+STAGES = {stage.name: stage for stage in [
+    Stage('clean_contacts', 'app.services.clean_contacts:clean_contacts',
+          inputs=[CONTACTS_CSV], outputs=[(_processed('contacts_clean'), 'table')],
+          modules=['app.services.typed_tables'], params=STORAGE_PARAMS),
+    Stage('clean_conversations', 'app.services.clean_conversations:clean_conversations',
+          inputs=[CONVERSATIONS_CSV], outputs=[(_processed('conversations_clean'), 'table')],
+          modules=['app.services.typed_tables'], params=STORAGE_PARAMS),
+    Stage('clean_messages', 'app.services.clean_messages:clean_messages',
+          inputs=[MESSAGES_CSV],
+          outputs=[(_processed('messages_clean'), 'table'), _processed('messages_quarantine.jsonl')],
+          modules=['app.services.validation'], params=STORAGE_PARAMS),
+    Stage('merge_data', 'app.services.merge_all:run',
+          inputs=[(_processed('conversations_clean'), 'table'), (_processed('messages_clean'), 'table')],
+          outputs=[(_processed('merged_data'), 'records')],
+          after=['clean_contacts', 'clean_conversations', 'clean_messages'],
+          modules=['app.services.store'], params=STORAGE_PARAMS),
+    Stage('prepare_training_dataset', 'app.services.prepare_training_dataset:run',
+          inputs=[(_processed('merged_data'), 'records')], outputs=[TRAINING_DATASET],
+          after=['merge_data'], modules=['app.services.store'], params=STORAGE_PARAMS),
+    Stage('clean_training_data', 'app.services.clean_training_data:run',
+          inputs=[TRAINING_DATASET], outputs=[CLEANED_TRAINING_DATA],
+          after=['prepare_training_dataset'],
+          modules=['app.services.precleaning', 'app.services.batching'],
+          params=[*LLM_PARAMS, 'LLM_PRECLEANING', 'LLM_BATCH_TOKENS']),
+    # Génération initiale : uniquement sur demande, elle remplace le dataset synthétique
+    Stage('generate_synthetic_data', 'app.services.generate_synthetic_data:run',
+          inputs=[TRAINING_DATASET], outputs=[SYNTHETIC_DATA],
+          after=['prepare_training_dataset'], params=LLM_SAMPLING_PARAMS, default=False),
+    # L'augmentation complète le dataset synthétique existant : elle n'est relancée que si
+    # les données réelles nettoyées changent, pas quand la déduplication réécrit sa sortie
+    Stage('augment_synthetic_data', 'app.services.augment_synthetic_data:run',
+          inputs=[CLEANED_TRAINING_DATA], outputs=[SYNTHETIC_DATA],
+          after=['clean_training_data', 'generate_synthetic_data'],
+          params=[*LLM_SAMPLING_PARAMS, 'AUGMENTATION_TARGET'], kwargs={'mode': 'AUGMENTATION_MODE'}),
+    Stage('deduplicate_training_data', 'app.services.deduplicate_training_data:run',
+          inputs=[CLEANED_TRAINING_DATA, SYNTHETIC_DATA], outputs=[SYNTHETIC_DATA],
+          after=['augment_synthetic_data'],
+          kwargs={'mode': 'DEDUPLICATION_MODE', 'threshold': 'DEDUPLICATION_THRESHOLD'}),
+    _training_stage('train_random_forest', TRAINING_KWARGS),
+    _training_stage('train_naive_bayes', TRAINING_KWARGS),
+    _training_stage('train_logistic_regression', {**TRAINING_KWARGS, 'warm_start': 'LOGISTIC_REGRESSION_WARM_START'},
+                    ['LOGISTIC_REGRESSION_MAX_NEW_TERMS']),
+    _training_stage('train_lstm'),
+]}
+
+# Groupes d'étapes utilisables à la place des noms d'étapes
+GROUPS = {
+    'clean_data': ['clean_contacts', 'clean_conversations', 'clean_messages'],
+    'train': TRAINING_STAGES,
+}
+
+
+def expand_stages(names=None):
+    """
+    Étapes à exécuter, dans l'ordre du DAG : les groupes sont développés, et sans
+    nom demandé toutes les étapes par défaut sont retenues.
+
+    Raises:
+        KeyError: Étape ou groupe inconnu.
+    """
+    if not names:
+        return [name for name, stage in STAGES.items() if stage.default]
+    unknown = [name for name in names if name not in STAGES and name not in GROUPS]
+    if unknown:
+        raise KeyError(unknown)
+    selected = {stage for name in names for stage in GROUPS.get(name, [name])}
+    return [name for name in STAGES if name in selected]
+
+
+def _ancestors(name, seen=None):
+    seen = set() if seen is None else seen
+    for parent in STAGES[name].after:
+        if parent not in seen:
+            seen.add(parent)
+            _ancestors(parent, seen)
+    return seen
+
+
+# --- Empreintes des entrées -------------------------------------------------------
+
+class _Fingerprints:
+    """
+    Hash SHA-256 du contenu des fichiers. Un fichier dont la taille et la date de
+    modification n'ont pas changé n'est pas relu : son hash est repris de l'état.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self._lock = threading.Lock()
+
+    def file(self, path):
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            known = self.files.get(path)
+        if known and known['signature'] == signature:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        with self._lock:
+            self.files[path] = {'signature': signature, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def stage(self, stage):
+        """Empreinte d'une étape : contenu de ses entrées, code source et réglages."""
+        digest = hashlib.sha256()
+        for spec in stage.inputs:
+            path = _resolve(spec)
+            # Une table Parquet comprend aussi ses parties ajoutées par les exécutions incrémentales
+            content = '+'.join(self.file(file_path) for file_path in table_files(path)) if path else 'absent'
+            digest.update(f"{_label(spec)}={content};".encode('utf-8'))
+        for module in stage.modules:
+            spec = importlib.util.find_spec(module)
+            source = spec.origin if spec else None
+            digest.update(f"{module}={self.file(source) if source else 'absent'};".encode('utf-8'))
+        for param in stage.params:
+            digest.update(f"{param}={getattr(config, param, None)!r};".encode('utf-8'))
+        return digest.hexdigest()
+
+
+def _resolve(spec):
+    """Chemin existant d'une entrée ou d'une sortie, ou None."""
+    if isinstance(spec, tuple):
+        return find_existing(*spec)
+    return spec if os.path.exists(spec) else None
+
+
+def _label(spec):
+    return os.path.relpath(spec[0] if isinstance(spec, tuple) else spec, config.BASE_DIR)
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'stages': {}, 'files': {}}
+
+
+def _save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# --- Exécution --------------------------------------------------------------------
+
+def run_pipeline(stages=None, force=False, workers=PIPELINE_WORKERS, dry_run=False, on_stage_end=None,
+                 state_path=STATE_PATH, report_path=REPORT_PATH):
+    """
+    Exécute les étapes demandées selon le DAG.
+
+    Une étape démarre dès que celles dont elle dépend (parmi les étapes demandées)
+    sont terminées ; les étapes indépendantes tournent en parallèle dans un pool de
+    `workers` threads. Une étape dont l'empreinte (entrées, code, réglages) est
+    identique à celle de sa dernière exécution réussie, et dont les sorties existent,
+    est ignorée, sauf si `force` est vrai. Si une étape échoue, celles qui en
+    dépendent ne sont pas lancées.
+
+    Les étapes exclusives (les entraînements) tournent une à une, sans autre étape à
+    côté : les mesures de leur rapport de profilage (temps CPU, mémoire résidente)
+    portent sur tout le processus et ne sont valables qu'à cette condition.
+
+    Args:
+        on_stage_end (callable, optional): Appelée avec la ligne du rapport de chaque étape terminée.
+
+    Returns:
+        list: Rapport par étape (statut, durée, raison).
+    """
+    selected = expand_stages(stages)
+    blockers = {name: _ancestors(name) & set(selected) for name in selected}
+    state = load_state(state_path)
+    fingerprints = _Fingerprints(state.setdefault('files', {}))
+    state_lock = threading.Lock()
+    report = {name: {'stage': name, 'status': 'pending', 'seconds': None, 'reason': None} for name in selected}
+
+    # Les journaux des jobs suivent le thread : les threads du pool écrivent dans celui de l'appelant
+    router = sys.stdout if hasattr(sys.stdout, 'set_log') else None
+    caller_log = router.get_log() if router else None
+
+    def up_to_date(stage):
+        previous = state['stages'].get(stage.name)
+        if force or not previous:
+            return False
+        if any(_resolve(spec) is None for spec in stage.outputs):
+            return False
+        return previous.get('fingerprint') == fingerprints.stage(stage)
+
+    def execute(name):
+        stage = STAGES[name]
+        if router:
+            router.set_log(caller_log)
+        start = time.perf_counter()
+        try:
+            if up_to_date(stage):
+                return 'cached', 0.0, "entrées inchangées"
+            if dry_run:
+                return 'would_run', 0.0, None
+            print(f"▶️ Étape {name}")
+            try:
+                stage.run()
+            except BaseException as e:
+                # Les scripts appellent parfois sys.exit : SystemExit ne doit pas arrêter le pipeline
+                traceback.print_exc(file=sys.stdout)
+                return 'failed', time.perf_counter() - start, f"{type(e).__name__}: {e}"
+            missing = [_label(spec) for spec in stage.outputs if _resolve(spec) is None]
+            if missing:
+                return 'failed', time.perf_counter() - start, f"sorties absentes : {', '.join(missing)}"
+            # L'empreinte est prise après l'exécution : une étape qui réécrit l'une de ses
+            # entrées (déduplication) n'est pas relancée la fois suivante pour autant
+            fingerprint = fingerprints.stage(stage)
+            with state_lock:
+                state['stages'][name] = {'fingerprint': fingerprint,
+                                         'finished_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+                _save_json(state_path, state)
+            return 'succeeded', time.perf_counter() - start, None
+        finally:
+            if router:
+                router.set_log(None)
+
+    pending = list(selected)
+    running = {}
+    total_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="stage") as executor:
+        while pending or running:
+            for name in list(pending):
+                statuses = [report[blocker]['status'] for blocker in blockers[name]]
+                if any(status in ('failed', 'blocked') for status in statuses):
+                    pending.remove(name)
+                    report[name].update(status='blocked', reason="une étape précédente a échoué")
+                    if on_stage_end:
+                        on_stage_end(dict(report[name]))
+                elif all(status not in ('pending', 'running') for status in statuses):
+                    # Une étape exclusive attend que le pool soit vide, et le bloque pendant qu'elle tourne
+                    if any(STAGES[other].exclusive for other in running.values()) or (
+                            STAGES[name].exclusive and running):
+                        continue
+                    pending.remove(name)
+                    report[name]['status'] = 'running'
+                    running[executor.submit(execute, name)] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                status, seconds, reason = future.result()
+                report[name].update(status=status, seconds=round(seconds, 3), reason=reason)
+                if on_stage_end:
+                    on_stage_end(dict(report[name]))
+
+    rows = [report[name] for name in selected]
+    if not dry_run:
+        _save_json(report_path, {'finished_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                                 'seconds': round(time.perf_counter() - total_start, 3), 'stages': rows})
+    print_report(rows, time.perf_counter() - total_start)
+    return rows
+
+
+STATUS_LABELS = {
+    'succeeded': "✅ exécutée",
+    'cached': "⏭️ à jour",
+    'would_run': "🔜 à exécuter",
+    'failed': "❌ échec",
+    'blocked': "⛔ bloquée",
+}
+
+
+def print_report(rows, total_seconds):
+    """Affiche la durée et le statut de chaque étape."""
+    width = max(len(row['stage']) for row in rows) if rows else 0
+    print("\n📋 Rapport du pipeline")
+    for row in rows:
+        seconds = f"{row['seconds']:8.2f} s" if row['seconds'] else " " * 10
+        reason = f"  ({row['reason']})" if row['reason'] and row['status'] != 'cached' else ""
+        print(f"  {row['stage']:<{width}}  {seconds}  {STATUS_LABELS.get(row['status'], row['status'])}{reason}")
+    print(f"⏱️ Durée totale : {total_seconds:.2f} s")
+
+
+def failed_stages(rows):
+    return [row['stage'] for row in rows if row['status'] in ('failed', 'blocked')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Exécute le pipeline de données (nettoyage → fusion → préparation → nettoyage LLM → "
+                    "augmentation → entraînement) en sautant les étapes à jour."
+    )
+    parser.add_argument('stages', nargs='*',
+                        help=f"Étapes ou groupes à exécuter (par défaut : toutes les étapes par défaut). "
+                             f"Groupes : {', '.join(GROUPS)}")
+    parser.add_argument('--force', action='store_true', help="Relance les étapes même si leurs entrées n'ont pas changé")
+    parser.add_argument('--workers', type=int, default=PIPELINE_WORKERS, help="Étapes exécutées simultanément")
+    parser.add_argument('--dry-run', action='store_true', help="Indique les étapes qui seraient exécutées")
+    parser.add_argument('--list', action='store_true', help="Liste les étapes et leurs dépendances")
+    args = parser.parse_args()
+
+    if args.list:
+        for stage in STAGES.values():
+            after = f" ← {', '.join(stage.after)}" if stage.after else ""
+            print(f"{stage.name}{after}{'' if stage.default else '  (sur demande)'}")
+        sys.exit(0)
+    try:
+        results = run_pipeline(args.stages, force=args.force, workers=args.workers, dry_run=args.dry_run)
+    except KeyError as e:
+        print(f"❌ Étapes inconnues : {e.args[0]}")
+        sys.exit(2)
+    sys.exit(1 if failed_stages(results) else 0)
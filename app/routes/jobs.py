@@ -0,0 +1,53 @@
+from flask import Blueprint, current_app, jsonify, request
+from app.jobs import JobError
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def _runner():
+    return current_app.extensions['job_runner']
+
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Lance un job en arrière-plan.
+    Corps JSON : {"tasks": ["train_logistic_regression", ...]} ou {"task": "..."},
+    avec "force": true pour relancer les étapes dont les entrées n'ont pas changé.
+    """
+    data = request.get_json(silent=True) or {}
+    tasks = data.get('tasks') or ([data['task']] if data.get('task') else [])
+    try:
+        job = _runner().submit(tasks, force=bool(data.get('force')))
+    except JobError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(job), 202
+
+
+@jobs_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Liste les jobs, du plus récent au plus ancien."""
+    return jsonify(_runner().list())
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """État et progression d'un job."""
+    job = _runner().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable."}), 404
+    return jsonify(job)
+
+
+@jobs_bp.route('/jobs/<job_id>/logs', methods=['GET'])
+def get_job_logs(job_id):
+    """
+    Journal d'un job. Le paramètre `offset` permet de ne récupérer que la suite
+    du journal lors d'un suivi par interrogations successives.
+    """
+    runner = _runner()
+    job = runner.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job introuvable."}), 404
+    log, offset = runner.read_log(job_id, request.args.get('offset', 0, type=int))
+    return jsonify({"id": job_id, "status": job["status"], "log": log, "offset": offset})
@@ -1,6 +1,8 @@
 # Mettez ces imports au début du fichier
 from flask import render_template, request, jsonify, Blueprint
 from app.models.ChatBot.chatbot import Chatbot
+from app.services.store import Store, store_available
+from config import CHATBOT_CONTEXT_MESSAGES
 
 # Le paramètre 'template_folder' est ajouté pour indiquer à Flask
 # de chercher le dossier 'templates' deux niveaux au-dessus du fichier actuel.
@@ -15,6 +17,34 @@ except Exception as e:
     print(f"Échec de l'initialisation du chatbot : {e}")
     chatbot = None
 
+
+def reload_chatbot(job):
+    """
+    Recharge le chatbot quand un job vient d'entraîner son modèle : le nouveau
+    bundle est chargé à côté de l'ancien, puis la référence est remplacée, sans
+    redémarrer le serveur ni interrompre les requêtes en cours.
+    """
+    global chatbot
+    from app.jobs import trained_models
+
+    model_name = chatbot.model_name if chatbot is not None else "logistic_regression"
+    if model_name not in trained_models(job):
+        return
+    try:
+        chatbot = Chatbot(model_name=model_name)
+        print(f"🔄 Chatbot rechargé avec le nouveau modèle '{model_name}'.")
+    except (Exception, SystemExit) as e:
+        # Chatbot appelle sys.exit si le modèle est illisible : on garde l'ancien
+        print(f"⚠️ Rechargement du chatbot impossible, l'ancien modèle reste actif : {e}")
+
+def contact_context(contact_id):
+    """Textes des derniers messages envoyés par un contact, lus via l'index du store."""
+    if not contact_id or not store_available('messages'):
+        return []
+    with Store() as store:
+        messages = store.contact_messages(contact_id, limit=CHATBOT_CONTEXT_MESSAGES, direction='incoming')
+    return [message['text'] for message in messages if message.get('message_type') == 'text' and message.get('text')]
+
 @main_bp.route('/')
 def index():
     """Route pour la page d'accueil (interface du chatbot)."""
@@ -25,8 +55,12 @@ def get_chatbot_response():
     """
     Route API pour obtenir une réponse du chatbot.
     Reçoit un message du client et renvoie la réponse prédite.
+    Si `contact_id` est fourni, les derniers messages du contact (lus dans le store)
+    sont joints au message pour classer l'intention sur la conversation.
     """
-    if chatbot is None:
+    # Référence locale : le chatbot peut être remplacé par un job pendant la requête
+    current_chatbot = chatbot
+    if current_chatbot is None:
         return jsonify({"response": "Le chatbot est en maintenance. Veuillez réessayer plus tard."}), 503
 
     # Récupérer le message du client depuis la requête JSON
@@ -36,8 +70,10 @@ def get_chatbot_response():
     if not client_message:
         return jsonify({"response": "Message invalide."}), 400
 
+    context = contact_context(data.get('contact_id'))
+
     # Obtenir la réponse du chatbot
-    bot_response = chatbot.get_response(client_message)
+    bot_response = current_chatbot.get_response(client_message, context=context)
 
     # Renvoyer la réponse au format JSON
     return jsonify({"response": bot_response})
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+import json
+from config import LLM_BATCH_TOKENS, LLM_BATCH_TOKENS_MIN, LLM_BATCH_TOKENS_MAX, LLM_TARGET_LATENCY
+
+# Suffixe du plan de lots enregistré à côté d'une sortie
+PLAN_SUFFIX = '.batches.json'
+
+
+def pack(costs, budget, start=0):
+    """
+    Regroupe des éléments consécutifs (coût estimé en tokens de chacun) en lots d'au
+    plus `budget` tokens. Un élément plus gros que le budget forme un lot à lui seul.
+
+    Returns:
+        list: Lots sous forme de couples (début, fin) d'indices.
+    """
+    spans = []
+    first, total = start, 0
+    for index in range(start, start + len(costs)):
+        cost = costs[index - start]
+        if index > first and total + cost > budget:
+            spans.append((first, index))
+            first, total = index, 0
+        total += cost
+    if first < start + len(costs):
+        spans.append((first, start + len(costs)))
+    return spans
+
+
+class AdaptiveBudget:
+    """
+    Budget de tokens par requête ajusté en AIMD : il augmente d'un pas fixe après
+    chaque réponse rapide (latence sous `target_latency`), reste stable après une
+    réponse lente, et est divisé par deux après un dépassement de délai ou une
+    réponse tronquée.
+    """
+
+    def __init__(self, budget=LLM_BATCH_TOKENS, min_budget=LLM_BATCH_TOKENS_MIN, max_budget=LLM_BATCH_TOKENS_MAX,
+                 target_latency=LLM_TARGET_LATENCY):
+        self.budget = budget
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.target_latency = target_latency
+        self.step = max(1, budget // 4)
+        self.increases = 0
+        self.decreases = 0
+
+    def success(self, latency):
+        if latency is not None and latency <= self.target_latency and self.budget < self.max_budget:
+            self.budget = min(self.max_budget, self.budget + self.step)
+            self.increases += 1
+
+    def overload(self):
+        self.budget = max(self.min_budget, self.budget // 2)
+        self.decreases += 1
+
+
+def _plan_path(output_path):
+    return os.path.splitext(output_path)[0] + PLAN_SUFFIX
+
+
+def load_plan(output_path, signature):
+    """
+    Découpage en lots de la dernière exécution complète pour les mêmes entrées, ou None.
+    Le réutiliser redonne les mêmes prompts, donc des réponses servies par le cache.
+    """
+    try:
+        with open(_plan_path(output_path), 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if plan.get('signature') != signature:
+        return None
+    return [tuple(span) for span in plan['batches']]
+
+
+def save_plan(output_path, signature, spans):
+    """Enregistre le découpage en lots d'une exécution (écriture atomique)."""
+    path = _plan_path(output_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'batches': sorted(spans)}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+
+# Suffixes des fichiers de reprise associés à une sortie
+CHECKPOINT_SUFFIX = '.checkpoint.jsonl'
+PROGRESS_SUFFIX = '.checkpoint.progress.json'
+
+
+def checkpoint_signature(*parts):
+    """Empreinte des paramètres d'une exécution : une reprise n'est valable que pour la même empreinte."""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class FailedBatchesError(RuntimeError):
+    """Des lots ont échoué : la sortie précédente est gardée, le checkpoint liste les lots à retenter."""
+
+
+class BatchCheckpoint:
+    """
+    Reprise d'une étape traitée par lots (appels au LLM) après une interruption.
+
+    Chaque lot réussi est ajouté au fichier `<sortie>.checkpoint.jsonl` (une ligne
+    par lot : identifiant et enregistrements produits), puis le marqueur de
+    progression `<sortie>.checkpoint.progress.json` est réécrit atomiquement avec
+    la taille validée du fichier, les lots terminés et la liste des lots en échec
+    à retenter. À la reprise, tout ce qui suit la taille validée (ligne écrite à
+    moitié) est tronqué ; un checkpoint d'une autre exécution (signature
+    différente) est ignoré.
+
+    Usage :
+        with BatchCheckpoint(output_path, signature) as checkpoint:
+            for batch_id in checkpoint.pending(batch_ids):
+                ...
+                checkpoint.add(batch_id, records)  # ou checkpoint.fail(batch_id, erreur)
+    """
+
+    def __init__(self, output_path, signature):
+        stem = os.path.splitext(output_path)[0]
+        self.path = stem + CHECKPOINT_SUFFIX
+        self.progress_path = stem + PROGRESS_SUFFIX
+        self.signature = signature
+        self.completed = []
+        self.failed = {}
+        self.resumed = False
+        self._size = 0
+        self._file = None
+
+    def _load_progress(self):
+        try:
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if progress.get('signature') != self.signature or not os.path.exists(self.path):
+            return None
+        return progress
+
+    def __enter__(self):
+        progress = self._load_progress()
+        if progress:
+            self.completed = progress['completed']
+            self.failed = {entry['batch']: entry for entry in progress['failed']}
+            self._size = progress['size']
+            self.resumed = bool(self.completed or self.failed)
+            self._file = open(self.path, 'r+b')
+            self._file.truncate(self._size)
+            self._file.seek(self._size)
+        else:
+            self._file = open(self.path, 'wb')
+            self._save_progress()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        return False
+
+    def _save_progress(self):
+        tmp_path = f"{self.progress_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': self.signature, 'size': self._size, 'completed': self.completed,
+                       'failed': list(self.failed.values())}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.progress_path)
+
+    def pending(self, batch_ids):
+        """Lots restant à traiter (les lots en échec d'une exécution précédente en font partie)."""
+        done = set(self.completed)
+        return [batch_id for batch_id in batch_ids if batch_id not in done]
+
+    def retry_failed(self):
+        """
+        Vide la liste des lots à retenter, pour une étape qui redécoupe elle-même les
+        éléments restants : ceux des lots en échec sont renvoyés par l'exécution courante.
+        """
+        retried = list(self.failed)
+        self.failed.clear()
+        self._save_progress()
+        return retried
+
+    def add(self, batch_id, records):
+        """Enregistre un lot réussi : la ligne est écrite et synchronisée avant le marqueur."""
+        line = json.dumps({'batch': batch_id, 'records': records}, ensure_ascii=False) + '\n'
+        self._file.write(line.encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._size = self._file.tell()
+        self.completed.append(batch_id)
+        self.failed.pop(batch_id, None)
+        self._save_progress()
+
+    def fail(self, batch_id, error, **details):
+        """Ajoute un lot à la liste des lots à retenter (à la prochaine vague ou exécution)."""
+        self.failed[batch_id] = {'batch': batch_id, 'error': str(error), **details}
+        self._save_progress()
+
+    def raise_if_failed(self):
+        """
+        Lève FailedBatchesError s'il reste des lots en échec : l'étape ne doit pas
+        remplacer sa sortie, et sa prochaine exécution les retente.
+        """
+        if self.failed:
+            batches = ", ".join(str(batch_id) for batch_id in sorted(self.failed))
+            raise FailedBatchesError(f"{len(self.failed)} lots en échec ({batches}), sortie non remplacée : "
+                                     f"relancer l'étape pour les retenter")
+
+    def records(self):
+        """Enregistrements des lots terminés, dans l'ordre des identifiants de lot."""
+        self._file.flush()
+        batches = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                batches[entry['batch']] = entry['records']
+        return [record for batch_id in sorted(batches) for record in batches[batch_id]]
+
+    def count(self):
+        return len(self.records())
+
+    def remove(self):
+        """Supprime les fichiers de reprise une fois la sortie finale écrite."""
+        for path in (self.path, self.progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def print_status(self):
+        if self.resumed:
+            print(f"♻️ Reprise : {len(self.completed)} lots déjà terminés, {len(self.failed)} lots à retenter "
+                  f"({self.path})")
+
+    def print_failures(self):
+        if self.failed:
+            batches = ", ".join(str(batch_id) for batch_id in sorted(self.failed))
+            print(f"⚠️ {len(self.failed)} lots en échec gardés pour la prochaine exécution ({batches}) : "
+                  f"{self.progress_path}")
@@ -1,52 +1,62 @@
 # app/services/clean_contacts.py
 
 import pandas as pd
-import json
 import os
-from config import CONTACTS_CSV
-
-def clean_contacts():
+import sys
+from config import CONTACTS_CSV, INCREMENTAL_PIPELINE
+from app.services.incremental import load_watermark, save_watermark, max_value
+from app.services.storage import storage_path, write_table, upsert_table
+from app.services.typed_tables import (
+    CONTACTS_SCHEMA, read_typed_csv, to_text, iter_text_chunks, max_datetime, print_memory_report
+)
+from app.services.store import write_to_store
+
+def clean_contacts(full_refresh=not INCREMENTAL_PIPELINE):
+    """
+    Nettoie le CSV et met à jour contacts_clean (Parquet, ou JSON selon la configuration).
+
+    Le CSV est chargé avec un schéma typé (catégories, dates, entiers nullables),
+    bien plus compact que des colonnes de chaînes. La sortie Parquet garde ces types ;
+    le JSON et le store SQLite restent au format texte.
+
+    En mode incrémental, seules les lignes dont une date dépasse le watermark du
+    passage précédent sont nettoyées et fusionnées (upsert) dans la sortie existante.
+    """
     print("🧹 Nettoyage de contacts.csv...")
 
     if not os.path.exists(CONTACTS_CSV):
-        print(f"❌ Fichier introuvable : {CONTACTS_CSV}")
-        return
-
-    # Colonnes attendues
-    columns = [
-        'ContactID', 'FirstName', 'LastName', 'PhoneNumber', 'Email',
-        'Country', 'Language', 'Tags', 'Status', 'Lifecycle',
-        'Assignee', 'LastInteractionTime', 'DateTimeCreated',
-        'Channels', 'Lead Source', 'State', 'Moyenne Bac',
-        'Last Degree', 'Graduation Year', 'Current Degree',
-        'Degree Sought', 'Degree Choice', 'Scholarship',
-        'University', 'Qualifying URL', 'Eligible', 'Qualifying Score'
-    ]
-
-    # Lire le CSV
-    try:
-        df = pd.read_csv(CONTACTS_CSV, header=None, dtype=str)
-        df = df.iloc[:, :len(columns)]  # Garder les bonnes colonnes
-        df.columns = columns
+        raise FileNotFoundError(f"Fichier introuvable : {CONTACTS_CSV}")
 
-        # Nettoyer
-        df.fillna('', inplace=True)
+    # Lire le CSV avec les types de chaque colonne (lignes d'en-tête écartées)
+    try:
+        df, stats = read_typed_csv(CONTACTS_CSV, CONTACTS_SCHEMA, key='ContactID')
+        print_memory_report(stats)
 
-        # Convertir les dates avec format explicite
         date_cols = ['LastInteractionTime', 'DateTimeCreated']
-        for col in date_cols:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-                df[col] = df[col].astype(str).replace('NaT', '')
 
-        # ✅ Correction ici : c'est `force_ascii`, pas `ensure_ascii`
-        output_path = os.path.join(os.path.dirname(CONTACTS_CSV), '..', 'processed', 'contacts_clean.json')
-        df.to_json(output_path, orient='records', indent=2, force_ascii=False)
+        # Sortie dans le format de stockage configuré (Parquet ou JSON)
+        output_path = storage_path(os.path.join(os.path.dirname(CONTACTS_CSV), '..', 'processed', 'contacts_clean'), 'table')
+        watermark = None if full_refresh else load_watermark(output_path)
+
+        last_activity = (watermark or {}).get('last_activity')
+        if last_activity:
+            is_new = (df[date_cols] > pd.Timestamp(last_activity)).any(axis=1)
+            inserted, updated = upsert_table(output_path, df[is_new], key='ContactID', schema=CONTACTS_SCHEMA)
+            write_to_store('contacts', to_text(df[is_new], CONTACTS_SCHEMA), backfill=iter_text_chunks(df, CONTACTS_SCHEMA))
+            print(f"🔁 Mode incrémental : {inserted} ajoutés, {updated} mis à jour depuis {last_activity}")
+        else:
+            write_table(output_path, df, CONTACTS_SCHEMA)
+            write_to_store('contacts', iter_text_chunks(df, CONTACTS_SCHEMA), full_refresh=True)
+
+        save_watermark(output_path, {
+            'last_activity': max_value([max_datetime(df, date_cols)], last_activity),
+        })
 
-        print(f"✅ contacts_clean.json généré dans {output_path}")
+        print(f"✅ {os.path.basename(output_path)} généré dans {output_path}")
 
     except Exception as e:
         print(f"❌ Erreur de lecture : {e}")
+        raise
 
 if __name__ == "__main__":
-    clean_contacts()
\ No newline at end of file
+    clean_contacts(full_refresh="--full" in sys.argv)
\ No newline at end of file
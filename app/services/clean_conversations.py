@@ -1,49 +1,62 @@
 # app/services/clean_conversations.py
 
 import pandas as pd
-import json
 import os
-from config import CONVERSATIONS_CSV
-
-def clean_conversations():
+import sys
+from config import CONVERSATIONS_CSV, INCREMENTAL_PIPELINE
+from app.services.incremental import load_watermark, save_watermark, max_value
+from app.services.storage import storage_path, write_table, upsert_table
+from app.services.typed_tables import (
+    CONVERSATIONS_SCHEMA, read_typed_csv, to_text, iter_text_chunks, max_datetime, print_memory_report
+)
+from app.services.store import write_to_store
+
+def clean_conversations(full_refresh=not INCREMENTAL_PIPELINE):
+    """
+    Nettoie le CSV et met à jour conversations_clean (Parquet, ou JSON selon la configuration).
+
+    Le CSV est chargé avec un schéma typé (catégories, dates, entiers nullables),
+    bien plus compact que des colonnes de chaînes. La sortie Parquet garde ces types ;
+    le JSON et le store SQLite restent au format texte.
+
+    En mode incrémental, seules les lignes dont une date dépasse le watermark du
+    passage précédent sont nettoyées et fusionnées (upsert) dans la sortie existante.
+    """
     print("🧹 Nettoyage de conversations-csv.csv...")
 
     if not os.path.exists(CONVERSATIONS_CSV):
-        print(f"❌ Fichier introuvable : {CONVERSATIONS_CSV}")
-        return
-
-    # Colonnes attendues
-    columns = [
-        'conversation_id', 'start_time', 'end_time', 'contact_id',
-        'assignee_id', 'incoming_messages', 'outgoing_messages',
-        'last_reply_time', 'status', 'summary', 'last_assignee_id',
-        'first_reply_time', 'total_handling_time', 'recipient_id'
-    ]
-
-    # Lire le CSV
-    try:
-        df = pd.read_csv(CONVERSATIONS_CSV, header=None, dtype=str)
-        df = df.iloc[:, :len(columns)]  # Garder les bonnes colonnes
-        df.columns = columns
+        raise FileNotFoundError(f"Fichier introuvable : {CONVERSATIONS_CSV}")
 
-        # Nettoyer
-        df.fillna('', inplace=True)
+    # Lire le CSV avec les types de chaque colonne (lignes d'en-tête écartées)
+    try:
+        df, stats = read_typed_csv(CONVERSATIONS_CSV, CONVERSATIONS_SCHEMA, key='conversation_id')
+        print_memory_report(stats)
 
-        # Convertir les dates avec format explicite
         date_cols = ['start_time', 'end_time', 'last_reply_time', 'first_reply_time']
-        for col in date_cols:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-                df[col] = df[col].astype(str).replace('NaT', '')
 
-        # ✅ Correction ici : c'est `force_ascii`, pas `ensure_ascii`
-        output_path = os.path.join(os.path.dirname(CONVERSATIONS_CSV), '..', 'processed', 'conversations_clean.json')
-        df.to_json(output_path, orient='records', indent=2, force_ascii=False)
+        # Sortie dans le format de stockage configuré (Parquet ou JSON)
+        output_path = storage_path(os.path.join(os.path.dirname(CONVERSATIONS_CSV), '..', 'processed', 'conversations_clean'), 'table')
+        watermark = None if full_refresh else load_watermark(output_path)
+
+        last_activity = (watermark or {}).get('last_activity')
+        if last_activity:
+            is_new = (df[date_cols] > pd.Timestamp(last_activity)).any(axis=1)
+            inserted, updated = upsert_table(output_path, df[is_new], key='conversation_id', schema=CONVERSATIONS_SCHEMA)
+            write_to_store('conversations', to_text(df[is_new], CONVERSATIONS_SCHEMA), backfill=iter_text_chunks(df, CONVERSATIONS_SCHEMA))
+            print(f"🔁 Mode incrémental : {inserted} ajoutés, {updated} mis à jour depuis {last_activity}")
+        else:
+            write_table(output_path, df, CONVERSATIONS_SCHEMA)
+            write_to_store('conversations', iter_text_chunks(df, CONVERSATIONS_SCHEMA), full_refresh=True)
+
+        save_watermark(output_path, {
+            'last_activity': max_value([max_datetime(df, date_cols)], last_activity),
+        })
 
-        print(f"✅ conversations_clean.json généré dans {output_path}")
+        print(f"✅ {os.path.basename(output_path)} généré dans {output_path}")
 
     except Exception as e:
         print(f"❌ Erreur de lecture : {e}")
+        raise
 
 if __name__ == "__main__":
-    clean_conversations()
\ No newline at end of file
+    clean_conversations(full_refresh="--full" in sys.argv)
\ No newline at end of file
@@ -3,76 +3,300 @@
 import pandas as pd
 import json
 import os
-from config import MESSAGES_CSV
+import re
+import sys
+import warnings
+from collections import deque
+from pandas.errors import ParserWarning
+from concurrent.futures import ProcessPoolExecutor
+from config import MESSAGES_CSV, INCREMENTAL_PIPELINE, SQLITE_STORE
+from app.services.incremental import load_watermark, save_watermark, append_json_records
+from app.services.storage import TableWriter, storage_path, append_table, export_legacy_json, iter_table_chunks
+from app.services.store import Store
+from app.services.typed_tables import MESSAGES_SCHEMA, to_text
+from app.services.validation import validate, Quarantine
 
+# Nombre de lignes lues et nettoyées à la fois (borne la mémoire utilisée)
+CHUNK_SIZE = 50_000
 
-def parse_payload(payload_str):
-    """Parse the JSON payload safely"""
+COLUMNS = [
+    'timestamp', 'conversation_id', 'sender_type', 'sender_id',
+    'message_id', 'message_type', 'direction', 'payload', 'recipient_id'
+]
+
+# Colonnes de l'export CRM (seules les 9 premières sont conservées)
+EXPORT_HEADER = [
+    'Date & Time', 'Sender ID', 'Sender Type', 'Contact ID', 'Message ID', 'Content Type',
+    'Message Type', 'Content', 'Channel ID', 'Type', 'Sub Type'
+]
+EXPORT_FIELDS = len(EXPORT_HEADER)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+NUMERIC_ID = r'\d+'
+DIRECTIONS = ['incoming', 'outgoing']
+
+QUARANTINE_PATH = os.path.join(os.path.dirname(MESSAGES_CSV), '..', 'processed', 'messages_quarantine.jsonl')
+
+# Payload texte simple : {"type":"text","text":"..."} sans échappement, guillemet ni caractère de contrôle.
+# Son texte est extrait directement, sans décodage JSON.
+PLAIN_TEXT_PAYLOAD = re.compile(r'^\{"type":"text","text":"([^"\\\x00-\x1f]+)"\}$')
+
+# Avertissement du lecteur CSV pour une ligne ayant plus de champs que la colonne supplémentaire
+SKIPPED_LINE = re.compile(r'Skipping line (\d+): (.*)')
+
+
+def _load_payload(payload_str):
+    try:
+        return json.loads(payload_str)
+    except ValueError:
+        # Fix double quotes (payloads encore échappés à la manière du CSV)
+        return json.loads(payload_str.replace('""', '"'))
+
+
+def check_payload(payload_str):
+    """
+    Parse un payload et vérifie sa forme.
+
+    Returns:
+        tuple: (texte du message, motif de rejet ou '' si le payload est valide)
+    """
     if not isinstance(payload_str, str) or not payload_str.strip():
-        return "[Vide]"
+        return "[Vide]", 'payload_vide'
 
     try:
-        # Fix double quotes
-        payload_str = payload_str.replace('""', '"')
-        data = json.loads(payload_str)
+        data = _load_payload(payload_str)
+    except ValueError:
+        return "[Erreur parsing]", 'payload_json'
+    if not isinstance(data, dict) or not isinstance(data.get("type"), str):
+        return "[Erreur parsing]", 'payload_forme'
 
-        # Case 1: Text message
-        if data.get("type") == "text":
-            return data.get("text", "").strip()
+    # Case 1: Text message
+    if data["type"] == "text":
+        text = data.get("text")
+        if not isinstance(text, str):
+            return "[Erreur parsing]", 'payload_forme'
+        return text.strip(), ''
 
-        # Case 2: Attachment
-        elif data.get("type") == "attachment":
-            file_name = data.get("attachment", {}).get("fileName", "Fichier")
-            return f"[Pièce jointe] {file_name}"
+    # Case 2: Attachment
+    elif data["type"] == "attachment":
+        attachment = data.get("attachment")
+        file_name = attachment.get("fileName", "Fichier") if isinstance(attachment, dict) else "Fichier"
+        return f"[Pièce jointe] {file_name}", ''
 
-        # Case 3: Reaction or unsupported
-        elif "reaction" in str(data) or data.get("type") == "unsupported":
-            return "[Réaction]"
+    # Case 3: Reaction or unsupported
+    elif "reaction" in str(data) or data["type"] == "unsupported":
+        return "[Réaction]", ''
 
-        # Default
-        else:
-            return "[Message non texte]"
+    # Default
+    else:
+        return "[Message non texte]", ''
+
+
+def parse_payload(payload_str):
+    """Parse the JSON payload safely"""
+    return check_payload(payload_str)[0]
+
+
+def parse_payloads(payloads):
+    """
+    Parse une colonne de payloads : les messages texte simples (l'immense majorité)
+    passent par une expression régulière, les autres par check_payload.
+
+    Returns:
+        tuple: (textes, motifs de rejet : '' pour un payload valide)
+    """
+    plain = payloads.str.extract(PLAIN_TEXT_PAYLOAD, expand=False)
+    texts = plain.str.strip().astype(object)
+    errors = pd.Series('', index=payloads.index, dtype=object)
+    others = plain.isna()
+    if others.any():
+        checked = [check_payload(payload) for payload in payloads[others]]
+        texts[others] = [text for text, _ in checked]
+        errors[others] = [error for _, error in checked]
+    return texts, errors
 
-    except Exception as e:
-        return "[Erreur parsing]"
 
-def clean_messages():
+def validate_chunk(df):
+    """
+    Valide un bloc brut de l'export, colonne par colonne : nombre de champs,
+    format des identifiants, horodatages, direction et forme des payloads.
+
+    Returns:
+        tuple: (lignes valides avec leur texte, lignes rejetées avec leurs motifs)
+    """
+    texts, payload_errors = parse_payloads(df[7])
+    header = df[4] == EXPORT_HEADER[4]
+    checks = {
+        'colonnes_en_trop': df[EXPORT_FIELDS].notna(),
+        'colonnes_manquantes': df[8].isna(),
+        'message_id': ~df[4].str.fullmatch(NUMERIC_ID, na=False),
+        'contact_id': ~df[3].str.fullmatch(NUMERIC_ID, na=False),
+        'sender_id': df[1].notna() & ~df[1].str.fullmatch(NUMERIC_ID, na=False),
+        'horodatage': pd.to_datetime(df[0], format=TIMESTAMP_FORMAT, errors='coerce').isna(),
+        'direction': ~df[6].isin(DIRECTIONS),
+    }
+    for reason in payload_errors.unique():
+        if reason:
+            checks[reason] = payload_errors == reason
+    # Une ligne d'en-tête répétée n'a qu'un motif de rejet
+    checks = {reason: mask & ~header for reason, mask in checks.items()}
+    checks['en_tete'] = header
+    valid, rejected = validate(df.assign(text=texts), checks)
+    rejected = rejected.drop(columns='text').rename(columns=dict(enumerate(EXPORT_HEADER + ['(extra)'])))
+    return valid, rejected
+
+
+def clean_chunk(df, last_message_id=None, serialize=True):
+    """
+    Valide et nettoie un bloc du CSV. Retourne le bloc nettoyé, le nombre de
+    messages conservés, le plus grand identifiant de message valide rencontré
+    et les lignes rejetées.
+    Exécutée dans un processus du pool.
+
+    Args:
+        last_message_id (int, optional): Watermark : seuls les messages d'identifiant
+            supérieur sont conservés.
+        serialize (bool): Retourner les enregistrements JSON sérialisés (sans les
+            crochets du tableau) plutôt que le DataFrame (sortie Parquet).
+    """
+    # Les identifiants de message sont croissants dans le temps (horodatage en microsecondes).
+    # Les lignes sans identifiant valide sont toujours validées, pour être mises en quarantaine.
+    if last_message_id is not None:
+        message_ids = pd.to_numeric(df[4], errors='coerce')
+        df = df[message_ids.isna() | (message_ids > last_message_id)]
+    df, rejected = validate_chunk(df)
+    max_message_id = int(pd.to_numeric(df[4]).max()) if len(df) else None
+
+    # Keep only 9 columns
+    df = df[list(range(len(COLUMNS))) + ['text']].rename(columns=dict(enumerate(COLUMNS)))
+    if df.empty:
+        return ("" if serialize else df), 0, max_message_id, rejected
+
+    if not serialize:
+        return df, len(df), max_message_id, rejected
+    records = df.to_json(orient='records', indent=2, force_ascii=False)
+    return records.strip()[1:-1].strip('\n'), len(df), max_message_id, rejected
+
+
+def read_chunks(reader, quarantine):
+    """
+    Itère les blocs du lecteur CSV. Les lignes que le lecteur écarte (trop de champs)
+    sont signalées par un avertissement, relevé pour chaque bloc et mis en quarantaine.
+    """
+    while True:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ParserWarning)
+            chunk = next(reader, None)
+        for warning in caught:
+            for match in SKIPPED_LINE.finditer(str(warning.message)):
+                quarantine.write_skipped(int(match.group(1)), 'colonnes_en_trop', match.group(2))
+        if chunk is None:
+            return
+        yield chunk
+
+
+def iter_clean_chunks(chunks, workers, last_message_id=None, serialize=True):
+    """
+    Nettoie les blocs en parallèle et les restitue dans l'ordre de lecture.
+    Au plus deux blocs par processus sont en vol, ce qui borne la mémoire.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield clean_chunk(chunk, last_message_id, serialize)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(clean_chunk, chunk, last_message_id, serialize))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def clean_messages(chunk_size=CHUNK_SIZE, workers=None, full_refresh=not INCREMENTAL_PIPELINE):
+    """
+    Nettoie messages-csv.csv vers messages_clean (Parquet, ou JSON selon la configuration).
+
+    En mode incrémental, seuls les messages plus récents que le watermark (plus
+    grand identifiant de message déjà traité) sont nettoyés, puis ajoutés à la fin
+    du fichier existant.
+    """
     print("🧹 Nettoyage de messages-csv.csv...")
 
     if not os.path.exists(MESSAGES_CSV):
-        print(f"❌ Fichier introuvable : {MESSAGES_CSV}")
-        return
+        raise FileNotFoundError(f"Fichier introuvable : {MESSAGES_CSV}")
+
+    workers = workers or os.cpu_count() or 1
 
-    # Read CSV
-    df = pd.read_csv(
+    # Read CSV par blocs. Une colonne de plus que l'export recueille les champs en trop,
+    # pour que les lignes mal formées soient mises en quarantaine plutôt qu'ignorées.
+    chunks = pd.read_csv(
         MESSAGES_CSV,
         header=None,
+        names=range(EXPORT_FIELDS + 1),
+        index_col=False,
         dtype=str,
-        on_bad_lines='skip'
+        on_bad_lines='warn',
+        chunksize=chunk_size
     )
 
-    # Define columns
-    columns = [
-        'timestamp', 'conversation_id', 'sender_type', 'sender_id',
-        'message_id', 'message_type', 'direction', 'payload', 'recipient_id'
-    ]
-    df = df.iloc[:, :9]  # Keep only 9 columns
-    df.columns = columns
+    output_path = storage_path(os.path.join(os.path.dirname(MESSAGES_CSV), '..', 'processed', 'messages_clean'), 'table')
+    # En JSON, les blocs sont sérialisés directement dans les processus du pool
+    serialize = output_path.endswith('.json')
+    watermark = None if full_refresh else load_watermark(output_path)
+    last_message_id = (watermark or {}).get('last_message_id')
+    state = {'total': 0, 'max_message_id': last_message_id}
+
+    # Le store SQLite est alimenté bloc par bloc, chaque bloc dans une transaction
+    store = Store() if SQLITE_STORE else None
+    if store is not None and last_message_id is None:
+        store.clear('messages')
+    elif store is not None and not store.has_tables('messages'):
+        # Store activé après un premier nettoyage : il reprend d'abord les messages déjà nettoyés
+        for existing in iter_table_chunks(output_path):
+            store.write('messages', to_text(existing, MESSAGES_SCHEMA, missing=None))
 
-    # Clean
-    df.dropna(subset=['message_id'], inplace=True)
-    df['text'] = df['payload'].apply(parse_payload)
-    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    def cleaned_chunks():
+        for records, count, chunk_max_id, rejected in iter_clean_chunks(read_chunks(chunks, quarantine), workers, last_message_id, serialize):
+            quarantine.count(count + len(rejected))
+            quarantine.write(rejected)
+            if chunk_max_id is not None and (state['max_message_id'] is None or chunk_max_id > state['max_message_id']):
+                state['max_message_id'] = chunk_max_id
+            if count:
+                state['total'] += count
+                if store is not None:
+                    store.write('messages', pd.DataFrame.from_records(json.loads(f"[{records}]"))
+                                if serialize else records)
+                yield records
+
+    # Save : chaque bloc est écrit dès qu'il est prêt, les lignes rejetées vont en quarantaine
+    with Quarantine(os.path.normpath(QUARANTINE_PATH)) as quarantine:
+        if last_message_id is not None:
+            if serialize:
+                for records in cleaned_chunks():
+                    append_json_records(output_path, records)
+            else:
+                append_table(output_path, cleaned_chunks(), MESSAGES_SCHEMA, missing=None)
+            print(f"🔁 Mode incrémental : messages postérieurs à l'identifiant {last_message_id}")
+        else:
+            with TableWriter(output_path, MESSAGES_SCHEMA, missing=None) as writer:
+                for records in cleaned_chunks():
+                    if serialize:
+                        writer.write_serialized(records)
+                    else:
+                        writer.write(records)
+            export_legacy_json(output_path)
+    if store is not None:
+        store.close()
 
-    # Convert to string for JSON
-    df['timestamp'] = df['timestamp'].astype(str).replace('NaT', '')
+    save_watermark(output_path, {'last_message_id': state['max_message_id']})
 
-    # Save
-    output_path = os.path.join(os.path.dirname(MESSAGES_CSV), '..', 'processed', 'messages_clean.json')
-    df.to_json(output_path, orient='records', indent=2, force_ascii=False)
-    print(f"✅ messages_clean.json généré dans {output_path}")
-    print(f"📊 {len(df)} messages nettoyés")
+    print(f"✅ {os.path.basename(output_path)} généré dans {output_path}")
+    print(f"📊 {state['total']} messages nettoyés")
+    quarantine.print_summary()
 
 
 if __name__ == "__main__":
-    clean_messages()
\ No newline at end of file
+    clean_messages(full_refresh="--full" in sys.argv)
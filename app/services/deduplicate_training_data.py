@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import zlib
+import argparse
+from collections import defaultdict
+import numpy as np
+from app.services.storage import iter_records, RecordWriter
+
+# Définir le chemin de base du projet (FlaskProject)
+base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+synthetic_data_path = os.path.join(base_dir, 'app', 'data', 'training', 'synthetic_conversations.json')
+real_data_path = os.path.join(base_dir, 'app', 'data', 'training', 'cleaned_training_data.json')
+report_path = os.path.join(base_dir, 'app', 'data', 'training', 'deduplication_report.json')
+
+# Paramètres MinHash / LSH
+NUM_PERM = 128          # Nombre de permutations (taille de la signature)
+SHINGLE_SIZE = 5        # Taille des n-grammes de caractères
+THRESHOLD = 0.8         # Similarité de Jaccard à partir de laquelle deux conversations sont des doublons
+SEED = 42
+
+# Grand nombre premier de Mersenne utilisé pour les permutations universelles
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Champ ajouté aux conversations en mode "flag" (ignorées ensuite à l'entraînement)
+DUPLICATE_FIELD = 'duplicate_of'
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(conversation):
+    """Texte normalisé d'une conversation : messages concaténés, minuscules, espaces réduits."""
+    text = " ".join(str(m.get('text') or '') for m in conversation.get('messages', []))
+    return _WHITESPACE.sub(" ", text.lower()).strip()
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Ensemble des n-grammes de caractères du texte, hachés sur 32 bits."""
+    if len(text) <= size:
+        return {zlib.crc32(text.encode('utf-8'))}
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """
+    Calcule les signatures MinHash : chaque permutation est une fonction de hachage
+    universelle (a * x + b) mod p, appliquée à tous les shingles d'un coup avec numpy.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_set):
+        values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        hashed = ((values[:, None] * self.a + self.b) % _MERSENNE_PRIME) & _MAX_HASH
+        return hashed.min(axis=0).astype(np.uint32)
+
+
+def optimal_bands(num_perm, threshold):
+    """
+    Choisit le découpage de la signature en bandes (b bandes de r lignes, b * r = num_perm)
+    dont le seuil de collision approximatif (1/b)^(1/r) est le plus proche du seuil voulu.
+    """
+    candidates = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(candidates, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+class LSHIndex:
+    """
+    Index LSH par bandes : deux signatures deviennent candidates dès qu'une bande
+    est identique. Chaque insertion ou requête coûte O(b), d'où un coût total
+    sous-quadratique ; seuls les candidats sont comparés ensuite.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, threshold=THRESHOLD):
+        self.bands, self.rows = optimal_bands(num_perm, threshold)
+        self.tables = [defaultdict(list) for _ in range(self.bands)]
+
+    def _keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def insert(self, key, signature):
+        for band, band_key in self._keys(signature):
+            self.tables[band][band_key].append(key)
+
+    def query(self, signature):
+        candidates = set()
+        for band, band_key in self._keys(signature):
+            candidates.update(self.tables[band].get(band_key, ()))
+        return candidates
+
+
+def estimated_jaccard(sig_a, sig_b):
+    return float(np.mean(sig_a == sig_b))
+
+
+def find_duplicates(synthetic, real=(), threshold=THRESHOLD, num_perm=NUM_PERM, seed=SEED):
+    """
+    Repère les quasi-doublons d'une liste de conversations synthétiques, entre elles
+    et par rapport aux conversations réelles.
+
+    Une conversation synthétique est un doublon si elle ressemble à une conversation
+    réelle, ou à une conversation synthétique déjà conservée plus tôt dans le fichier
+    (la première occurrence est gardée).
+
+    Returns:
+        dict: index synthétique → {"source", "index", "similarity"} pour chaque doublon.
+    """
+    hasher = MinHasher(num_perm, seed)
+
+    real_signatures = []
+    real_index = LSHIndex(num_perm, threshold)
+    for i, conversation in enumerate(real):
+        signature = hasher.signature(shingles(normalize_text(conversation)))
+        real_signatures.append(signature)
+        real_index.insert(i, signature)
+
+    kept_signatures = {}
+    synthetic_index = LSHIndex(num_perm, threshold)
+    duplicates = {}
+    for i, conversation in enumerate(synthetic):
+        signature = hasher.signature(shingles(normalize_text(conversation)))
+
+        match = _best_match(signature, real_index.query(signature), real_signatures.__getitem__, threshold)
+        if match:
+            duplicates[i] = {'source': 'real', 'index': match[0], 'similarity': match[1]}
+            continue
+
+        match = _best_match(signature, synthetic_index.query(signature), kept_signatures.__getitem__, threshold)
+        if match:
+            duplicates[i] = {'source': 'synthetic', 'index': match[0], 'similarity': match[1]}
+            continue
+
+        kept_signatures[i] = signature
+        synthetic_index.insert(i, signature)
+
+    return duplicates
+
+
+def _best_match(signature, candidates, get_signature, threshold):
+    """Candidat LSH le plus similaire au-dessus du seuil, ou None (les faux positifs sont écartés ici)."""
+    best = None
+    for key in sorted(candidates):
+        similarity = estimated_jaccard(signature, get_signature(key))
+        if similarity >= threshold and (best is None or similarity > best[1]):
+            best = (key, round(similarity, 4))
+    return best
+
+
+def deduplicate_training_data(mode='remove', threshold=THRESHOLD, input_path=synthetic_data_path,
+                              reference_path=real_data_path, output_path=None):
+    """
+    Déduplique les conversations synthétiques.
+
+    Args:
+        mode (str): "remove" pour supprimer les doublons du fichier, "flag" pour les
+            conserver en les marquant du champ `duplicate_of` (ignorés à l'entraînement).
+        threshold (float): Similarité de Jaccard minimale pour considérer un doublon.
+
+    Returns:
+        dict: Rapport de déduplication.
+
+    Raises:
+        FileNotFoundError, json.JSONDecodeError: Fichier synthétique absent ou illisible.
+    """
+    print("Début de la déduplication des conversations synthétiques...")
+    output_path = output_path or input_path
+
+    # Les deux fichiers sont lus en flux : seules les signatures MinHash restent en mémoire,
+    # avec la taille et le nombre de messages de chaque conversation pour le rapport
+    previous_flags = {}
+    sizes, message_counts = [], []
+
+    def synthetic_conversations():
+        for i, conversation in enumerate(iter_records(input_path)):
+            # Repartir d'un état propre si le fichier a déjà été marqué lors d'un passage précédent
+            flag = conversation.pop(DUPLICATE_FIELD, None)
+            if flag:
+                previous_flags[i] = flag
+            sizes.append(len(json.dumps(conversation, ensure_ascii=False).encode('utf-8')))
+            message_counts.append(len(conversation.get('messages', [])))
+            yield conversation
+
+    def real_conversations():
+        try:
+            yield from iter_records(reference_path)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"⚠️ Données réelles indisponibles ('{reference_path}'), comparaison interne uniquement : {e}")
+
+    start = time.perf_counter()
+    try:
+        duplicates = find_duplicates(synthetic_conversations(), real_conversations(), threshold=threshold)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"❌ Erreur de lecture du fichier '{input_path}' : {e}")
+        raise
+    elapsed = time.perf_counter() - start
+
+    def array_bytes(indices):
+        # Taille du tableau JSON compact : éléments, séparateurs ", " et crochets
+        indices = list(indices)
+        return sum(sizes[i] for i in indices) + 2 * max(len(indices) - 1, 0) + 2
+
+    total = len(sizes)
+    kept_indices = [i for i in range(total) if i not in duplicates]
+    bytes_before = array_bytes(range(total))
+    bytes_after = array_bytes(kept_indices)
+    messages_before = sum(message_counts)
+    messages_after = sum(message_counts[i] for i in kept_indices)
+
+    # Le fichier n'est réécrit que si son contenu change : sinon sa date et son empreinte
+    # restent les mêmes et le pipeline ne relance pas les étapes qui en dépendent
+    if mode == 'flag':
+        changed = previous_flags != duplicates
+    else:
+        changed = bool(duplicates or previous_flags)
+    if changed or output_path != input_path:
+        with RecordWriter(output_path) as writer:
+            for i, conversation in enumerate(iter_records(input_path)):
+                conversation.pop(DUPLICATE_FIELD, None)
+                if mode == 'flag':
+                    if i in duplicates:
+                        conversation[DUPLICATE_FIELD] = duplicates[i]
+                    writer.write(conversation)
+                elif i not in duplicates:
+                    writer.write(conversation)
+
+    report = {
+        'mode': mode,
+        'threshold': threshold,
+        'num_perm': NUM_PERM,
+        'shingle_size': SHINGLE_SIZE,
+        'conversations_before': total,
+        'conversations_after': total - len(duplicates),
+        'duplicates_within_synthetic': sum(1 for d in duplicates.values() if d['source'] == 'synthetic'),
+        'duplicates_of_real': sum(1 for d in duplicates.values() if d['source'] == 'real'),
+        'messages_before': messages_before,
+        'messages_after': messages_after,
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'shrink_ratio': round(len(duplicates) / total, 4) if total else 0.0,
+        'output_rewritten': changed or output_path != input_path,
+        'elapsed_seconds': round(elapsed, 3),
+        'duplicates': {str(i): match for i, match in sorted(duplicates.items())},
+    }
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    action = "marquées" if mode == 'flag' else "supprimées"
+    print(f"🧬 {len(duplicates)} conversations en double {action} "
+          f"({report['duplicates_within_synthetic']} internes, {report['duplicates_of_real']} proches des données réelles) "
+          f"en {elapsed:.2f}s")
+    print(f"📉 Dataset d'entraînement : {report['conversations_before']} → {report['conversations_after']} conversations, "
+          f"{messages_before} → {messages_after} messages, "
+          f"{bytes_before / 1024:.0f} → {bytes_after / 1024:.0f} Ko (-{report['shrink_ratio']:.1%})")
+    print(f"Rapport sauvegardé ici : {report_path}")
+    return report
+
+
+def run(mode='remove', threshold=THRESHOLD):
+    """Point d'entrée pour la déduplication automatique du dataset."""
+    deduplicate_training_data(mode=mode, threshold=threshold)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Déduplication MinHash/LSH des conversations synthétiques.")
+    parser.add_argument('--mode', choices=['remove', 'flag'], default='remove',
+                        help="Supprimer les doublons ou seulement les marquer.")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="Seuil de similarité de Jaccard.")
+    args = parser.parse_args()
+    run(mode=args.mode, threshold=args.threshold)
@@ -0,0 +1,86 @@
+import os
+import json
+
+# Suffixe du fichier de watermark associé à chaque sortie du pipeline
+WATERMARK_SUFFIX = '.watermark.json'
+
+
+def _watermark_path(output_path):
+    return output_path + WATERMARK_SUFFIX
+
+
+def load_watermark(output_path):
+    """
+    Retourne le watermark enregistré pour une sortie du pipeline, ou None.
+
+    Le watermark n'est valable que si la sortie existe encore : sans elle, l'étape
+    doit repartir de zéro.
+    """
+    if not os.path.exists(output_path):
+        return None
+    try:
+        with open(_watermark_path(output_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_watermark(output_path, watermark):
+    """Enregistre le watermark d'une sortie (écriture atomique)."""
+    path = _watermark_path(output_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermark, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def max_value(values, current=None):
+    """Plus grande valeur non vide d'un itérable (chaînes ISO ou nombres), comparée au watermark courant."""
+    best = current
+    for value in values:
+        if value is None or value == '' or value != value:
+            continue
+        if best is None or value > best:
+            best = value
+    return best
+
+
+def _previous_byte(f, pos, block_size=64):
+    """Dernier octet non blanc avant `pos`, lu à reculons par petits blocs (b'' si aucun)."""
+    while pos > 0:
+        start = max(0, pos - block_size)
+        f.seek(start)
+        block = f.read(pos - start).rstrip()
+        if block:
+            return block[-1:]
+        pos = start
+    return b''
+
+
+def append_json_records(path, records_text):
+    """
+    Ajoute des enregistrements déjà sérialisés à la fin d'un tableau JSON existant,
+    sans relire le fichier : seul le crochet fermant est réécrit.
+    """
+    if not records_text:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # Retrouver le crochet fermant (les derniers octets ne contiennent que des blancs)
+        f.seek(max(0, end - 64))
+        tail = f.read()
+        close = tail.rstrip().rfind(b']')
+        if close < 0:
+            raise ValueError(f"Tableau JSON non terminé : {path}")
+        close += end - len(tail)
+        empty = _previous_byte(f, close) == b'['
+        f.seek(close)
+        f.truncate()
+        # Retirer le saut de ligne qui précédait le crochet pour garder la mise en forme
+        f.seek(close - 1)
+        if f.read(1) == b'\n':
+            f.seek(close - 1)
+            f.truncate()
+        f.write(((b'' if empty else b',') + b'\n' + records_text.encode('utf-8') + b'\n]'))
+
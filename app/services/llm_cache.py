@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+from config import LLM_CACHE_MODE, LLM_CACHE_PATH, LLM_CACHE_MAX_MB
+
+CACHE_MODES = ('readwrite', 'replay', 'off')
+
+
+def cache_key(url, payload):
+    """
+    Clé d'une requête : hash SHA-256 de l'URL du modèle et de la requête complète
+    (prompt et configuration de génération), sérialisée avec des clés triées.
+    """
+    canonical = json.dumps({'url': url, 'payload': payload}, sort_keys=True, ensure_ascii=False,
+                           separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    Cache disque des réponses du LLM, adressé par le contenu des requêtes (voir cache_key).
+
+    Les réponses sont stockées dans une base SQLite avec leur taille et leur date de
+    dernière utilisation ; au-delà de `max_mb`, les moins récemment utilisées sont
+    évincées. En mode "replay", seul le cache est lu (aucune écriture, aucun appel réseau).
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, mode=LLM_CACHE_MODE, max_mb=LLM_CACHE_MAX_MB):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Mode de cache LLM inconnu : {mode} (attendu : {', '.join(CACHE_MODES)})")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.connection = None
+        if mode == 'off':
+            return
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Plusieurs étapes LLM peuvent tourner en parallèle : chacune attend le verrou d'écriture
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, url TEXT, response TEXT, size INTEGER, "
+                "created_at REAL, used_at REAL, hits INTEGER DEFAULT 0)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_used ON responses (used_at)")
+
+    @property
+    def enabled(self):
+        return self.connection is not None
+
+    @property
+    def replay(self):
+        return self.mode == 'replay'
+
+    def get(self, key):
+        """Réponse en cache (dict) ou None ; la date d'utilisation est mise à jour pour l'éviction."""
+        if not self.enabled:
+            return None
+        row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not self.replay:
+            with self.connection:
+                self.connection.execute("UPDATE responses SET used_at = ?, hits = hits + 1 WHERE key = ?",
+                                        (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, url, response):
+        if not self.enabled or self.replay:
+            return
+        text = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, response, size, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, url, text, len(text.encode('utf-8')), now, now)
+            )
+        self.stored += 1
+
+    def evict(self):
+        """
+        Supprime les réponses les moins récemment utilisées jusqu'à repasser sous
+        la taille maximale.
+
+        Returns:
+            int: Nombre de réponses supprimées.
+        """
+        if not self.enabled or self.replay:
+            return 0
+        total = self.connection.execute("SELECT coalesce(sum(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        excess = total - self.max_bytes
+        keys, freed = [], 0
+        for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY used_at"):
+            if freed >= excess:
+                break
+            keys.append((key,))
+            freed += size
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+        return len(keys)
+
+    def clear(self):
+        if self.enabled:
+            with self.connection:
+                self.connection.execute("DELETE FROM responses")
+            self.connection.execute("VACUUM")
+
+    def stats(self):
+        if not self.enabled:
+            return {'entries': 0, 'size_mb': 0.0}
+        entries, size, hits = self.connection.execute(
+            "SELECT count(*), coalesce(sum(size), 0), coalesce(sum(hits), 0) FROM responses").fetchone()
+        return {'entries': entries, 'size_mb': round(size / 1024 / 1024, 2), 'hits': hits}
+
+    def close(self):
+        if self.enabled:
+            evicted = self.evict()
+            if evicted:
+                print(f"🗑️ Cache LLM : {evicted} réponses évincées (limite {self.max_bytes // 1024 // 1024} Mo)")
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+if __name__ == '__main__':
+    # Usage : python -m app.services.llm_cache [stats | evict | clear]
+    command = sys.argv[1] if len(sys.argv) > 1 else 'stats'
+    with LLMCache(mode='readwrite') as cache:
+        if command == 'clear':
+            cache.clear()
+            print(f"🧹 Cache LLM vidé : {cache.path}")
+        elif command == 'evict':
+            print(f"🗑️ {cache.evict()} réponses évincées")
+        elif command == 'stats':
+            stats = cache.stats()
+            print(f"📊 Cache LLM : {stats['entries']} réponses, {stats['size_mb']} Mo, "
+                  f"{stats['hits']} réutilisations → {cache.path}")
+        else:
+            print("Usage: python -m app.services.llm_cache [stats | evict | clear]")
+            sys.exit(1)
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import random
+import asyncio
+from config import (
+    LLM_API_KEY_ENV, LLM_BASE_URL, LLM_MODEL, LLM_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_BURST,
+    LLM_MAX_RETRIES, LLM_TIMEOUT
+)
+from app.services.llm_cache import LLMCache, cache_key
+
+# Codes HTTP pour lesquels la requête est retentée (quota, surcharge, erreur serveur)
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Attente maximale entre deux tentatives (backoff exponentiel avec jitter)
+MAX_BACKOFF = 60.0
+
+# Estimation grossière du nombre de tokens d'un texte (pas de tokenizer local du modèle)
+CHARS_PER_TOKEN = 4
+
+
+class LLMError(Exception):
+    """Erreur de configuration ou réponse inexploitable de l'API du LLM."""
+
+
+class TruncatedResponse(LLMError):
+    """Réponse coupée par la limite de tokens de sortie (finishReason MAX_TOKENS)."""
+
+
+class TokenBucket:
+    """
+    Limiteur de débit : `rate` jetons par seconde, au plus `capacity` d'avance.
+    Chaque requête consomme un jeton et attend qu'il soit disponible. `clock` et
+    `sleep` remplacent l'horloge et l'attente (tests sans temps réel).
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await self._sleep((tokens - self.tokens) / self.rate)
+
+
+def backoff_delay(attempt, initial_delay=1.0):
+    """Délai avant la tentative suivante : tirage uniforme jusqu'au backoff exponentiel (full jitter)."""
+    return random.uniform(0, min(MAX_BACKOFF, initial_delay * 2 ** attempt))
+
+
+def estimate_tokens(text):
+    """Nombre de tokens estimé d'un texte, ou d'une requête (dict) sérialisée en JSON."""
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False)
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def response_text(data, allow_truncated=False):
+    """
+    Texte de la première réponse candidate de l'API generateContent. Une réponse
+    tronquée lève TruncatedResponse, sauf avec `allow_truncated` (récupération partielle).
+    """
+    try:
+        candidate = data['candidates'][0]
+        text = candidate['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"Réponse sans texte : {e}") from e
+    if candidate.get('finishReason') == 'MAX_TOKENS' and not allow_truncated:
+        raise TruncatedResponse("Réponse tronquée (limite de tokens de sortie atteinte)")
+    return text
+
+
+def response_json(data):
+    """Contenu JSON (responseMimeType application/json) de la première réponse candidate."""
+    try:
+        return json.loads(response_text(data))
+    except json.JSONDecodeError as e:
+        raise LLMError(f"Réponse JSON invalide : {e}") from e
+
+
+class LLMClient:
+    """
+    Client asynchrone de l'API generateContent, partagé par les étapes du pipeline
+    qui appellent le LLM.
+
+    Une seule session HTTP (connexions réutilisées) sert tous les appels ; au plus
+    `concurrency` requêtes sont en vol et le débit est borné par un token bucket.
+    Les erreurs réseau, les quotas (429) et les erreurs serveur sont retentés avec
+    un backoff exponentiel jitteré. Chaque appel est mesuré (latence, tentatives).
+
+    Les réponses sont lues puis enregistrées dans le cache disque `cache` (LLMCache) ;
+    en mode "replay", une requête absente du cache échoue sans appel réseau.
+
+    La clé API est lue dans la variable d'environnement LLM_API_KEY_ENV (inutile en
+    mode "replay") ; `base_url` (ou la variable LLM_BASE_URL) permet de viser un
+    serveur local de test.
+
+    Usage :
+        async with LLMClient() as client:
+            data = await client.generate(payload)
+    """
+
+    def __init__(self, model=LLM_MODEL, base_url=None, api_key=None, concurrency=LLM_CONCURRENCY,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE, burst=LLM_BURST, max_retries=LLM_MAX_RETRIES,
+                 timeout=LLM_TIMEOUT, cache=None, retry_on_timeout=True):
+        self.model = model
+        self.base_url = (base_url or LLM_BASE_URL).rstrip('/')
+        self.cache = cache or LLMCache(mode='off')
+        self.api_key = api_key or os.environ.get(LLM_API_KEY_ENV)
+        if not self.api_key and not self.cache.replay:
+            raise LLMError(f"Clé API absente : définir la variable d'environnement {LLM_API_KEY_ENV}.")
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+        # Sans nouvelle tentative sur un dépassement de délai, l'appelant peut réduire sa requête
+        self.retry_on_timeout = retry_on_timeout
+        self.calls = []
+        self._started = 0
+        self._session = None
+
+    @property
+    def url(self):
+        return f"{self.base_url}/models/{self.model}:generateContent"
+
+    async def __aenter__(self):
+        import aiohttp
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._bucket = TokenBucket(self.requests_per_minute / 60, self.burst)
+        if self.cache.replay:
+            return self
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'Content-Type': 'application/json', 'x-goog-api-key': self.api_key},
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+        return False
+
+    async def generate(self, payload, label=None, parse=None):
+        """
+        Envoie une requête generateContent.
+
+        La latence mesurée est celle de la dernière tentative ; la durée totale
+        comprend aussi l'attente du limiteur et des nouvelles tentatives. Une réponse
+        servie par le cache n'a ni tentative ni latence.
+
+        Args:
+            parse (callable, optional): Extrait le résultat de la réponse (ex. response_json).
+                Une LLMError levée fait échouer l'appel et la réponse n'est pas mise en cache.
+
+        Returns:
+            Réponse JSON de l'API (ou son résultat extrait par `parse`), ou None si l'appel a échoué.
+        """
+        result, _ = await self.request(payload, label, parse)
+        return result
+
+    async def request(self, payload, label=None, parse=None):
+        """
+        Comme generate, mais retourne aussi la mesure de l'appel : latence, et en cas
+        d'échec son motif (`error`) et sa nature (`error_kind` : "http", "network",
+        "timeout", "truncated", "parse" ou "replay").
+        """
+        self._started += 1
+        label = label or f"appel {self._started}"
+        start = time.perf_counter()
+        call = {'label': label, 'attempts': 0, 'ok': False, 'status': None, 'latency_s': None, 'cached': False,
+                'error': None, 'error_kind': None}
+        key = cache_key(self.url, payload)
+        data = self.cache.get(key)
+        if data is not None:
+            call.update(ok=True, cached=True)
+        elif self.cache.replay:
+            call.update(error="réponse absente du cache (mode replay)", error_kind='replay')
+            print(f"❌ {label} : {call['error']}")
+        else:
+            data = await self._post(payload, label, call)
+
+        result = data
+        if call['ok'] and parse is not None:
+            try:
+                result = parse(data)
+            except LLMError as e:
+                kind = 'truncated' if isinstance(e, TruncatedResponse) else 'parse'
+                call.update(ok=False, error=str(e), error_kind=kind)
+                print(f"❌ {label} : {e}")
+        # Les réponses sans candidat (ex. bloquées par les filtres) ou inexploitables ne sont pas mises en cache
+        if call['ok'] and not call['cached'] and data.get('candidates'):
+            self.cache.put(key, self.url, data)
+
+        call['total_s'] = round(time.perf_counter() - start, 4)
+        self.calls.append(call)
+        return (result if call['ok'] else None), call
+
+    async def _post(self, payload, label, call):
+        """Envoie la requête avec les nouvelles tentatives ; réponse JSON ou None (motif dans `call`)."""
+        import aiohttp
+
+        data = None
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        async with self._semaphore:
+            for attempt in range(self.max_retries):
+                await self._bucket.acquire()
+                call['attempts'] = attempt + 1
+                retry_after = None
+                attempt_start = time.perf_counter()
+                try:
+                    async with self._session.post(self.url, data=body) as response:
+                        call['status'] = response.status
+                        if response.status < 400:
+                            data = await response.json(content_type=None)
+                            call['ok'] = True
+                            call['latency_s'] = round(time.perf_counter() - attempt_start, 4)
+                            break
+                        error = f"HTTP {response.status} : {(await response.text())[:200]}"
+                        call.update(error=error, error_kind='http')
+                        if response.status not in RETRY_STATUSES:
+                            print(f"❌ {label} : {error}")
+                            break
+                        retry_after = response.headers.get('Retry-After')
+                except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        error = f"délai de {self.timeout} s dépassé"
+                        call.update(error=error, error_kind='timeout')
+                    else:
+                        error = f"{type(e).__name__} : {e}"
+                        call.update(error=error, error_kind='network')
+                call['latency_s'] = round(time.perf_counter() - attempt_start, 4)
+                if call['error_kind'] == 'timeout' and not self.retry_on_timeout:
+                    print(f"⏱️ {label} : {error}")
+                    break
+
+                print(f"⚠️ {label} : échec de la tentative {attempt + 1}/{self.max_retries} ({error})")
+                if attempt < self.max_retries - 1:
+                    delay = backoff_delay(attempt)
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    await asyncio.sleep(delay)
+        if call['ok']:
+            call.update(error=None, error_kind=None)
+        return data
+
+    async def generate_all(self, payloads, labels=None, parse=None, on_result=None):
+        """
+        Envoie les requêtes en parallèle (dans la limite de `concurrency`) ; résultats dans l'ordre.
+
+        `on_result(index, result, call)` est appelé dès qu'une requête se termine
+        (result None en cas d'échec, motif dans call['error']), pour enregistrer les
+        résultats au fil de l'eau.
+        """
+        labels = labels or [None] * len(payloads)
+
+        async def _one(index, payload, label):
+            result, call = await self.request(payload, label, parse)
+            if on_result is not None:
+                on_result(index, result, call)
+            return result
+
+        return await asyncio.gather(*(_one(index, payload, label)
+                                      for index, (payload, label) in enumerate(zip(payloads, labels))))
+
+    def summary(self):
+        """Statistiques des appels : nombre, échecs, réponses du cache, tentatives et latences."""
+        if not self.calls:
+            return {'calls': 0}
+        # Appels servis par le cache uniquement : latences nulles
+        latencies = sorted(call['latency_s'] for call in self.calls if call['latency_s'] is not None) or [0.0]
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            'calls': len(self.calls),
+            'failed': sum(not call['ok'] for call in self.calls),
+            'cached': sum(call['cached'] for call in self.calls),
+            'retries': sum(max(call['attempts'] - 1, 0) for call in self.calls),
+            'latency_p50_s': percentile(0.5),
+            'latency_p95_s': percentile(0.95),
+            'latency_max_s': latencies[-1],
+        }
+
+    def print_summary(self):
+        stats = self.summary()
+        if not stats['calls']:
+            return
+        print(f"📡 LLM : {stats['calls']} appels ({stats['cached']} servis par le cache), {stats['failed']} échecs, "
+              f"{stats['retries']} nouvelles tentatives, "
+              f"latence p50 {stats['latency_p50_s']:.2f} s, p95 {stats['latency_p95_s']:.2f} s, "
+              f"max {stats['latency_max_s']:.2f} s")
+
+
+def run_with_client(work, **client_options):
+    """
+    Version synchrone pour les étapes du pipeline : exécute la coroutine `work(client)`
+    avec un client partagé et le cache disque configuré (LLM_CACHE_MODE), puis affiche
+    le bilan des appels.
+    """
+    async def _run(cache):
+        async with LLMClient(cache=cache, **client_options) as client:
+            try:
+                return await work(client)
+            finally:
+                client.print_summary()
+
+    with LLMCache() as cache:
+        return asyncio.run(_run(cache))
+
+
+def generate_all(payloads, labels=None, parse=None, on_result=None, **client_options):
+    """
+    Envoie toutes les requêtes avec un client partagé (voir run_with_client) et retourne
+    les réponses dans l'ordre (None pour un échec). Voir LLMClient.generate_all.
+    """
+    return run_with_client(lambda client: client.generate_all(payloads, labels, parse=parse, on_result=on_result),
+                           **client_options)
@@ -0,0 +1,164 @@
+import re
+import json
+from app.services.llm_client import LLMError, TruncatedResponse, response_text
+
+_decoder = json.JSONDecoder(strict=False)
+_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+_SEPARATORS = ' \t\r\n,'
+
+# Types de l'OpenAPI simplifié des responseSchema Gemini
+_TYPES = {
+    'STRING': str,
+    'INTEGER': int,
+    'NUMBER': (int, float),
+    'BOOLEAN': bool,
+    'ARRAY': list,
+    'OBJECT': dict,
+}
+
+
+def _element_end(text, pos):
+    """
+    Fin de l'élément JSON commençant à `pos`, en suivant seulement les chaînes et
+    l'imbrication (un élément mal formé à l'intérieur est donc sauté en entier).
+    None si le texte s'arrête avant la fin de l'élément.
+    """
+    depth = 0
+    in_string = escaped = False
+    for index in range(pos, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '[{':
+            depth += 1
+        elif char in ']}':
+            if depth == 0:
+                return index
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        elif depth == 0 and char == ',':
+            return index
+    return None
+
+
+def iter_array(text):
+    """
+    Parcourt un tableau JSON élément par élément, même tronqué ou légèrement mal
+    formé (bloc ```json, virgules manquantes ou en trop, caractères de contrôle).
+
+    Yields:
+        tuple: ('item', élément) pour chaque élément lisible, ('damaged', texte brut)
+        pour un élément illisible sauté, puis ('end', tableau_fermé) en dernier.
+    """
+    text = _FENCE.sub('', text)
+    pos = text.find('[')
+    if pos < 0:
+        raise LLMError("Réponse sans tableau JSON")
+    pos += 1
+    while True:
+        while pos < len(text) and text[pos] in _SEPARATORS:
+            pos += 1
+        if pos >= len(text):
+            yield 'end', False
+            return
+        if text[pos] == ']':
+            yield 'end', True
+            return
+        try:
+            item, pos = _decoder.raw_decode(text, pos)
+            yield 'item', item
+        except json.JSONDecodeError:
+            end = _element_end(text, pos)
+            if end is None:
+                # Dernier élément coupé par la fin de la réponse
+                yield 'damaged', text[pos:]
+                yield 'end', False
+                return
+            # Un } ou ] isolé est sa propre fin : avancer d'au moins un caractère
+            end = max(end, pos + 1)
+            yield 'damaged', text[pos:end]
+            pos = end
+
+
+def schema_errors(value, schema, path='$'):
+    """Écarts d'une valeur au responseSchema (types, champs "required"), chemin par chemin."""
+    expected = schema.get('type')
+    if expected in _TYPES and (not isinstance(value, _TYPES[expected])
+                               or (expected in ('INTEGER', 'NUMBER') and isinstance(value, bool))):
+        return [f"{path} : {expected} attendu"]
+    errors = []
+    if expected == 'OBJECT':
+        errors += [f"{path}.{key} : champ manquant" for key in schema.get('required', []) if value.get(key) is None]
+        for key, subschema in schema.get('properties', {}).items():
+            if value.get(key) is not None:
+                errors += schema_errors(value[key], subschema, f"{path}.{key}")
+    elif expected == 'ARRAY' and 'items' in schema:
+        for index, item in enumerate(value):
+            errors += schema_errors(item, schema['items'], f"{path}[{index}]")
+    return errors
+
+
+class SalvagedResponse:
+    """
+    Éléments récupérés d'une réponse tableau : `items` valides au schéma, nombre
+    d'éléments rejetés, clés (`key`) des éléments rejetés quand elles sont lisibles,
+    et `complete` (tableau fermé, réponse non tronquée, aucun élément rejeté).
+    """
+
+    def __init__(self, items, rejected, rejected_keys, complete, truncated):
+        self.items = items
+        self.rejected = rejected
+        self.rejected_keys = rejected_keys
+        self.complete = complete
+        self.truncated = truncated
+
+    def describe(self):
+        state = "tronquée" if self.truncated else "incomplète" if not self.complete else "complète"
+        return f"réponse {state} : {len(self.items)} éléments récupérés, {self.rejected} rejetés"
+
+
+def array_parser(schema, key=None):
+    """
+    Fonction de lecture (paramètre `parse` du client LLM) d'une réponse tableau :
+    chaque élément complet est gardé s'il respecte `schema` (responseSchema de la
+    requête), même si la réponse est tronquée ou si d'autres éléments sont illisibles.
+    Lève TruncatedResponse ou LLMError seulement si aucun élément n'est récupérable.
+
+    Args:
+        key (str, optional): Champ identifiant un élément, relevé sur les éléments
+            rejetés pour ne redemander que ceux-là.
+    """
+    item_schema = schema.get('items', {})
+    key_pattern = re.compile(rf'"{re.escape(key)}"\s*:\s*"([^"]*)"') if key else None
+
+    def parse(data):
+        truncated = (data.get('candidates') or [{}])[0].get('finishReason') == 'MAX_TOKENS'
+        items, rejected_keys = [], []
+        rejected = 0
+        closed = False
+        for kind, value in iter_array(response_text(data, allow_truncated=True)):
+            if kind == 'end':
+                closed = value
+            elif kind == 'item' and not schema_errors(value, item_schema):
+                items.append(value)
+            else:
+                rejected += 1
+                if key and isinstance(value, dict) and isinstance(value.get(key), str):
+                    rejected_keys.append(value[key])
+                elif key_pattern and isinstance(value, str) and key_pattern.search(value):
+                    rejected_keys.append(key_pattern.search(value).group(1))
+        if not items and not (closed and not rejected):
+            if truncated:
+                raise TruncatedResponse("Réponse tronquée sans élément complet")
+            raise LLMError(f"Réponse sans élément exploitable ({rejected} rejetés)")
+        return SalvagedResponse(items, rejected, rejected_keys, closed and not truncated and not rejected, truncated)
+
+    return parse
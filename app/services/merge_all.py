@@ -1,82 +1,309 @@
 import json
 import os
+import argparse
+import numpy as np
+import pandas as pd
+from config import INCREMENTAL_PIPELINE
+from app.services.incremental import load_watermark, save_watermark, max_value
+from app.services.storage import find_existing, storage_path, read_table, write_records, upsert_records
+from app.services.store import Store, store_available
+from app.services.typed_tables import CONVERSATIONS_SCHEMA, MESSAGES_SCHEMA, to_typed, to_text
 
 # Définir le chemin de base du projet (FlaskProject)
 # En supposant que le script est dans app/services/
 base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Définir les chemins d'entrée et de sortie en utilisant la structure de votre projet
-conversations_file_path = os.path.join(base_dir, 'app', 'data', 'processed', 'conversations_clean.json')
-messages_file_path = os.path.join(base_dir, 'app', 'data', 'processed', 'messages_clean.json')
-output_file_path = os.path.join(base_dir, 'app', 'data', 'processed', 'merged_data.json')
+# (sans extension : le format dépend de la configuration du stockage)
+conversations_file_stem = os.path.join(base_dir, 'app', 'data', 'processed', 'conversations_clean')
+messages_file_stem = os.path.join(base_dir, 'app', 'data', 'processed', 'messages_clean')
+output_file_stem = os.path.join(base_dir, 'app', 'data', 'processed', 'merged_data')
 
+CONVERSATION_DATE_FIELDS = ('start_time', 'end_time', 'last_reply_time', 'first_reply_time')
 
-def merge_conversations_with_messages():
+# Nombre de conversations dont les messages sont convertis en enregistrements à la fois
+CONVERSATION_CHUNK_SIZE = 1_000
+
+
+def activity_times(conversations):
+    """Date la plus récente de chaque conversation, au format texte des watermarks ('' si aucune)."""
+    return to_text(conversations[list(CONVERSATION_DATE_FIELDS)], CONVERSATIONS_SCHEMA).max(axis=1)
+
+
+def conversation_activity(conversation):
+    """Date la plus récente d'une conversation (chaîne ISO), utilisée comme watermark."""
+    return max_value(conversation.get(field) for field in CONVERSATION_DATE_FIELDS)
+
+
+def drop_header_rows(df, id_column):
+    """
+    Retire les lignes d'en-tête des exports CSV (lues comme des données) : ce sont
+    celles dont l'identifiant n'est pas numérique, quelle que soit leur position.
     """
-    Charge les fichiers de conversations et de messages, les fusionne
-    en se basant sur le contact_id, puis sauvegarde le résultat
-    dans un nouveau fichier JSON.
+    return df[df[id_column].astype(str).str.fullmatch(r"\d+")]
+
+
+def assign_messages(conversations, messages):
+    """
+    Rattache chaque message à la conversation de son contact dont la fenêtre
+    [start_time, end_time] contient son horodatage (jointure par intervalle).
+
+    Les deux tables sont triées par date puis jointes avec `merge_asof` : chaque
+    message est associé à la dernière conversation du contact ouverte avant lui,
+    et gardé seulement s'il précède sa clôture. Coût O(n log n).
+
+    Returns:
+        pd.Series: conversation_id de chaque message (index des messages), NaN si
+            le message ne tombe dans aucune fenêtre.
+    """
+    left = pd.DataFrame({
+        'contact_id': messages['sender_id'],
+        '_ts': pd.to_datetime(messages['timestamp'], errors='coerce'),
+    }).dropna().sort_values('_ts')
+    right = pd.DataFrame({
+        'contact_id': conversations['contact_id'],
+        'conversation_id': conversations['conversation_id'],
+        '_start': pd.to_datetime(conversations['start_time'], errors='coerce'),
+        '_end': pd.to_datetime(conversations['end_time'], errors='coerce'),
+    }).dropna(subset=['contact_id', '_start']).sort_values('_start')
+    if left.empty or right.empty:
+        return pd.Series(np.nan, index=messages.index, dtype=object)
+
+    joined = pd.merge_asof(left.reset_index(), right, left_on='_ts', right_on='_start', by='contact_id',
+                           direction='backward').set_index('index')
+    # Une conversation sans date de clôture reste ouverte
+    inside = joined['_end'].isna() | (joined['_ts'] <= joined['_end'])
+    return joined['conversation_id'].where(inside).reindex(messages.index)
+
+
+def _records(df):
+    """Enregistrements d'un DataFrame, valeurs manquantes converties en None."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def iter_merged_conversations(conversations, messages, stats=None, conversation_ids=None):
+    """
+    Génère les conversations, chacune avec ses messages triés par heure, au fil de
+    l'eau (une conversation à la fois est construite). Les tables peuvent être typées
+    (voir typed_tables) : les enregistrements produits sont au format texte.
+
+    Args:
+        conversations (pd.DataFrame): Conversations à produire.
+        messages (pd.DataFrame): Messages candidats (ceux des contacts de ces conversations).
+        stats (dict, optional): Rempli avec le nombre de messages rattachés ou non.
+        conversation_ids (pd.Series, optional): Résultat de assign_messages, s'il est déjà calculé.
+    """
+    if conversation_ids is None:
+        conversation_ids = assign_messages(conversations, messages)
+    assigned = messages.assign(_conversation=conversation_ids,
+                               _ts=pd.to_datetime(messages['timestamp'], errors='coerce'))
+    assigned = assigned[assigned['_conversation'].notna()].sort_values(['_conversation', '_ts'], kind='stable')
+    if stats is not None:
+        stats['assigned'] = len(assigned)
+        stats['unassigned'] = len(messages) - len(assigned)
+
+    # Bornes du bloc de messages de chaque conversation dans la table triée
+    keys = assigned['_conversation'].astype('string').to_numpy(dtype=object)
+    assigned = assigned.drop(columns=['_conversation', '_ts'])
+    boundaries = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True]) if len(keys) else np.array([0])
+    blocks = {keys[start]: (start, end) for start, end in zip(boundaries[:-1], boundaries[1:])}
+
+    # Les enregistrements (dictionnaires) sont construits par bloc de conversations : seuls
+    # les messages du bloc en cours existent en mémoire sous cette forme
+    for start in range(0, len(conversations), CONVERSATION_CHUNK_SIZE):
+        chunk = _records(to_text(conversations.iloc[start:start + CONVERSATION_CHUNK_SIZE], CONVERSATIONS_SCHEMA))
+        spans = [blocks.get(conversation.get('conversation_id'), (0, 0)) for conversation in chunk]
+        positions = np.concatenate([np.arange(begin, end) for begin, end in spans])
+        message_records = _records(to_text(assigned.iloc[positions], MESSAGES_SCHEMA, missing=None))
+        offset = 0
+        for conversation, (begin, end) in zip(chunk, spans):
+            conversation['messages'] = message_records[offset:offset + end - begin]
+            offset += end - begin
+            yield conversation
+
+
+def select_from_files(last_activity, last_message_id):
+    """
+    Charge les tables nettoyées depuis les fichiers Parquet ou JSON. En mode
+    incrémental, ne garde que les conversations modifiées depuis le watermark ou
+    dont le contact a reçu de nouveaux messages, et les messages de leurs contacts.
+
+    Returns:
+        tuple: (conversations, messages, incrémental ou non)
+    """
+    conversations_file_path = find_existing(conversations_file_stem, 'table')
+    messages_file_path = find_existing(messages_file_stem, 'table')
+    if conversations_file_path is None or messages_file_path is None:
+        raise FileNotFoundError(conversations_file_stem if conversations_file_path is None else messages_file_stem)
+    conversations = drop_header_rows(read_table(conversations_file_path, schema=CONVERSATIONS_SCHEMA), 'conversation_id')
+    messages = drop_header_rows(read_table(messages_file_path, schema=MESSAGES_SCHEMA), 'message_id')
+
+    incremental = bool(last_activity) and last_message_id is not None
+    if incremental:
+        message_ids = pd.to_numeric(messages['message_id'], errors='coerce')
+        activities = activity_times(conversations)
+        touched_contacts = set(messages.loc[message_ids > last_message_id, 'sender_id'])
+        changed = (activities > last_activity) | conversations['contact_id'].isin(touched_contacts)
+        conversations = conversations[changed]
+        messages = messages[messages['sender_id'].isin(set(conversations['contact_id']) | touched_contacts)]
+    return conversations, messages, incremental
+
+
+def select_from_store(store, last_activity):
+    """
+    Charge les tables nettoyées depuis le store SQLite (au format texte, typées ici
+    comme les fichiers). En mode incrémental, seules les conversations modifiées depuis
+    le watermark, ou dont le contact a des messages pas encore fusionnés, sont lues
+    (avec les messages de leurs contacts).
+
+    Returns:
+        tuple: (conversations, messages, incrémental ou non)
+    """
+    incremental = bool(last_activity)
+    if incremental:
+        conversations = store.conversations_frame(changed_since=last_activity)
+        messages = store.messages_frame(contact_ids=set(conversations['contact_id']) | store.unassigned_contacts())
+    else:
+        conversations = store.conversations_frame()
+        messages = store.messages_frame()
+    conversations = drop_header_rows(to_typed(conversations, CONVERSATIONS_SCHEMA), 'conversation_id')
+    messages = drop_header_rows(to_typed(messages, MESSAGES_SCHEMA), 'message_id')
+    return conversations, messages, incremental
+
+
+def merge_conversations_with_messages(full_refresh=not INCREMENTAL_PIPELINE):
+    """
+    Charge les conversations et les messages (depuis le store SQLite, ou à défaut
+    les fichiers nettoyés), rattache chaque message à la conversation de son
+    contact dont la fenêtre start_time/end_time le contient, puis écrit le
+    résultat en flux dans merged_data (JSONL, ou JSON selon la configuration).
+    Avec le store, la conversation attribuée à chaque message y est enregistrée.
+
+    En mode incrémental, seules les conversations modifiées depuis le watermark,
+    ou dont le contact a reçu de nouveaux messages, sont refusionnées puis mises
+    à jour (upsert) dans le fichier existant.
     """
     print("Début de la fusion des conversations et des messages...")
 
-    # 1. Charger les données des fichiers
-    try:
-        with open(conversations_file_path, 'r', encoding='utf-8') as f:
-            conversations = json.load(f)
+    output_file_path = storage_path(output_file_stem, 'records')
+    watermark = None if full_refresh else load_watermark(output_file_path)
+    last_activity = (watermark or {}).get('last_activity')
+    last_message_id = (watermark or {}).get('last_message_id')
 
-        with open(messages_file_path, 'r', encoding='utf-8') as f:
-            messages = json.load(f)
+    # 1. Charger les conversations et les messages à (re)fusionner
+    store = Store() if store_available('conversations', 'messages') else None
+    try:
+        if store is not None:
+            conversations, messages, incremental = select_from_store(store, last_activity)
+        else:
+            conversations, messages, incremental = select_from_files(last_activity, last_message_id)
 
     except FileNotFoundError as e:
         print(f"Erreur : Un des fichiers n'a pas été trouvé. Veuillez vérifier les chemins. Erreur : {e}")
-        return
+        raise
     except json.JSONDecodeError as e:
         print(f"Erreur de décodage JSON. Le fichier est-il corrompu ? Erreur : {e}")
-        return
-
-    # 2. Ignorer la première ligne qui est une ligne d'en-tête
-    conversations_data = conversations[1:]
-    messages_data = messages[1:]
-
-    # 3. Créer un dictionnaire pour grouper les messages par contact_id.
-    # Ceci est la nouvelle logique de fusion.
-    messages_by_contact_id = {}
-    for message in messages_data:
-        # Nous allons utiliser le sender_id du message comme clé pour le contact.
-        # Cela semble être la seule façon de lier les messages aux contacts.
-        sender_id = message.get('sender_id')
-        if sender_id:
-            if sender_id not in messages_by_contact_id:
-                messages_by_contact_id[sender_id] = []
-            messages_by_contact_id[sender_id].append(message)
-
-    # 4. Fusionner les conversations avec leurs messages correspondants en utilisant contact_id
-    merged_conversations = []
-    for conversation in conversations_data:
-        # Utiliser le contact_id de la conversation pour trouver les messages correspondants
-        contact_id = conversation.get('contact_id')
-        if contact_id and contact_id in messages_by_contact_id:
-            # Ajouter une nouvelle clé 'messages' à l'objet conversation
-            conversation['messages'] = messages_by_contact_id[contact_id]
-        else:
-            conversation['messages'] = []  # Aucun message trouvé pour ce contact_id
-        merged_conversations.append(conversation)
+        raise
 
-    # 5. Sauvegarder le résultat dans un nouveau fichier JSON
+    message_ids = pd.to_numeric(messages['message_id'], errors='coerce')
+    activities = activity_times(conversations)
+
+    # 2. Fusionner par intervalle et sauvegarder le résultat dans merged_data
+    stats = {}
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(merged_conversations, f, indent=4, ensure_ascii=False)
+        conversation_ids = assign_messages(conversations, messages)
+        merged = iter_merged_conversations(conversations, messages, stats, conversation_ids)
+        if incremental:
+            inserted, updated = upsert_records(output_file_path, merged, key='conversation_id')
+            print(f"🔁 Mode incrémental : {inserted} conversations ajoutées, {updated} mises à jour")
+        else:
+            write_records(output_file_path, merged)
+        if store is not None:
+            # Le store est en texte : identifiants reconvertis, '' pour les messages non rattachés
+            store.assign_conversations(messages['message_id'].astype('string'),
+                                       conversation_ids.astype('string').fillna(''))
+
+        save_watermark(output_file_path, {
+            'last_activity': max_value(activities, last_activity),
+            'last_message_id': max_value((int(i) for i in message_ids.dropna()), last_message_id),
+        })
+        print(f"📊 {stats.get('assigned', 0)} messages rattachés à {len(conversations)} conversations, "
+              f"{stats.get('unassigned', 0)} hors de toute fenêtre de conversation")
         print(f"Fusion réussie ! Le fichier a été sauvegardé ici : {output_file_path}")
 
     except Exception as e:
         print(f"Une erreur est survenue lors de l'écriture du fichier. Erreur : {e}")
+        raise
+    finally:
+        if store is not None:
+            store.close()
+
+
+def make_synthetic_export(n_contacts, conversations_per_contact=3, messages_per_conversation=20, seed=42):
+    """
+    Génère un export synthétique (conversations et messages) au format des tables
+    nettoyées, pour mesurer la fusion à grande échelle.
+    """
+    rng = np.random.default_rng(seed)
+    n_conversations = n_contacts * conversations_per_contact
+    contact_ids = np.repeat(np.arange(n_contacts) + 10**8, conversations_per_contact)
+    # Conversations successives d'un même contact, espacées de 30 jours, d'une durée de 1 à 5 jours
+    base = np.datetime64('2024-01-01T00:00:00')
+    starts = base + (np.tile(np.arange(conversations_per_contact), n_contacts) * 30 * 86400
+                     + rng.integers(0, 86400, n_conversations)).astype('timedelta64[s]')
+    ends = starts + rng.integers(86400, 5 * 86400, n_conversations).astype('timedelta64[s]')
+    conversations = pd.DataFrame({
+        'conversation_id': (np.arange(n_conversations) + 10**15).astype(str),
+        'start_time': pd.Series(starts).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'end_time': pd.Series(ends).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'contact_id': contact_ids.astype(str),
+        'last_reply_time': '', 'first_reply_time': '', 'status': 'To follow up',
+    })
+
+    n_messages = n_conversations * messages_per_conversation
+    owner = np.repeat(np.arange(n_conversations), messages_per_conversation)
+    offsets = (rng.random(n_messages) * (ends - starts).astype(np.int64)[owner]).astype('timedelta64[s]')
+    messages = pd.DataFrame({
+        'timestamp': pd.Series(starts[owner] + offsets).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'sender_type': 'contact',
+        'sender_id': contact_ids[owner].astype(str),
+        'message_id': (np.arange(n_messages) + 10**15).astype(str),
+        'message_type': 'text',
+        'text': 'message',
+    }).sample(frac=1, random_state=seed)
+    return conversations, messages
+
+
+def benchmark(scales=(1_000, 10_000, 50_000), output_dir=None):
+    """Mesure le débit de la fusion (messages par seconde) sur des exports synthétiques de taille croissante."""
+    import tempfile
+    import time
+
+    output_dir = output_dir or tempfile.mkdtemp(prefix='merge_benchmark_')
+    for n_contacts in scales:
+        conversations, messages = make_synthetic_export(n_contacts)
+        output_path = os.path.join(output_dir, f'merged_{n_contacts}.jsonl')
+        stats = {}
+        start = time.perf_counter()
+        write_records(output_path, iter_merged_conversations(conversations, messages, stats))
+        elapsed = time.perf_counter() - start
+        print(f"⏱️ {len(conversations):>8} conversations, {len(messages):>9} messages : {elapsed:7.2f}s "
+              f"({len(messages) / elapsed:,.0f} messages/s, {stats['unassigned']} non rattachés)")
 
 
-def run():
+def run(full_refresh=not INCREMENTAL_PIPELINE):
     """Point d'entrée pour la fusion automatique."""
-    merge_conversations_with_messages()
+    merge_conversations_with_messages(full_refresh=full_refresh)
 
 
 # Exécuter la fonction si le script est lancé directement
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fusion des conversations et des messages.")
+    parser.add_argument('--full', action='store_true', help="Tout refusionner, sans tenir compte du watermark.")
+    parser.add_argument('--benchmark', nargs='*', type=int, metavar='N_CONTACTS',
+                        help="Mesurer le débit sur des exports synthétiques (nombre de contacts par palier).")
+    args = parser.parse_args()
+    if args.benchmark is not None:
+        benchmark(args.benchmark or (1_000, 10_000, 50_000))
+    else:
+        run(full_refresh=args.full)
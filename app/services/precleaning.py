@@ -0,0 +1,112 @@
+import re
+import unicodedata
+from collections import Counter
+
+# Textes de remplacement produits par clean_messages.check_payload pour les messages non textuels
+PLACEHOLDERS = {'[Vide]', '[Erreur parsing]', '[Réaction]', '[Message non texte]'}
+ATTACHMENT_PREFIX = '[Pièce jointe]'
+
+# Messages douteux : la conversation est confiée au LLM plutôt que tranchée par les règles
+_SUSPECT_PATTERNS = {
+    'encodage': re.compile(r'Ã|â€|�'),
+    'erreur': re.compile(r'\b(error|erreur|exception|undefined|null|nan|traceback|warning|copyright|suspend\w*)\b',
+                         re.IGNORECASE),
+    'balise': re.compile(r'\[[^\]]*\]|<[a-z/][^>]*>|[{}]', re.IGNORECASE),
+    'lien_seul': re.compile(r'\s*https?://\S+\s*'),
+}
+# En dessous de cette part de lettres et chiffres (hors espaces et emojis), un message est douteux
+MIN_ALNUM_RATIO = 0.5
+
+
+def _is_emoji(char):
+    return unicodedata.category(char) == 'So'
+
+
+def junk_reason(text):
+    """
+    Motif de suppression d'un message manifestement inutilisable, ou None :
+    texte vide, texte de remplacement (erreur de parsing, réaction, pièce jointe...)
+    ou texte fait uniquement de caractères spéciaux ("*", "?*", "...").
+    """
+    if not isinstance(text, str) or not text.strip():
+        return 'vide'
+    text = text.strip()
+    if text in PLACEHOLDERS:
+        return 'remplacement'
+    if text.startswith(ATTACHMENT_PREFIX):
+        return 'piece_jointe'
+    if not any(char.isalnum() or _is_emoji(char) for char in text):
+        return 'caracteres_speciaux'
+    return None
+
+
+def suspect_reason(text):
+    """Motif pour lequel un message conservé reste douteux (à faire juger par le LLM), ou None."""
+    for reason, pattern in _SUSPECT_PATTERNS.items():
+        if (pattern.fullmatch(text) if reason == 'lien_seul' else pattern.search(text)):
+            return reason
+    visible = [char for char in text if not char.isspace() and not _is_emoji(char)]
+    if visible and sum(char.isalnum() for char in visible) / len(visible) < MIN_ALNUM_RATIO:
+        return 'peu_de_lettres'
+    return None
+
+
+class PreCleaningReport:
+    """Comptes du pré-nettoyage : messages supprimés par motif, conversations traitées localement ou confiées au LLM."""
+
+    def __init__(self):
+        self.conversations = 0
+        self.dropped_conversations = 0
+        self.local = 0
+        self.ambiguous = 0
+        self.dropped_messages = Counter()
+        self.suspects = Counter()
+
+    def print_summary(self):
+        dropped = sum(self.dropped_messages.values())
+        details = ", ".join(f"{reason} : {count}" for reason, count in self.dropped_messages.most_common())
+        print(f"🧽 Pré-nettoyage : {dropped} messages supprimés" + (f" ({details})" if details else "")
+              + f", {self.dropped_conversations} conversations vides retirées")
+        suspects = ", ".join(f"{reason} : {count}" for reason, count in self.suspects.most_common())
+        print(f"🧽 {self.local}/{self.conversations} conversations nettoyées localement, "
+              f"{self.ambiguous} confiées au LLM" + (f" (messages douteux : {suspects})" if suspects else ""))
+
+
+def preclean(conversations):
+    """
+    Nettoyage local par règles avant le nettoyage par le LLM : les messages
+    manifestement inutilisables sont supprimés et les conversations restées sans
+    message sont retirées. Seules les conversations contenant un message douteux
+    (voir suspect_reason) sont à envoyer au LLM.
+
+    Returns:
+        tuple: (conversations propres, conversations douteuses, PreCleaningReport)
+    """
+    report = PreCleaningReport()
+    clean, ambiguous = [], []
+    for conversation in conversations:
+        report.conversations += 1
+        messages = []
+        suspect = False
+        for message in conversation.get('messages') or []:
+            text = message.get('text')
+            reason = junk_reason(text)
+            if reason:
+                report.dropped_messages[reason] += 1
+                continue
+            reason = suspect_reason(text.strip())
+            if reason:
+                report.suspects[reason] += 1
+                suspect = True
+            messages.append(message)
+        if not messages:
+            report.dropped_conversations += 1
+            continue
+        conversation = {**conversation, 'messages': messages}
+        if suspect:
+            ambiguous.append(conversation)
+        else:
+            clean.append(conversation)
+    report.local = len(clean)
+    report.ambiguous = len(ambiguous)
+    return clean, ambiguous, report
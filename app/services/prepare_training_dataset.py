@@ -1,38 +1,81 @@
 import json
 import os
+import sys
+from config import INCREMENTAL_PIPELINE
+from app.services.incremental import load_watermark, save_watermark, max_value
+from app.services.merge_all import conversation_activity
+from app.services.storage import find_existing, storage_path, iter_records, write_records, upsert_records
+from app.services.store import Store, store_available
 
 # Définir le chemin de base du projet (FlaskProject)
 base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Définir les chemins d'entrée et de sortie
-input_file_path = os.path.join(base_dir, 'app', 'data', 'processed', 'merged_data.json')
-output_file_path = os.path.join(base_dir, 'app', 'data', 'training', 'training_dataset.json')
+# Définir les chemins d'entrée et de sortie (sans extension : le format dépend de la configuration)
+input_file_stem = os.path.join(base_dir, 'app', 'data', 'processed', 'merged_data')
+output_file_stem = os.path.join(base_dir, 'app', 'data', 'training', 'training_dataset')
 
 
-def prepare_training_dataset():
+def last_activity_of(conversation):
+    """Date la plus récente d'une conversation fusionnée : ses propres dates ou celles de ses messages."""
+    return max_value((message.get('timestamp') for message in conversation.get('messages', [])),
+                     conversation_activity(conversation))
+
+
+def prepare_training_dataset(full_refresh=not INCREMENTAL_PIPELINE):
     """
-    Charge le fichier merged_data.json, filtre les messages pour ne garder que
-    les messages texte, puis sauvegarde le résultat dans training_dataset.json.
+    Charge les conversations fusionnées, filtre les messages pour ne garder que
+    les messages texte, puis sauvegarde le résultat dans training_dataset
+    (JSONL, ou JSON selon la configuration).
+
+    En mode incrémental, seules les conversations actives depuis le watermark
+    sont retraitées et mises à jour (upsert) dans le fichier existant.
     """
     print("Début de la préparation du dataset de formation...")
 
+    input_file_path = find_existing(input_file_stem, 'records') or input_file_stem + '.json'
+    output_file_path = storage_path(output_file_stem, 'records')
+
     # Créer le dossier de destination s'il n'existe pas
     os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 
-    # 1. Charger le fichier merged_data.json
+    watermark = None if full_refresh else load_watermark(output_file_path)
+    last_activity = (watermark or {}).get('last_activity')
+
+    # 1. Charger les conversations fusionnées : depuis le store SQLite (seules celles
+    # actives depuis le watermark sont lues), ou à défaut depuis le fichier merged_data.
+    # Le store n'est utilisé que si la fusion a attribué tous ses messages.
+    store = Store() if store_available('conversations', 'messages') else None
     try:
-        with open(input_file_path, 'r', encoding='utf-8') as f:
-            merged_data = json.load(f)
+        if store is not None and not store.count_unassigned():
+            merged_data = list(store.iter_merged_conversations(since=last_activity))
+            from_store = True
+        else:
+            merged_data = list(iter_records(input_file_path))
+            from_store = False
     except FileNotFoundError as e:
         print(f"Erreur : Le fichier d'entrée '{input_file_path}' n'a pas été trouvé. Erreur : {e}")
-        return
+        raise
     except json.JSONDecodeError as e:
         print(f"Erreur de décodage JSON dans '{input_file_path}'. Le fichier est-il corrompu ? Erreur : {e}")
-        return
+        raise
+    finally:
+        if store is not None:
+            store.close()
+
+    # 2. Sélectionner les conversations à traiter
+    activities = [last_activity_of(conversation) for conversation in merged_data]
+    if last_activity and not from_store:
+        changed = [conv for conv, activity in zip(merged_data, activities) if (activity or '') > last_activity]
+    elif last_activity:
+        # Le store n'a retourné que les conversations actives depuis le watermark
+        changed = list(merged_data)
+    else:
+        changed = merged_data
 
-    # 2. Filtrer les messages pour chaque conversation
+    # 3. Filtrer les messages pour chaque conversation
     training_dataset = []
-    for conversation in merged_data:
+    without_text = []
+    for conversation in changed:
         # Créer une nouvelle liste de messages pour ne contenir que les messages texte
         clean_messages = []
         # Le champ 'messages' est déjà trié par heure, donc nous n'avons pas besoin
@@ -50,21 +93,29 @@ def prepare_training_dataset():
         if clean_messages:
             conversation['messages'] = clean_messages
             training_dataset.append(conversation)
+        else:
+            without_text.append(conversation.get('conversation_id'))
 
-    # 3. Sauvegarder le résultat dans training_dataset.json
+    # 4. Sauvegarder le résultat dans training_dataset
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(training_dataset, f, indent=4, ensure_ascii=False)
+        if changed is merged_data:
+            write_records(output_file_path, training_dataset)
+        else:
+            inserted, updated = upsert_records(output_file_path, training_dataset, key='conversation_id',
+                                               delete_keys=without_text)
+            print(f"🔁 Mode incrémental : {inserted} conversations ajoutées, {updated} mises à jour")
+        save_watermark(output_file_path, {'last_activity': max_value(activities, last_activity)})
         print(f"Préparation réussie ! Le fichier a été sauvegardé ici : {output_file_path}")
     except Exception as e:
         print(f"Une erreur est survenue lors de l'écriture du fichier. Erreur : {e}")
+        raise
 
 
-def run():
+def run(full_refresh=not INCREMENTAL_PIPELINE):
     """Point d'entrée pour la préparation automatique du dataset."""
-    prepare_training_dataset()
+    prepare_training_dataset(full_refresh=full_refresh)
 
 
 # Exécuter la fonction si le script est lancé directement
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    run(full_refresh='--full' in sys.argv)
\ No newline at end of file
@@ -0,0 +1,440 @@
+import os
+import sys
+import json
+import shutil
+import pandas as pd
+from config import TABULAR_STORAGE_FORMAT, NESTED_STORAGE_FORMAT, LEGACY_JSON_EXPORT
+from app.services.incremental import append_json_records
+from app.services.typed_tables import arrow_schema, to_typed, to_text, iter_text_chunks
+
+# Extensions des formats de stockage du pipeline
+EXTENSIONS = {'parquet': '.parquet', 'jsonl': '.jsonl', 'json': '.json'}
+
+# Nombre de lignes par groupe lors de la relecture d'un fichier Parquet
+PARQUET_BATCH_SIZE = 50_000
+
+# Les ajouts incrémentaux à une table Parquet sont écrits dans des fichiers séparés
+# (`<table>.parquet.parts/part-00001.parquet`, ...), relus à la suite du fichier principal.
+# Au-delà de MAX_PARQUET_PARTS, la table est compactée en un seul fichier.
+PARTS_SUFFIX = '.parts'
+MAX_PARQUET_PARTS = 50
+
+# Clé des métadonnées Parquet où sont enregistrés le schéma typé d'une table et la
+# valeur de ses cellules absentes une fois reconvertie en texte (voir table_schema)
+SCHEMA_METADATA_KEY = b'typed_tables'
+
+_warned_missing_pyarrow = False
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def storage_format(kind):
+    """
+    Format de stockage configuré pour un type de données : "table" (contacts,
+    conversations, messages) ou "records" (conversations imbriquées avec leurs messages).
+    Parquet nécessite pyarrow ; sans lui, les tables restent en JSON.
+    """
+    global _warned_missing_pyarrow
+    if kind == 'records':
+        return NESTED_STORAGE_FORMAT
+    if TABULAR_STORAGE_FORMAT == 'parquet' and not parquet_available():
+        if not _warned_missing_pyarrow:
+            print("⚠️ pyarrow n'est pas installé : les tables sont écrites en JSON.")
+            _warned_missing_pyarrow = True
+        return 'json'
+    return TABULAR_STORAGE_FORMAT
+
+
+def storage_path(stem, kind):
+    """Chemin de sortie d'une étape (`stem` sans extension) dans le format configuré."""
+    return stem + EXTENSIONS[storage_format(kind)]
+
+
+def find_existing(stem, kind):
+    """
+    Chemin d'une sortie existante, quel que soit son format : le format configuré
+    est préféré, les autres sont lus en repli (ex. anciens fichiers .json).
+    """
+    preferred = storage_path(stem, kind)
+    candidates = [preferred] + [stem + ext for ext in EXTENSIONS.values() if stem + ext != preferred]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _format_of(path):
+    for name, ext in EXTENSIONS.items():
+        if path.endswith(ext):
+            return name
+    raise ValueError(f"Format de fichier non reconnu : {path}")
+
+
+# --- Tables (Parquet ou JSON) ---------------------------------------------------
+
+def _parts_dir(path):
+    return path + PARTS_SUFFIX
+
+
+def table_files(path):
+    """Fichiers qui composent une table : le fichier principal puis ses parties ajoutées, dans l'ordre."""
+    parts_dir = _parts_dir(path)
+    if not os.path.isdir(parts_dir):
+        return [path]
+    parts = sorted(name for name in os.listdir(parts_dir) if name.endswith(EXTENSIONS['parquet']))
+    return [path] + [os.path.join(parts_dir, name) for name in parts]
+
+
+def table_schema(path):
+    """
+    Schéma typé (voir typed_tables) et valeur des cellules absentes en texte, enregistrés
+    dans les métadonnées d'une table Parquet ; (None, '') pour une table JSON ou ancienne.
+    """
+    if _format_of(path) != 'parquet' or not os.path.exists(path):
+        return None, ''
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(path).metadata or {}
+    if SCHEMA_METADATA_KEY not in metadata:
+        return None, ''
+    saved = json.loads(metadata[SCHEMA_METADATA_KEY])
+    return saved['schema'], saved['missing']
+
+
+class TableWriter:
+    """
+    Écrit une table bloc par bloc : chaque DataFrame devient un groupe de lignes
+    Parquet, ou une portion du tableau JSON. Le fichier final n'apparaît qu'à la
+    fermeture (écriture dans un fichier temporaire puis renommage).
+
+    Avec un `schema` (voir typed_tables), le Parquet garde les types de la table
+    (catégories, dates, identifiants numériques) ; le JSON reste au format texte des
+    sorties nettoyées, les cellules absentes y valant `missing`.
+    """
+
+    def __init__(self, path, schema=None, missing=''):
+        self.path = path
+        self.format = _format_of(path)
+        self.schema = schema
+        self.missing = missing
+        self.rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+        self._schema = None
+        self._file = None
+
+    def __enter__(self):
+        if self.format == 'parquet':
+            # Le writer Parquet est créé au premier bloc, qui fixe le schéma
+            pass
+        else:
+            self._file = open(self._tmp_path, 'w', encoding='utf-8')
+            self._file.write("[\n")
+        return self
+
+    def write(self, df):
+        if df.empty:
+            return
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self.schema is not None:
+                df = to_typed(df, self.schema)
+            if self._writer is None:
+                # Les métadonnées pandas du premier bloc (dtypes nullables, catégories) valent pour toute la table
+                table = pa.Table.from_pandas(df, schema=self._arrow_schema(df), preserve_index=False)
+                self._schema = table.schema.with_metadata({**table.schema.metadata, **self._metadata(df)})
+                self._writer = pq.ParquetWriter(self._tmp_path, self._schema, compression='zstd')
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table.replace_schema_metadata(self._schema.metadata))
+        elif self.schema is not None:
+            # Reconversion en texte par blocs : une table typée complète n'est jamais copiée en texte
+            for text in iter_text_chunks(df, self.schema, missing=self.missing):
+                self.write_serialized(_serialize_records(text))
+        else:
+            self.write_serialized(_serialize_records(df))
+        self.rows += len(df)
+
+    def _arrow_schema(self, df):
+        """Schéma Arrow fixé par le premier bloc : celui de `schema`, sinon celui déduit du DataFrame."""
+        import pyarrow as pa
+
+        inferred = pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+        if self.schema is None:
+            return inferred
+        typed = arrow_schema(self.schema)
+        return pa.schema([typed.field(name) if name in self.schema else inferred.field(name)
+                          for name in inferred.names])
+
+    def _metadata(self, df):
+        if self.schema is None:
+            return {}
+        saved = {'schema': {column: self.schema[column] for column in df.columns if column in self.schema},
+                 'missing': self.missing}
+        return {SCHEMA_METADATA_KEY: json.dumps(saved)}
+
+    def write_serialized(self, records_text):
+        """Ajoute des enregistrements JSON déjà sérialisés (format JSON uniquement)."""
+        if not records_text:
+            return
+        if self._file.tell() > 2:
+            self._file.write(",\n")
+        self._file.write(records_text)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.format == 'parquet':
+            if self._writer is not None:
+                self._writer.close()
+            elif exc_type is None:
+                pd.DataFrame().to_parquet(self._tmp_path, index=False)
+        else:
+            self._file.write("\n]" if self._file.tell() > 2 else "]")
+            self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+            # La table vient d'être réécrite en entier : ses anciennes parties sont périmées
+            shutil.rmtree(_parts_dir(self.path), ignore_errors=True)
+        elif os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        return False
+
+
+def _serialize_records(df):
+    """Enregistrements JSON d'un DataFrame (mise en forme de to_json) sans les crochets du tableau."""
+    return df.to_json(orient='records', indent=2, force_ascii=False).strip()[1:-1].strip('\n')
+
+
+def iter_table_chunks(path, batch_size=PARQUET_BATCH_SIZE, schema=None):
+    """
+    Itère une table par blocs de DataFrames. Le Parquet est relu avec ses types ; le
+    JSON est en texte, sauf avec un `schema` qui le type comme le Parquet.
+    """
+    if _format_of(path) == 'parquet':
+        import pyarrow.parquet as pq
+
+        for file_path in table_files(path):
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_size):
+                yield batch.to_pandas()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            df = pd.DataFrame.from_records(json.load(f))
+        yield to_typed(df, schema) if schema is not None else df
+
+
+def read_table(path, columns=None, schema=None):
+    """
+    Charge une table complète (seules les `columns` demandées sont lues en Parquet).
+    Comme pour iter_table_chunks, un `schema` type aussi une table JSON.
+    """
+    if _format_of(path) == 'parquet':
+        files = table_files(path)
+        frames = [pd.read_parquet(file_path, columns=columns) for file_path in files]
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    with open(path, 'r', encoding='utf-8') as f:
+        df = pd.DataFrame.from_records(json.load(f))
+    df = df[columns] if columns else df
+    return to_typed(df, schema) if schema is not None else df
+
+
+def write_table(path, df, schema=None, missing=''):
+    """
+    Écrit une table : un DataFrame, ou un itérable de blocs écrits l'un après l'autre
+    (voir TableWriter pour `schema` et `missing`).
+    """
+    with TableWriter(path, schema, missing) as writer:
+        for chunk in ([df] if isinstance(df, pd.DataFrame) else df):
+            writer.write(chunk)
+    export_legacy_json(path)
+
+
+def append_table(path, chunks, schema=None, missing=''):
+    """
+    Ajoute des blocs à une table existante sans recopier ce qui est déjà écrit. En JSON,
+    les enregistrements sont ajoutés en fin de fichier ; en Parquet, ils forment une
+    nouvelle partie de la table (voir table_files). Quand les parties deviennent trop
+    nombreuses, la table est compactée en un seul fichier.
+    """
+    if _format_of(path) == 'json':
+        for df in chunks:
+            if schema is not None:
+                df = to_text(df, schema, missing)
+            append_json_records(path, _serialize_records(df) if not df.empty else "")
+        return
+    if schema is None:
+        schema, missing = table_schema(path)
+    files = table_files(path)
+    if len(files) > MAX_PARQUET_PARTS:
+        # Le writer écrit dans un fichier temporaire : l'ancienne table reste lisible jusqu'au renommage
+        with TableWriter(path, schema, missing) as writer:
+            for existing in iter_table_chunks(path):
+                writer.write(existing)
+            for df in chunks:
+                writer.write(df)
+    else:
+        last = os.path.basename(files[-1]) if len(files) > 1 else 'part-00000.parquet'
+        part_path = os.path.join(_parts_dir(path), f"part-{int(last[5:10]) + 1:05d}.parquet")
+        os.makedirs(_parts_dir(path), exist_ok=True)
+        with TableWriter(part_path, schema, missing) as writer:
+            for df in chunks:
+                writer.write(df)
+        if not writer.rows:
+            os.remove(part_path)
+    export_legacy_json(path)
+
+
+def upsert_table(path, df, key, schema=None, missing=''):
+    """
+    Insère ou remplace des lignes d'une table selon la colonne `key`.
+
+    Returns:
+        tuple: (nombre d'insertions, nombre de mises à jour)
+    """
+    if schema is None:
+        schema, missing = table_schema(path)
+    df = df.drop_duplicates(subset=[key], keep='last')
+    existing = read_table(path, schema=schema)
+    if schema is not None:
+        # Clés comparées avec le même type des deux côtés
+        df = to_typed(df, schema)
+    known = set(existing[key]) if key in existing else set()
+    updated = int(df[key].isin(known).sum())
+    merged = pd.concat([existing[~existing[key].isin(set(df[key]))], df], ignore_index=True) if len(existing) else df
+    write_table(path, merged, schema, missing)
+    return len(df) - updated, updated
+
+
+# --- Conversations imbriquées (JSONL ou JSON) -----------------------------------
+
+class RecordWriter:
+    """
+    Écrit des enregistrements un par un : une ligne par enregistrement en JSONL,
+    ou un tableau JSON indenté (ancien format) construit au fil de l'eau.
+    """
+
+    def __init__(self, path, indent=4):
+        self.path = path
+        self.format = _format_of(path)
+        self.indent = indent
+        self.count = 0
+        self._tmp_path = f"{path}.tmp"
+
+    def __enter__(self):
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        if self.format == 'json':
+            self._file.write('[')
+        return self
+
+    def write(self, record):
+        if self.format == 'jsonl':
+            self._file.write(json.dumps(record, ensure_ascii=False))
+            self._file.write('\n')
+        else:
+            text = json.dumps(record, indent=self.indent, ensure_ascii=False)
+            padding = ' ' * self.indent
+            self._file.write((',\n' if self.count else '\n') + padding + text.replace('\n', '\n' + padding))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.format == 'json':
+            self._file.write('\n]' if self.count else ']')
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+        return False
+
+
+def iter_records(path):
+    """
+    Itère les enregistrements d'un fichier JSONL, JSON (tableau) ou Parquet sans tout
+    charger ; les lignes d'une table Parquet typée sont rendues au format texte.
+    """
+    if _format_of(path) == 'parquet':
+        schema, missing = table_schema(path)
+        for df in iter_table_chunks(path):
+            if schema is not None:
+                df = to_text(df, schema, missing)
+            yield from df.astype(object).where(df.notna(), None).to_dict('records')
+        return
+    from app.models.utils import iter_conversations
+    yield from iter_conversations(path)
+
+
+def write_records(path, records, indent=4):
+    with RecordWriter(path, indent=indent) as writer:
+        for record in records:
+            writer.write(record)
+    export_legacy_json(path)
+    return writer.count
+
+
+def upsert_records(path, records, key, delete_keys=(), indent=4):
+    """
+    Insère ou remplace des enregistrements selon `key`, en recopiant le fichier
+    existant en flux : seuls les nouveaux enregistrements sont gardés en mémoire.
+
+    Returns:
+        tuple: (nombre d'insertions, nombre de mises à jour)
+    """
+    pending = {record.get(key): record for record in records}
+    deleted = set(delete_keys)
+    updated = 0
+
+    def merged():
+        nonlocal updated
+        if os.path.exists(path):
+            for record in iter_records(path):
+                record_key = record.get(key)
+                if record_key in deleted:
+                    continue
+                if record_key in pending:
+                    updated += 1
+                    yield pending.pop(record_key)
+                else:
+                    yield record
+        yield from pending.values()
+
+    inserted = len(pending)
+    # Le writer écrit dans un fichier temporaire : l'ancien fichier reste lisible jusqu'au renommage
+    write_records(path, merged(), indent=indent)
+    return inserted - updated, updated
+
+
+# --- Export de compatibilité -----------------------------------------------------
+
+def export_legacy_json(path, output_path=None, force=False):
+    """
+    Exporte une sortie Parquet ou JSONL vers l'ancien format (tableau JSON indenté,
+    même nom en .json), si LEGACY_JSON_EXPORT est activé ou si `force` est vrai.
+    Une table Parquet typée est reconvertie au format texte des anciennes sorties.
+    """
+    if not (LEGACY_JSON_EXPORT or force) or path.endswith('.json'):
+        return None
+    output_path = output_path or os.path.splitext(path)[0] + '.json'
+    if _format_of(path) == 'parquet':
+        schema, missing = table_schema(path)
+        with TableWriter(output_path, schema, missing) as writer:
+            for df in iter_table_chunks(path):
+                writer.write(df)
+    else:
+        with RecordWriter(output_path) as writer:
+            for record in iter_records(path):
+                writer.write(record)
+    return output_path
+
+
+if __name__ == '__main__':
+    # Usage : python -m app.services.storage export <fichier.parquet|.jsonl> [...]
+    if len(sys.argv) < 3 or sys.argv[1] != 'export':
+        print("Usage: python -m app.services.storage export <fichier> [<fichier> ...]")
+        sys.exit(1)
+    for source in sys.argv[2:]:
+        print(f"📤 Export JSON : {export_legacy_json(source, force=True)}")
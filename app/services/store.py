@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import sqlite3
+import pandas as pd
+from config import SQLITE_STORE, SQLITE_STORE_PATH
+
+# Nombre de lignes par executemany lors des insertions en masse
+INSERT_BATCH_SIZE = 10_000
+
+# Nombre de conversations dont les messages sont lus en une requête
+CONVERSATION_BATCH_SIZE = 500
+
+# Tables du store : clé primaire, colonnes ajoutées au schéma issu du nettoyage, index.
+# Dans l'export des messages, sender_id est l'identifiant du contact ; la conversation
+# de chaque message est attribuée par la fusion (merge_all) dans assigned_conversation_id :
+# NULL tant que le message n'a pas été fusionné, '' s'il ne tombe dans aucune conversation.
+TABLES = {
+    'contacts': {
+        'key': 'ContactID',
+        'extra': [],
+        'indexes': {},
+    },
+    'conversations': {
+        'key': 'conversation_id',
+        'extra': [],
+        'indexes': {
+            'idx_conversations_contact': '"contact_id", "start_time"',
+            'idx_conversations_start': '"start_time"',
+        },
+    },
+    'messages': {
+        'key': 'message_id',
+        'extra': ['assigned_conversation_id'],
+        'indexes': {
+            'idx_messages_contact': '"sender_id", "timestamp"',
+            'idx_messages_conversation': '"assigned_conversation_id", "timestamp"',
+            'idx_messages_timestamp': '"timestamp"',
+        },
+    },
+}
+
+# Date d'activité d'une conversation : la plus récente de ses dates (voir merge_all.conversation_activity)
+CONVERSATION_ACTIVITY = ("max(coalesce(start_time, ''), coalesce(end_time, ''), "
+                         "coalesce(last_reply_time, ''), coalesce(first_reply_time, ''))")
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class Store:
+    """
+    Store SQLite des tables nettoyées (contacts, conversations, messages).
+
+    Les étapes de nettoyage y insèrent leurs lignes par lots, dans une transaction ;
+    la fusion, la préparation du dataset de formation et le chatbot l'interrogent
+    via les index (contact, conversation, date) au lieu de relire des fichiers entiers.
+    """
+
+    def __init__(self, path=SQLITE_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Les étapes de nettoyage tournent en parallèle : chacune attend le verrou d'écriture
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    # --- Écriture -------------------------------------------------------------
+
+    def columns(self, table):
+        return [row['name'] for row in self.connection.execute(f"PRAGMA table_info({_quote(table)})")]
+
+    def _ensure_table(self, table, columns):
+        spec = TABLES[table]
+        existing = self.columns(table)
+        if not existing:
+            definitions = ', '.join(f"{_quote(column)} TEXT" for column in columns + spec['extra'])
+            self.connection.execute(
+                f"CREATE TABLE {_quote(table)} ({definitions}, PRIMARY KEY ({_quote(spec['key'])}))"
+            )
+        else:
+            for column in columns:
+                if column not in existing:
+                    self.connection.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(column)} TEXT")
+        for name, expression in spec['indexes'].items():
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {_quote(table)} ({expression})")
+
+    def write(self, table, df, full_refresh=False):
+        """
+        Insère les lignes de `df` (ou les remplace si leur clé existe déjà) dans une
+        seule transaction. Les lignes d'en-tête des exports CSV (clé non numérique)
+        sont ignorées. Avec `full_refresh`, la table est vidée au préalable.
+
+        Returns:
+            int: Nombre de lignes écrites.
+        """
+        key = TABLES[table]['key']
+        df = df[df[key].astype(str).str.fullmatch(r"\d+")]
+        columns = [str(column) for column in df.columns]
+        insert = (f"INSERT OR REPLACE INTO {_quote(table)} ({', '.join(map(_quote, columns))}) "
+                  f"VALUES ({', '.join('?' * len(columns))})")
+        with self.connection:
+            self._ensure_table(table, columns)
+            if full_refresh:
+                self.connection.execute(f"DELETE FROM {_quote(table)}")
+            for start in range(0, len(df), INSERT_BATCH_SIZE):
+                batch = df.iloc[start:start + INSERT_BATCH_SIZE]
+                self.connection.executemany(insert, batch.astype(object).where(batch.notna(), None)
+                                            .itertuples(index=False, name=None))
+        return len(df)
+
+    def clear(self, table):
+        with self.connection:
+            if self.columns(table):
+                self.connection.execute(f"DELETE FROM {_quote(table)}")
+
+    def assign_conversations(self, message_ids, conversation_ids):
+        """Enregistre la conversation attribuée à chaque message par la fusion ('' si aucune)."""
+        pairs = [('' if conversation_id is None or conversation_id != conversation_id else conversation_id, message_id)
+                 for message_id, conversation_id in zip(message_ids, conversation_ids)]
+        with self.connection:
+            for start in range(0, len(pairs), INSERT_BATCH_SIZE):
+                self.connection.executemany(
+                    "UPDATE messages SET assigned_conversation_id = ? WHERE message_id = ?",
+                    pairs[start:start + INSERT_BATCH_SIZE]
+                )
+
+    # --- Lecture --------------------------------------------------------------
+
+    def has_tables(self, *tables):
+        return all(self.columns(table) for table in tables)
+
+    def _frame(self, sql, params=(), drop=()):
+        df = pd.read_sql_query(sql, self.connection, params=params, dtype=object)
+        return df.drop(columns=[column for column in drop if column in df.columns])
+
+    def conversations_frame(self, changed_since=None):
+        """
+        Conversations sous forme de DataFrame, dans l'ordre d'insertion.
+
+        Args:
+            changed_since (str, optional): Ne garder que les conversations actives depuis
+                cette date, ou dont le contact a des messages pas encore fusionnés.
+        """
+        if changed_since is None:
+            return self._frame("SELECT * FROM conversations ORDER BY rowid")
+        return self._frame(
+            f"SELECT * FROM conversations WHERE {CONVERSATION_ACTIVITY} > ? "
+            "OR contact_id IN (SELECT sender_id FROM messages WHERE assigned_conversation_id IS NULL) "
+            "ORDER BY rowid",
+            (changed_since,)
+        )
+
+    def messages_frame(self, contact_ids=None):
+        """Messages (tous, ou ceux des contacts donnés) sous forme de DataFrame, dans l'ordre d'insertion."""
+        drop = TABLES['messages']['extra']
+        if contact_ids is None:
+            return self._frame("SELECT * FROM messages ORDER BY rowid", drop=drop)
+        return self._frame(
+            "SELECT * FROM messages WHERE sender_id IN (SELECT value FROM json_each(?)) ORDER BY rowid",
+            (json.dumps(sorted({str(contact_id) for contact_id in contact_ids})),), drop=drop
+        )
+
+    def unassigned_contacts(self):
+        """Contacts ayant des messages pas encore fusionnés."""
+        return {row[0] for row in self.connection.execute(
+            "SELECT DISTINCT sender_id FROM messages WHERE assigned_conversation_id IS NULL")}
+
+    def count_unassigned(self):
+        return self.connection.execute(
+            "SELECT count(*) FROM messages WHERE assigned_conversation_id IS NULL").fetchone()[0]
+
+    def get_contact(self, contact_id):
+        row = self.connection.execute("SELECT * FROM contacts WHERE ContactID = ?", (str(contact_id),)).fetchone()
+        return dict(row) if row else None
+
+    def conversation_messages(self, conversation_id):
+        """Messages fusionnés dans une conversation, triés par heure."""
+        return [self._message(row) for row in self.connection.execute(
+            "SELECT * FROM messages WHERE assigned_conversation_id = ? ORDER BY timestamp, rowid",
+            (str(conversation_id),))]
+
+    def get_conversation(self, conversation_id, with_messages=True):
+        row = self.connection.execute("SELECT * FROM conversations WHERE conversation_id = ?",
+                                      (str(conversation_id),)).fetchone()
+        if row is None:
+            return None
+        conversation = dict(row)
+        if with_messages:
+            conversation['messages'] = self.conversation_messages(conversation_id)
+        return conversation
+
+    def contact_conversations(self, contact_id):
+        """Conversations d'un contact, de la plus ancienne à la plus récente."""
+        return [dict(row) for row in self.connection.execute(
+            "SELECT * FROM conversations WHERE contact_id = ? ORDER BY start_time", (str(contact_id),))]
+
+    def contact_messages(self, contact_id, limit=None, direction=None):
+        """
+        Derniers messages échangés avec un contact (du plus ancien au plus récent).
+
+        Args:
+            direction (str, optional): "incoming" pour les seuls messages envoyés par le contact.
+        """
+        sql = "SELECT * FROM messages WHERE sender_id = ?"
+        params = [str(contact_id)]
+        if direction:
+            sql += " AND direction = ?"
+            params.append(direction)
+        sql += " ORDER BY timestamp DESC, rowid DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [self._message(row) for row in self.connection.execute(sql, params)][::-1]
+
+    def iter_merged_conversations(self, since=None):
+        """
+        Itère les conversations avec leurs messages fusionnés (triés par heure), un
+        lot de conversations à la fois.
+
+        Args:
+            since (str, optional): Ne garder que les conversations actives depuis cette
+                date (leurs propres dates ou celles de leurs messages).
+        """
+        sql = "SELECT * FROM conversations"
+        params = ()
+        if since is not None:
+            sql += (f" WHERE {CONVERSATION_ACTIVITY} > ? OR conversation_id IN "
+                    "(SELECT assigned_conversation_id FROM messages WHERE timestamp > ?)")
+            params = (since, since)
+        cursor = self.connection.execute(sql + " ORDER BY rowid", params)
+        while True:
+            rows = cursor.fetchmany(CONVERSATION_BATCH_SIZE)
+            if not rows:
+                return
+            conversations = [dict(row) for row in rows]
+            messages = {conversation['conversation_id']: [] for conversation in conversations}
+            for row in self.connection.execute(
+                "SELECT * FROM messages WHERE assigned_conversation_id IN (SELECT value FROM json_each(?)) "
+                "ORDER BY assigned_conversation_id, timestamp, rowid",
+                (json.dumps(list(messages)),)
+            ):
+                messages[row['assigned_conversation_id']].append(self._message(row))
+            for conversation in conversations:
+                conversation['messages'] = messages[conversation['conversation_id']]
+                yield conversation
+
+    @staticmethod
+    def _message(row):
+        message = dict(row)
+        for column in TABLES['messages']['extra']:
+            message.pop(column, None)
+        return message
+
+    def stats(self):
+        return {table: self.connection.execute(f"SELECT count(*) FROM {_quote(table)}").fetchone()[0]
+                for table in TABLES if self.columns(table)}
+
+
+def store_available(*tables):
+    """Vrai si le store est activé, existe et contient les tables demandées."""
+    if not SQLITE_STORE or not os.path.exists(SQLITE_STORE_PATH):
+        return False
+    with Store() as store:
+        return store.has_tables(*tables)
+
+
+def write_to_store(table, df, full_refresh=False, backfill=None):
+    """
+    Alimente le store depuis une étape de nettoyage (sans effet s'il est désactivé).
+
+    Args:
+        df: DataFrame, ou itérable de blocs (chacun écrit dans sa transaction).
+        backfill (optional): Table complète (DataFrame ou itérable de blocs), écrite
+            à la place de `df` si le store ne contient pas encore cette table
+            (première exécution incrémentale après l'activation du store).
+    """
+    if not SQLITE_STORE:
+        return 0
+    with Store() as store:
+        if not full_refresh and backfill is not None and not store.has_tables(table):
+            df, full_refresh = backfill, True
+        written = 0
+        for chunk in ([df] if isinstance(df, pd.DataFrame) else df):
+            written += store.write(table, chunk, full_refresh=full_refresh and not written)
+        if full_refresh and not written:
+            store.clear(table)
+        return written
+
+
+if __name__ == '__main__':
+    # Usage : python -m app.services.store [contact <id> | conversation <id>]
+    with Store() as store:
+        if len(sys.argv) == 3 and sys.argv[1] == 'contact':
+            print(json.dumps({'contact': store.get_contact(sys.argv[2]),
+                              'conversations': store.contact_conversations(sys.argv[2])},
+                             indent=2, ensure_ascii=False))
+        elif len(sys.argv) == 3 and sys.argv[1] == 'conversation':
+            print(json.dumps(store.get_conversation(sys.argv[2]), indent=2, ensure_ascii=False))
+        else:
+            for table, count in store.stats().items():
+                print(f"📊 {table} : {count} lignes")
@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+import pandas as pd
+from pandas.api.types import union_categoricals, is_datetime64_dtype, is_timedelta64_dtype
+
+# Format des dates dans les exports CRM (et dans les sorties nettoyées)
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Nombre de lignes du CSV lues puis typées à la fois : seul un bloc existe en texte
+READ_CHUNK_SIZE = 100_000
+
+# Nombre de lignes reconverties en texte à la fois pour l'écriture des sorties
+TEXT_CHUNK_SIZE = 50_000
+
+# Schémas des exports : colonne → type. Les types sont "text", "category" (peu de
+# valeurs distinctes), "datetime", "duration" (HH:MM:SS), "id" (identifiant numérique)
+# ou un dtype pandas nullable ("Int16", "Int32", "Float64").
+CONTACTS_SCHEMA = {
+    'ContactID': 'id',
+    'FirstName': 'text',
+    'LastName': 'text',
+    'PhoneNumber': 'text',
+    'Email': 'text',
+    'Country': 'category',
+    'Language': 'category',
+    'Tags': 'category',
+    'Status': 'category',
+    'Lifecycle': 'category',
+    'Assignee': 'category',
+    'LastInteractionTime': 'datetime',
+    'DateTimeCreated': 'datetime',
+    'Channels': 'category',
+    'Lead Source': 'category',
+    'State': 'category',
+    'Moyenne Bac': 'Float64',
+    'Last Degree': 'category',
+    'Graduation Year': 'Int16',
+    'Current Degree': 'category',
+    'Degree Sought': 'category',
+    'Degree Choice': 'category',
+    'Scholarship': 'Int16',
+    'University': 'category',
+    'Qualifying URL': 'text',
+    'Eligible': 'category',
+    'Qualifying Score': 'Float64',
+}
+
+CONVERSATIONS_SCHEMA = {
+    'conversation_id': 'id',
+    'start_time': 'datetime',
+    'end_time': 'datetime',
+    'contact_id': 'id',
+    'assignee_id': 'category',
+    'incoming_messages': 'Int32',
+    'outgoing_messages': 'Int32',
+    'last_reply_time': 'datetime',
+    'status': 'category',
+    'summary': 'text',
+    'last_assignee_id': 'category',
+    # La colonne de l'export est une durée, mais le pipeline l'a toujours traitée
+    # comme une date (merge_all l'inclut dans la date d'activité) : elle reste une date
+    'first_reply_time': 'datetime',
+    'total_handling_time': 'duration',
+    'recipient_id': 'category',
+}
+
+# Messages nettoyés (colonnes de clean_messages.COLUMNS, plus le texte extrait du payload)
+MESSAGES_SCHEMA = {
+    'timestamp': 'datetime',
+    'conversation_id': 'id',
+    'sender_type': 'category',
+    'sender_id': 'id',
+    'message_id': 'id',
+    'message_type': 'category',
+    'direction': 'category',
+    'payload': 'text',
+    'recipient_id': 'category',
+    'text': 'text',
+}
+
+_DTYPES = {'id': 'Int64', 'Int16': 'Int16', 'Int32': 'Int32', 'Float64': 'Float64'}
+
+
+def _to_typed(series, kind):
+    # Une colonne déjà typée (relue depuis Parquet) est gardée telle quelle
+    if kind == 'text':
+        return series
+    if kind == 'category':
+        return series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    if kind == 'datetime':
+        if is_datetime64_dtype(series.dtype):
+            return series
+        return pd.to_datetime(series, format=DATETIME_FORMAT, errors='coerce')
+    if kind == 'duration':
+        return series if is_timedelta64_dtype(series.dtype) else pd.to_timedelta(series, errors='coerce')
+    if str(series.dtype) == _DTYPES[kind]:
+        return series
+    numbers = pd.to_numeric(series, errors='coerce')
+    return numbers.astype(_DTYPES[kind])
+
+
+def to_typed(df, schema):
+    """Convertit une table texte (JSON, store SQLite) selon `schema` ; les autres colonnes sont gardées."""
+    return pd.DataFrame({column: _to_typed(df[column], schema[column]) if column in schema else df[column]
+                         for column in df.columns}, index=df.index)
+
+
+def arrow_schema(schema):
+    """Schéma Arrow (Parquet) d'une table typée : catégories en dictionnaires, dates en timestamps."""
+    import pyarrow as pa
+
+    types = {
+        'text': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'datetime': pa.timestamp('ns'),
+        'duration': pa.duration('ns'),
+        'id': pa.int64(),
+        'Int16': pa.int16(),
+        'Int32': pa.int32(),
+        'Float64': pa.float64(),
+    }
+    return pa.schema([(column, types[kind]) for column, kind in schema.items()])
+
+
+def columns_of(schema, *kinds):
+    return [column for column, kind in schema.items() if kind in kinds]
+
+
+def read_typed_csv(path, schema, key=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Lit un export CSV par blocs et convertit chaque bloc selon `schema` :
+    catégories, dates, durées et entiers nullables au lieu de chaînes.
+
+    Les lignes dont la clé `key` n'est pas un identifiant numérique (lignes
+    d'en-tête de l'export) sont écartées.
+
+    Returns:
+        tuple: (DataFrame typé, statistiques : mémoire en texte et typée, durée)
+    """
+    start = time.perf_counter()
+    columns = list(schema)
+    parts = []
+    text_bytes = 0
+    for chunk in pd.read_csv(path, header=None, dtype=str, usecols=range(len(columns)), chunksize=chunk_size):
+        chunk.columns = columns
+        text_bytes += int(chunk.memory_usage(deep=True).sum())
+        typed = pd.DataFrame({column: _to_typed(chunk[column], kind) for column, kind in schema.items()})
+        if key is not None:
+            typed = typed[typed[key].notna()]
+        parts.append(typed)
+
+    if not parts:
+        df = pd.DataFrame({column: _to_typed(pd.Series([], dtype=str), kind) for column, kind in schema.items()})
+    else:
+        # Mêmes catégories dans tous les blocs, pour que la concaténation les conserve
+        for column in columns_of(schema, 'category'):
+            categories = union_categoricals([part[column] for part in parts]).categories
+            for part in parts:
+                part[column] = part[column].cat.set_categories(categories)
+        df = pd.concat(parts, ignore_index=True)
+
+    stats = {
+        'rows': len(df),
+        'text_bytes': text_bytes,
+        'typed_bytes': int(df.memory_usage(deep=True).sum()),
+        'seconds': time.perf_counter() - start,
+    }
+    return df, stats
+
+
+def _format_duration(series):
+    seconds = series.dt.total_seconds()
+    valid = seconds.notna()
+    total = seconds[valid].astype('int64')
+    text = pd.Series('', index=series.index, dtype=object)
+    text[valid] = ((total // 3600).astype(str).str.zfill(2) + ':' + (total % 3600 // 60).astype(str).str.zfill(2)
+                   + ':' + (total % 60).astype(str).str.zfill(2))
+    return text
+
+
+def _to_text(series, kind, missing=''):
+    series = _to_typed(series, kind)
+    if kind == 'datetime':
+        text = series.dt.strftime(DATETIME_FORMAT)
+    elif kind == 'duration':
+        text = _format_duration(series)
+        return text if missing == '' else text.where(series.notna(), missing)
+    elif kind == 'Float64':
+        # 14.0 → "14", 12.52 → "12.52", comme dans l'export
+        text = series.astype('string').str.replace(r'\.0$', '', regex=True)
+    elif kind == 'text':
+        text = series
+    else:
+        text = series.astype('string')
+    return text.astype(object).where(text.notna(), missing)
+
+
+def to_text(df, schema, missing=''):
+    """
+    Reconvertit une table typée au format texte des sorties nettoyées. Les valeurs absentes
+    deviennent `missing` ('' pour les exports CRM, None pour les messages) ; les colonnes
+    hors de `schema` sont gardées telles quelles.
+    """
+    return pd.DataFrame({column: _to_text(df[column], schema[column], missing) if column in schema else df[column]
+                         for column in df.columns}, index=df.index)
+
+
+def iter_text_chunks(df, schema, chunk_size=TEXT_CHUNK_SIZE, missing=''):
+    """Reconvertit une table typée en texte bloc par bloc, pour l'écrire sans copie complète."""
+    for start in range(0, len(df), chunk_size):
+        yield to_text(df.iloc[start:start + chunk_size], schema, missing)
+
+
+def max_datetime(df, columns):
+    """Date la plus récente des colonnes données, au format des sorties (ou None)."""
+    latest = df[columns].max().max() if len(df) else pd.NaT
+    return None if pd.isna(latest) else latest.strftime(DATETIME_FORMAT)
+
+
+def print_memory_report(stats):
+    print(f"📊 Mémoire : {stats['text_bytes'] / 1e6:.2f} Mo en texte → {stats['typed_bytes'] / 1e6:.2f} Mo typé "
+          f"({stats['rows']} lignes lues et typées en {stats['seconds']:.2f} s)")
+
+
+# --- Comparaison avec le chargement en texte ---------------------------------------
+
+def load_text_csv(path, schema):
+    """Chargement historique : toutes les colonnes en chaînes, dates converties puis remises en texte."""
+    df = pd.read_csv(path, header=None, dtype=str)
+    df = df.iloc[:, :len(schema)]
+    df.columns = list(schema)
+    df.fillna('', inplace=True)
+    for column in columns_of(schema, 'datetime'):
+        df[column] = pd.to_datetime(df[column], format=DATETIME_FORMAT, errors='coerce')
+        df[column] = df[column].astype(str).replace('NaT', '')
+    return df
+
+
+def _measure(loader, *args):
+    """Charge une table et mesure durée, hausse du pic de mémoire résidente et taille de la table."""
+    from app.models.profiling import StageProfiler
+
+    profiler = StageProfiler()
+    with profiler.stage('load'):
+        df = loader(*args)
+        if isinstance(df, tuple):
+            df = df[0]
+    stage = profiler.stages['load']
+    return stage['wall_time_s'], stage['rss_increase_mb'], int(df.memory_usage(deep=True).sum())
+
+
+def _measure_in_subprocess(loader, *args):
+    # Un processus par chargement : le pic de mémoire résidente est celui du processus entier
+    with multiprocessing.get_context('fork').Pool(1) as pool:
+        return pool.apply(_measure, (loader, *args))
+
+
+def benchmark(scale=10):
+    """
+    Compare le chargement en texte et le chargement typé des contacts et des
+    conversations, sur les exports répliqués `scale` fois : durée, hausse du pic
+    de mémoire résidente et mémoire de la table obtenue.
+    """
+    from config import CONTACTS_CSV, CONVERSATIONS_CSV
+
+    for name, path, schema, key in [('contacts', CONTACTS_CSV, CONTACTS_SCHEMA, 'ContactID'),
+                                    ('conversations', CONVERSATIONS_CSV, CONVERSATIONS_SCHEMA, 'conversation_id')]:
+        with open(path, 'r', encoding='utf-8') as f:
+            header, body = f.readline(), f.read()
+        if not body.endswith('\n'):
+            body += '\n'
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as f:
+            f.write(header + body * scale)
+            scaled_path = f.name
+        try:
+            size = os.path.getsize(scaled_path) / 1e6
+            print(f"⏱️ {name} ×{scale} ({size:.1f} Mo de CSV)")
+            for label, loader, args in [('texte', load_text_csv, (scaled_path, schema)),
+                                        ('typé', read_typed_csv, (scaled_path, schema, key))]:
+                seconds, peak, table = _measure_in_subprocess(loader, *args)
+                print(f"   {label:<6} {seconds:6.2f} s   pic +{peak:8.1f} Mo   table {table / 1e6:8.1f} Mo")
+        finally:
+            os.remove(scaled_path)
+
+
+if __name__ == '__main__':
+    # Usage : python -m app.services.typed_tables [facteur]
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,97 @@
+import os
+import json
+from collections import Counter
+from datetime import datetime
+import pandas as pd
+
+
+def validate(df, checks):
+    """
+    Applique des contrôles vectorisés à un bloc : `checks` associe un motif de
+    rejet à un masque booléen (vrai = ligne invalide) calculé sur des colonnes entières.
+
+    Returns:
+        tuple: (lignes valides, lignes rejetées avec la colonne "reasons")
+    """
+    if not checks:
+        return df, df.iloc[:0].assign(reasons=[])
+    masks = pd.DataFrame({reason: mask.fillna(True).astype(bool) for reason, mask in checks.items()}, index=df.index)
+    invalid = masks.any(axis=1)
+    if not invalid.any():
+        return df, df.iloc[:0].assign(reasons=[])
+    failed = masks[invalid]
+    reasons = [[reason for reason, bad in zip(failed.columns, row) if bad] for row in failed.itertuples(index=False)]
+    return df[~invalid], df[invalid].assign(reasons=reasons)
+
+
+class Quarantine:
+    """
+    Fichier de quarantaine d'une étape : une ligne JSONL par ligne rejetée (position
+    dans le fichier source, motifs, valeurs brutes), réécrit à chaque exécution.
+    Les comptes de l'exécution (lignes lues, rejetées, par motif) sont ajoutés à
+    l'historique `<nom>_runs.jsonl`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.history_path = os.path.splitext(path)[0] + '_runs.jsonl'
+        self.rows = 0
+        self.rejected = 0
+        self.reasons = Counter()
+        self._tmp_path = f"{path}.tmp"
+
+    def __enter__(self):
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        return self
+
+    def count(self, rows):
+        """Compte des lignes lues (valides ou non)."""
+        self.rows += rows
+
+    def write(self, rejected, columns=None):
+        """Ajoute les lignes rejetées d'un bloc (DataFrame avec la colonne "reasons")."""
+        if rejected.empty:
+            return
+        columns = columns or [column for column in rejected.columns if column != 'reasons']
+        values = rejected[columns].astype(object).where(rejected[columns].notna(), None)
+        for row, reasons, fields in zip(rejected.index, rejected['reasons'], values.itertuples(index=False)):
+            record = {'row': int(row), 'reasons': reasons, 'fields': dict(zip(map(str, columns), fields))}
+            self._file.write(json.dumps(record, ensure_ascii=False))
+            self._file.write('\n')
+            self.reasons.update(reasons)
+        self.rejected += len(rejected)
+
+    def write_skipped(self, line, reason, detail):
+        """Ajoute une ligne écartée par le lecteur CSV lui-même (seul son numéro de ligne est connu)."""
+        record = {'line': line, 'reasons': [reason], 'detail': detail}
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write('\n')
+        self.reasons[reason] += 1
+        self.rejected += 1
+        self.rows += 1
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'reasons': dict(self.reasons.most_common()),
+        }
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is not None:
+            os.remove(self._tmp_path)
+            return False
+        os.replace(self._tmp_path, self.path)
+        with open(self.history_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'run_at': datetime.now().isoformat(timespec='seconds'), **self.summary()},
+                               ensure_ascii=False))
+            f.write('\n')
+        return False
+
+    def print_summary(self):
+        if not self.rejected:
+            print(f"🛡️ Validation : {self.rows} lignes lues, aucune rejetée")
+            return
+        details = ", ".join(f"{reason} : {count}" for reason, count in self.reasons.most_common())
+        print(f"🛡️ Validation : {self.rejected}/{self.rows} lignes mises en quarantaine ({details}) → {self.path}")
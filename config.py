@@ -4,9 +4,9 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Dossiers données
-DATA_RAW = os.path.join(BASE_DIR, 'data', 'raw')
-DATA_PROCESSED = os.path.join(BASE_DIR, 'data', 'processed')
-DATA_TRAINING = os.path.join(BASE_DIR, 'data', 'training')
+DATA_RAW = os.path.join(BASE_DIR, 'app', 'data', 'raw')
+DATA_PROCESSED = os.path.join(BASE_DIR, 'app', 'data', 'processed')
+DATA_TRAINING = os.path.join(BASE_DIR, 'app', 'data', 'training')
 
 os.makedirs(DATA_RAW, exist_ok=True)
 os.makedirs(DATA_PROCESSED, exist_ok=True)
@@ -16,16 +16,101 @@ CONTACTS_CSV = os.path.join(DATA_RAW, "contacts.csv")
 CONVERSATIONS_CSV = os.path.join(DATA_RAW, "conversations-csv.csv")
 MESSAGES_CSV = os.path.join(DATA_RAW, "messages-csv.csv")
 
-# Flags auto nettoyage / fusion
+# Exécutions incrémentales : chaque étape (nettoyage, fusion, préparation) garde un watermark
+# et ne traite que les nouvelles lignes. Passer à False (ou --full) pour tout retraiter.
+INCREMENTAL_PIPELINE = True
+
+# Format des fichiers intermédiaires du pipeline
+TABULAR_STORAGE_FORMAT = "parquet"  # contacts, conversations, messages : "parquet" (pyarrow) ou "json"
+NESTED_STORAGE_FORMAT = "jsonl"     # conversations fusionnées et dataset de formation : "jsonl" ou "json"
+LEGACY_JSON_EXPORT = False          # Si True, chaque sortie est aussi exportée dans l'ancien format JSON indenté
+
+# Store SQLite indexé (contacts, conversations, messages), alimenté par les étapes de nettoyage
+# et interrogé par la fusion, la préparation du dataset de formation et le chatbot
+SQLITE_STORE = True
+SQLITE_STORE_PATH = os.path.join(DATA_PROCESSED, 'store.sqlite')
+CHATBOT_CONTEXT_MESSAGES = 10  # Derniers messages du contact joints au message courant pour classer l'intention
+
+# Flags auto nettoyage / fusion (exécutés en arrière-plan par un job au démarrage)
 AUTO_CLEAN_DATA = False   # Si True, nettoie les CSV au démarrage
 AUTO_MERGE_DATA = False   # Si True, merge les JSON nettoyés au démarrage
 AUTO_PREPARE_TRAINING_DATASET = False # Si True, prépare le dataset de formation
 AUTO_GENERATE_SYNTHETIC_DATA = False # Nouveau flag pour la génération de données synthétiques
 AUTO_AUGMENT_SYNTHETIC_DATA = False # Nouveau flag pour l'enrichissement
 AUTO_CLEAN_TRAINING_DATA = False # Si True, nettoie le training_dataset.json
+AUTO_DEDUPLICATE_TRAINING_DATA = False # Si True, retire les quasi-doublons des conversations synthétiques
+
+# Déduplication MinHash/LSH : "remove" supprime les doublons, "flag" les marque seulement
+DEDUPLICATION_MODE = "remove"
+DEDUPLICATION_THRESHOLD = 0.8 # Similarité de Jaccard minimale entre deux doublons
+
+# Client LLM (API Gemini generateContent) partagé par la génération, l'augmentation et le nettoyage
+# du dataset. La clé API est lue dans la variable d'environnement LLM_API_KEY_ENV ; LLM_BASE_URL
+# peut pointer vers un serveur local de test.
+LLM_API_KEY_ENV = 'GEMINI_API_KEY'
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta')
+LLM_MODEL = 'gemini-2.5-flash-preview-05-20'
+LLM_CONCURRENCY = 4           # Requêtes en vol simultanément
+LLM_REQUESTS_PER_MINUTE = 30  # Débit maximal (token bucket)
+LLM_BURST = 4                 # Requêtes pouvant partir d'un coup avant la limitation
+LLM_MAX_RETRIES = 5
+LLM_TIMEOUT = 300             # Secondes par requête
+
+# Nettoyage du dataset de formation : les messages manifestement inutilisables (erreurs de
+# parsing, réactions, pièces jointes, caractères spéciaux seuls) sont supprimés par des règles
+# locales et seules les conversations douteuses sont envoyées au LLM
+LLM_PRECLEANING = True
+# Lots du nettoyage par le LLM : conversations regroupées selon leur nombre de tokens estimé.
+# Le budget par requête augmente tant que les réponses arrivent en moins de LLM_TARGET_LATENCY
+# secondes et est divisé par deux après un dépassement de délai ou une réponse tronquée.
+LLM_BATCH_TOKENS = 4000       # Budget initial (tokens des conversations d'un lot)
+LLM_BATCH_TOKENS_MIN = 500
+LLM_BATCH_TOKENS_MAX = 30000
+LLM_TARGET_LATENCY = 60       # Secondes
+
+# Augmentation du dataset synthétique : "mixed" demande des lots mélangés à partir d'exemples
+# tirés au hasard ; "balanced" ne génère que les statuts sous-représentés dans le dataset
+# synthétique, un statut par lot et à partir d'exemples réels de ce statut (ou --balanced)
+AUGMENTATION_MODE = "mixed"
+AUGMENTATION_TARGET = None  # Distribution visée en mode "balanced" ({statut: poids}), None pour des parts égales
+
+# Cache disque des réponses du LLM (SQLite), indexé par le hash de (URL du modèle, prompt,
+# configuration de génération) : une requête identique n'est envoyée qu'une fois.
+# Modes : "readwrite" (lecture puis envoi des requêtes absentes), "replay" (hors ligne :
+# une requête absente du cache échoue sans appel réseau, pour la CI), "off".
+LLM_CACHE_MODE = os.environ.get('LLM_CACHE_MODE', 'readwrite')
+LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join(DATA_PROCESSED, 'llm_cache.sqlite'))
+LLM_CACHE_MAX_MB = 500  # Au-delà, les réponses les moins récemment utilisées sont évincées
+# Graine des tirages d'exemples (random.sample) de la génération et de l'augmentation :
+# fixée, elle rend les prompts identiques d'une exécution à l'autre, donc rejouables depuis le cache
+LLM_SAMPLE_SEED = int(os.environ['LLM_SAMPLE_SEED']) if os.environ.get('LLM_SAMPLE_SEED') else None
+
+# Jobs en arrière-plan (nettoyage, augmentation, entraînement) : état et journaux persistés
+JOBS_DIR = os.path.join(BASE_DIR, 'app', 'data', 'jobs')
+JOB_WORKERS = 1        # Nombre de jobs exécutés simultanément
+JOB_MAX_PENDING = 10   # Nombre maximal de jobs en attente ou en cours
+
+# Pipeline (DAG des étapes) : les étapes indépendantes tournent en parallèle et une étape
+# dont les entrées n'ont pas changé (hash du contenu) n'est pas relancée
+PIPELINE_DIR = os.path.join(BASE_DIR, 'app', 'data', 'pipeline')
+PIPELINE_WORKERS = 3   # Nombre d'étapes exécutées simultanément
 
 # Activation ou désactivation de l'entraînement automatique au démarrage
 AUTO_TRAIN_RANDOM_FOREST = False
 AUTO_TRAIN_NAIVE_BAYES = False
 AUTO_TRAIN_LOGISTIC_REGRESSION = False
-AUTO_TRAIN_LSTM = False
\ No newline at end of file
+AUTO_TRAIN_LSTM = False
+
+# Réentraînement incrémental de la Régression Logistique (vocabulaire et coefficients précédents)
+LOGISTIC_REGRESSION_WARM_START = False
+# Le vocabulaire TF-IDF reste figé au dernier entraînement à froid : au-delà de cette part de
+# termes nouveaux dans le vocabulaire qu'un entraînement à froid choisirait, on repart à froid
+LOGISTIC_REGRESSION_MAX_NEW_TERMS = 0.1
+
+# Validation croisée stratifiée en k folds après chaque entraînement (0 pour désactiver)
+TRAINING_CV_FOLDS = 0
+TRAINING_CV_CACHE_MAX_MB = 200  # Cache des vectorisations par fold (saved/.cache), entrées les plus anciennes évincées
+
+# Normalisation des textes avant la vectorisation (arabizi tunisien, accents, lettres répétées).
+# Le réglage est enregistré dans le bundle de chaque modèle et réappliqué en production.
+TEXT_NORMALIZATION = True
@@ -0,0 +1,171 @@
+import time
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from app.services import llm_client
+from app.services.llm_client import LLMClient, TokenBucket
+
+OK_RESPONSE = {'candidates': [{'content': {'parts': [{'text': '[]'}]}, 'finishReason': 'STOP'}]}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Les nouvelles tentatives partent immédiatement : le test mesure leur nombre, pas l'attente
+    monkeypatch.setattr(llm_client, 'backoff_delay', lambda attempt: 0.0)
+
+
+def serve(handler, work):
+    """Démarre un serveur generateContent local avec `handler`, puis exécute `work(base_url)`."""
+    async def _run():
+        app = web.Application()
+        app.router.add_post('/models/{model}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            return await work(f"http://127.0.0.1:{port}")
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(_run())
+
+
+def client(base_url, **options):
+    return LLMClient(model='test', base_url=base_url, api_key='test', **options)
+
+
+def test_retries_server_errors_then_succeeds():
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        if len(hits) < 3:
+            return web.Response(status=503, text="surcharge")
+        return web.json_response(OK_RESPONSE)
+
+    async def work(base_url):
+        async with client(base_url, max_retries=5) as llm:
+            return await llm.request({'contents': []})
+
+    result, call = serve(handler, work)
+    assert result == OK_RESPONSE
+    assert call['ok'] and call['status'] == 200 and call['attempts'] == 3
+    assert call['error'] is None
+    assert len(hits) == 3
+
+
+def test_does_not_retry_client_errors():
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        return web.Response(status=400, text="requête invalide")
+
+    async def work(base_url):
+        async with client(base_url, max_retries=5) as llm:
+            return await llm.request({'contents': []})
+
+    result, call = serve(handler, work)
+    assert result is None
+    assert call['error_kind'] == 'http' and call['attempts'] == 1
+    assert len(hits) == 1
+
+
+def test_gives_up_after_max_retries():
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        return web.Response(status=429, text="quota")
+
+    async def work(base_url):
+        async with client(base_url, max_retries=3) as llm:
+            return await llm.request({'contents': []})
+
+    result, call = serve(handler, work)
+    assert result is None
+    assert call['status'] == 429 and call['attempts'] == 3
+    assert len(hits) == 3
+
+
+class FakeClock:
+    """Horloge des tests du limiteur : attendre fait avancer le temps, sans délai réel."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.waits = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.waits.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_limits_request_rate():
+    clock = FakeClock()
+
+    async def work():
+        # 4 requêtes par seconde, 2 d'avance : les 4 suivantes attendent chacune 0,25 s
+        bucket = TokenBucket(rate=4, capacity=2, clock=clock, sleep=clock.sleep)
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+
+    asyncio.run(work())
+    assert clock.waits == [0.25] * 4
+    assert clock.now == 1.0
+
+
+def test_token_bucket_refills_while_idle():
+    clock = FakeClock()
+
+    async def work():
+        bucket = TokenBucket(rate=4, capacity=2, clock=clock, sleep=clock.sleep)
+        await bucket.acquire(2)
+        # Au repos, les jetons reviennent sans dépasser la capacité
+        clock.now += 5
+        await bucket.acquire(2)
+        await bucket.acquire()
+
+    asyncio.run(work())
+    assert clock.waits == [0.25]
+
+
+def test_timeout_is_not_retried_when_disabled():
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        await asyncio.sleep(1)
+        return web.json_response(OK_RESPONSE)
+
+    async def work(base_url):
+        async with client(base_url, timeout=0.2, max_retries=3, retry_on_timeout=False) as llm:
+            return await llm.request({'contents': []})
+
+    result, call = serve(handler, work)
+    assert result is None
+    assert call['error_kind'] == 'timeout' and call['attempts'] == 1
+    assert len(hits) == 1
+
+
+def test_timeout_is_retried_by_default():
+    hits = []
+
+    async def handler(request):
+        hits.append(time.monotonic())
+        if len(hits) == 1:
+            await asyncio.sleep(1)
+        return web.json_response(OK_RESPONSE)
+
+    async def work(base_url):
+        async with client(base_url, timeout=0.2, max_retries=3) as llm:
+            return await llm.request({'contents': []})
+
+    result, call = serve(handler, work)
+    assert result == OK_RESPONSE
+    assert call['ok'] and call['attempts'] == 2
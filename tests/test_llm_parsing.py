@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from app.services.llm_client import LLMError
+from app.services.llm_parsing import iter_array, array_parser
+
+CONVERSATIONS_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {'type': 'OBJECT', 'required': ['conversation_id', 'messages'],
+              'properties': {'conversation_id': {'type': 'STRING'}, 'messages': {'type': 'ARRAY'}}},
+}
+
+
+def response(text, finish_reason='STOP'):
+    return {'candidates': [{'content': {'parts': [{'text': text}]}, 'finishReason': finish_reason}]}
+
+
+def test_complete_array():
+    assert list(iter_array('[{"a": 1}, {"a": 2}]')) == [('item', {'a': 1}), ('item', {'a': 2}), ('end', True)]
+
+
+def test_stray_closing_brace_is_skipped():
+    text = '[{"conversation_id":"1","messages":[]}}, {"conversation_id":"2","messages":[]}]'
+    assert list(iter_array(text)) == [
+        ('item', {'conversation_id': '1', 'messages': []}),
+        ('damaged', '}'),
+        ('item', {'conversation_id': '2', 'messages': []}),
+        ('end', True),
+    ]
+
+
+def test_stray_closing_bracket_ends_the_array():
+    # Un ] isolé ferme le tableau : ce qui suit n'est pas lu
+    assert list(iter_array('[{"a": 1}], {"a": 2}]')) == [('item', {'a': 1}), ('end', True)]
+
+
+def test_stray_brackets_without_items_terminate():
+    assert list(iter_array('[}}}')) == [('damaged', '}'), ('damaged', '}'), ('damaged', '}'), ('end', False)]
+
+
+def test_truncated_array():
+    events = list(iter_array('```json\n[{"a": 1}, {"a": 2}, {"a": '))
+    assert events == [('item', {'a': 1}), ('item', {'a': 2}), ('damaged', '{"a": '), ('end', False)]
+
+
+def test_array_parser_salvages_valid_items():
+    parse = array_parser(CONVERSATIONS_SCHEMA, key='conversation_id')
+    text = '[{"conversation_id":"1","messages":[]}}, {"conversation_id":"2"}, {"conversation_id":"3","messages":[]}]'
+    salvaged = parse(response(text))
+    assert [item['conversation_id'] for item in salvaged.items] == ['1', '3']
+    assert salvaged.rejected == 2
+    assert salvaged.rejected_keys == ['2']
+    assert not salvaged.complete
+
+
+def test_array_parser_without_items_raises():
+    parse = array_parser(CONVERSATIONS_SCHEMA)
+    with pytest.raises(LLMError):
+        parse(response(json.dumps({'conversation_id': '1'})))